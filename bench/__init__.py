@@ -0,0 +1,5 @@
+"""
+Бенчмарки pyhass_mqtt и zont на локальных заглушках (см. bench.fakes).
+Запуск: python -m bench [--quick] [--only SUITE ...] [--output FILE]
+Результаты выводятся в JSON, чтобы их можно было сравнивать между коммитами.
+"""
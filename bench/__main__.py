@@ -0,0 +1,610 @@
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing as t
+import paho.mqtt.client as mqtt
+import pydantic
+import pyhass_mqtt
+from pyhass_mqtt import models
+import zont
+from . import payloads
+from .fakes import BrokerStub, FakeClient, NullClient, ZontStub
+
+
+class BenchSensor(pyhass_mqtt.Entity):
+    def __init__(self, id_: str) -> None:
+        super().__init__(id_, model_cls=models.Sensor)
+        self.model.name = f'Bench sensor {id_}'
+        self.model.device_class = pyhass_mqtt.enums.SensorDeviceClass.temperature
+        self.model.unit_of_measurement = '°C'
+        self.value = 21.5
+
+    def get_state(self) -> str:
+        return str(self.value)
+
+
+class BenchCompactSensor(pyhass_mqtt.Entity):
+    """
+    То же, что BenchSensor, но со __slots__ и общей моделью-шаблоном (см. models.ModelView).
+    """
+    template = models.Sensor(device_class=pyhass_mqtt.enums.SensorDeviceClass.temperature,
+                             unit_of_measurement='°C')
+    __slots__ = ('value',)
+
+    def __init__(self, id_: str) -> None:
+        super().__init__(id_, model_cls=self.template.view)
+        self.model.name = f'Bench sensor {id_}'
+        self.value = 21.5
+
+    def get_state(self) -> str:
+        return str(self.value)
+
+
+class BenchSwitch(pyhass_mqtt.Entity):
+    def __init__(self, id_: str) -> None:
+        super().__init__(id_, model_cls=models.Switch)
+        self.model.name = f'Bench switch {id_}'
+        self.model.state_on = 'ON'
+        self.model.state_off = 'OFF'
+        self.model.payload_on = 'ON'
+        self.state = False
+
+    def set_node(self, node: t.Optional[pyhass_mqtt.Node]) -> None:
+        super().set_node(node)
+        self.model.command_topic = self.command_topic('command') if node else None
+
+    def command_handlers(self) -> dict[str, t.Callable]:
+        return {'command': self.on_command}
+
+    def on_command(self, client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+        self.state = msg.payload == b'ON'
+        self.publish_state()
+
+    def get_state(self) -> str:
+        return self.model.state_on if self.state else self.model.state_off
+
+
+class BenchCompactSwitch(BenchSwitch):
+    """
+    BenchSwitch с общей моделью-шаблоном, как entities.Relay
+    """
+    template = models.Switch(state_on='ON', state_off='OFF', payload_on='ON')
+    __slots__ = ('state',)
+
+    def __init__(self, id_: str) -> None:
+        pyhass_mqtt.Entity.__init__(self, id_, model_cls=self.template.view)
+        self.model.name = f'Bench switch {id_}'
+        self.state = False
+
+
+class BenchBytesSwitch(BenchSwitch):
+    """
+    BenchSwitch, который отдает готовые bytes (см. Entity.get_state_bytes())
+    """
+    def get_state_bytes(self) -> bytes:
+        return b'ON' if self.state else b'OFF'
+
+
+class LegacyPublish:
+    """
+    Прежний путь Entity.publish_state(): топик и параметры публикации читаются из модели, payload кодируется
+    на каждую публикацию. Для сравнения в bench_hot_publish()
+    """
+    def publish_state(self, force: bool = False) -> bool:
+        if self.node is None:
+            raise RuntimeError('Cannot publish state of entity without node')
+        if not self.node.connected:
+            self.node.dirty.add(self.id)
+            return False
+        payload = self.get_state()
+        if not self.accept_payload(payload, force):
+            return False
+        self.node.publish(
+            self.model.state_topic,
+            payload.encode(self.model.encoding),
+            self.model.qos,
+            self.model.retain
+        )
+        return True
+
+
+class LegacySwitch(LegacyPublish, BenchSwitch):
+    pass
+
+
+class LegacyCompactSwitch(LegacyPublish, BenchCompactSwitch):
+    __slots__ = ()
+
+
+class LegacyCompactSensor(LegacyPublish, BenchCompactSensor):
+    __slots__ = ()
+
+
+class BenchAsyncSensor(pyhass_mqtt.AsyncEntity, BenchSensor):
+    pass
+
+
+def make_entities(count: int, cls: type = None) -> list[pyhass_mqtt.Entity]:
+    if cls is not None:
+        return [cls(f'e{i}') for i in range(count)]
+    return [BenchSwitch(f'e{i}') if i % 4 == 0 else BenchSensor(f'e{i}') for i in range(count)]
+
+
+def make_node(client: t.Any = None, **kwargs: t.Any) -> pyhass_mqtt.Node:
+    return pyhass_mqtt.Node('BENCH', client or FakeClient(record=False), models.Device(name='Bench'), **kwargs)
+
+
+def measure(fn: t.Callable[..., t.Any], repeat: int, setup: t.Callable[[], t.Any] | None = None,
+            number: int = 1) -> dict[str, float]:
+    """
+    Выполнить repeat замеров по number вызовов fn (перед каждым замером - setup, его время не считается,
+    результат setup передается в fn).
+
+    :return: Минимальное, медианное и среднее время одного вызова, секунды
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        started = time.perf_counter()
+        if setup is None:
+            for _ in range(number):
+                fn()
+        else:
+            for _ in range(number):
+                fn(arg)
+        times.append((time.perf_counter() - started) / number)
+    return {'min': min(times), 'median': statistics.median(times), 'mean': statistics.fmean(times)}
+
+
+def bench_add_entity(sizes: list[int], repeat: int) -> dict:
+    result = {}
+    for size in sizes:
+        def one_by_one(objs: list) -> None:
+            node = make_node()
+            for obj in objs:
+                node.add_entity(obj)
+
+        def bulk(objs: list) -> None:
+            make_node().add_entities(objs)
+
+        for name, fn in (('add_entity', one_by_one), ('add_entities', bulk)):
+            timing = measure(fn, repeat, lambda: make_entities(size))
+            timing['entities_per_second'] = size / timing['median']
+            result[f'{name}[{size}]'] = timing
+    return result
+
+
+def bench_publish_state_all(sizes: list[int], repeat: int) -> dict:
+    result = {}
+    for size in sizes:
+        node = make_node()
+        node.add_entities(make_entities(size))
+        timing = measure(node.publish_state_all, repeat)
+        timing['publishes_per_second'] = size / timing['median']
+        result[f'publish_state_all[{size}]'] = timing
+
+        for obj in node.entities.values():
+            obj.publish_policy = pyhass_mqtt.PublishPolicy(deadband=0.2)
+        result[f'publish_state_all_unchanged_policy[{size}]'] = measure(node.publish_state_all, repeat)
+
+        # Все сущности в одной StateGroup: один JSON-документ за цикл вместо size сообщений
+        client = FakeClient(record=False)
+        node = make_node(client)
+        group = pyhass_mqtt.StateGroup(node)
+        objs = make_entities(size)
+        for obj in objs:
+            group.add(obj)
+        node.add_entities(objs)
+        count = client.publish_count
+        timing = measure(lambda: node.publish_state_all(force=True), repeat)
+        timing['messages_per_cycle'] = (client.publish_count - count) / repeat
+        result[f'publish_state_all_grouped[{size}]'] = timing
+    return result
+
+
+def bench_hot_publish(count: int, repeat: int) -> dict:
+    """
+    Накладные расходы одного publish_state() на стороне Python (с NullClient вместо сети): count публикаций
+    по кругу в 100 сущностей, прежний путь против текущего. cpu_share_at_10k_per_second - доля одного ядра,
+    которую съедают 10000 публикаций в секунду.
+    """
+    def toggle(obj: pyhass_mqtt.Entity) -> None:
+        obj.state = not obj.state
+
+    def shift(obj: pyhass_mqtt.Entity) -> None:
+        obj.value += 1
+
+    cases = {
+        'switch_legacy': (LegacySwitch, toggle),
+        'switch': (BenchSwitch, toggle),
+        'switch_bytes': (BenchBytesSwitch, toggle),
+        'compact_switch_legacy': (LegacyCompactSwitch, toggle),
+        'compact_switch': (BenchCompactSwitch, toggle),
+        'compact_sensor_legacy': (LegacyCompactSensor, shift),
+        'compact_sensor': (BenchCompactSensor, shift),
+    }
+    result = {}
+    for name, (cls, change) in cases.items():
+        node = make_node(NullClient())
+        objs = make_entities(100, cls)
+        node.add_entities(objs)
+
+        def run() -> None:
+            for i in range(count):
+                obj = objs[i % 100]
+                change(obj)
+                obj.publish_state()
+
+        timing = measure(run, repeat)
+        per_publish = timing['median'] / count
+        result[f'{name}[{count}]'] = {
+            'microseconds_per_publish': per_publish * 1e6,
+            'cpu_share_at_10k_per_second': per_publish * 10000,
+        }
+    return result
+
+
+def bench_discovery(repeat: int) -> dict:
+    result = {}
+    device = models.Device(name='Bench', identifiers=['BENCH'], manufacturer='Bench', model='Bench')
+    for cls in (models.Sensor, models.BinarySensor, models.Switch, models.Number, models.Light, models.Fan,
+                models.WaterHeater):
+        model = cls(unique_id='bench', name='Bench', state_topic='bench/state', device=device)
+
+        def cold() -> None:
+            model.invalidate_discovery()
+            model.discovery_payload()
+
+        result[f'{cls.__name__}.cold'] = measure(cold, repeat, number=1000)
+        encodes = models.Model.discovery_encodes
+        result[f'{cls.__name__}.cached'] = measure(model.discovery_payload, repeat, number=1000)
+        result[f'{cls.__name__}.cached']['encodes'] = models.Model.discovery_encodes - encodes
+        result[f'{cls.__name__}.bytes'] = len(model.discovery_payload())
+    return result
+
+
+def bench_command_dispatch(sizes: list[int], repeat: int) -> dict:
+    result = {}
+    for size in sizes:
+        client = FakeClient(record=False)
+        node = make_node(client)
+        node.add_entities(make_entities(size, BenchSwitch))
+        topics = [f'BENCH/e{i}/command' for i in range(0, size, max(1, size // 100))]
+        msgs = []
+        for topic in topics:
+            msg = mqtt.MQTTMessage(topic=topic.encode())
+            msg.payload = b'ON'
+            msgs.append(msg)
+        dispatch = client.callbacks['BENCH/+/command']
+
+        def run() -> None:
+            for msg in msgs:
+                dispatch(client, None, msg)
+
+        timing = measure(run, repeat, number=10)
+        result[f'dispatch[{size}]'] = {k: v / len(msgs) for k, v in timing.items()}
+
+        # С CommandExecutor сетевой поток только ставит команду в очередь
+        client = FakeClient(record=False)
+        executor = pyhass_mqtt.CommandExecutor()
+        node = make_node(client, executor=executor)
+        node.add_entities(make_entities(size, BenchSwitch))
+        dispatch = client.callbacks['BENCH/+/command']
+        timing = measure(run, repeat, number=10)
+        executor.stop()
+        result[f'dispatch_executor[{size}]'] = {k: v / len(msgs) for k, v in timing.items()}
+        result[f'dispatch_executor[{size}]'].update(executor.stats())
+    return result
+
+
+def bench_memory(sizes: list[int]) -> dict:
+    """
+    Память на сущность (tracemalloc): обычная сущность с полной моделью против сущности со __slots__
+    и моделью-шаблоном. Отдельно - сразу после создания и после добавления в ноду (с discovery и состоянием).
+    """
+    result = {}
+    for size in sizes:
+        for name, cls in (('full_model', BenchSensor), ('compact', BenchCompactSensor)):
+            gc.collect()
+            tracemalloc.start()
+            try:
+                node = make_node()
+                before = tracemalloc.get_traced_memory()[0]
+                objs = make_entities(size, cls)
+                created = tracemalloc.get_traced_memory()[0]
+                node.add_entities(objs)
+                added = tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+            result[f'{name}[{size}]'] = {
+                'bytes_per_entity_created': (created - before) / size,
+                'bytes_per_entity_added': (added - before) / size,
+                'total_mib': (added - before) / 2 ** 20,
+            }
+            del node, objs
+    return result
+
+
+def bench_restart(sizes: list[int]) -> dict:
+    """
+    Перезапуск ноды при retained discovery на брокере: сколько discovery публикуется без сверки
+    и со сверкой (add_entities(reconcile=True)), когда одна сущность изменилась, а одна исчезла.
+    """
+    result = {}
+    for size in sizes:
+        retained: dict[str, bytes] = {}
+        make_node(FakeClient(retained=retained), retain_discovery=True).add_entities(make_entities(size))
+        for reconcile in (False, True):
+            broker = dict(retained)
+            client = FakeClient(retained=broker)
+            objs = make_entities(size)[:-1]
+            objs[0].model.name = 'Renamed'
+            started = time.perf_counter()
+            make_node(client, retain_discovery=True).add_entities(objs, reconcile=reconcile)
+            result[f'{"reconcile" if reconcile else "plain"}[{size}]'] = {
+                'seconds': time.perf_counter() - started,
+                'discovery_publishes': sum(1 for topic, *_ in client.published if topic.endswith('/config')),
+                'retained_configs': sum(1 for topic in broker if topic.endswith('/config')),
+            }
+    return result
+
+
+def zont_tree(sensors: int, extra: int = 0, renamed: int | None = None) -> list[zont.models.Device]:
+    thermometers = [zont.models.Thermometer(uuid=f't{i}', name='Renamed' if i == renamed else f'Sensor {i}',
+                                            last_value=20 + i % 10) for i in range(sensors + extra)]
+    return [zont.models.Device(id=1, serial='bench', name='Controller', thermometers=thermometers)]
+
+
+def bench_reconcile(sizes: list[int]) -> dict:
+    """
+    Сверка дерева устройств ZONT с сущностями ноды (Reconciler): сколько discovery публикуется и сколько
+    времени уходит на первую сверку, повторную без изменений, добавление одного датчика и переименование одного.
+    """
+    def sources(devices: list[zont.models.Device]) -> dict[str, zont.models.Thermometer]:
+        return {f'z{device.id}_{th.uuid}': th for device in devices for th in device.thermometers}
+
+    def factory(key: str, source: zont.models.Thermometer) -> pyhass_mqtt.Entity:
+        obj = BenchCompactSensor(key)
+        obj.model.name = source.name
+        return obj
+
+    def configure(obj: pyhass_mqtt.Entity, source: zont.models.Thermometer) -> None:
+        obj.model.name = source.name
+
+    def feed(obj: pyhass_mqtt.Entity, source: zont.models.Thermometer) -> None:
+        obj.value = source.last_value
+
+    result = {}
+    for size in sizes:
+        client = FakeClient()
+        reconciler = pyhass_mqtt.Reconciler(make_node(client), factory, lambda source: source.name, configure, feed)
+        steps = [('initial', zont_tree(size)), ('unchanged', zont_tree(size)), ('add_one', zont_tree(size, 1)),
+                 ('rename_one', zont_tree(size, 1, renamed=0))]
+        for name, devices in steps:
+            client.published.clear()
+            started = time.perf_counter()
+            changes = reconciler.reconcile(sources(devices), publish_state=True)
+            result[f'{name}[{size}]'] = {
+                'seconds': time.perf_counter() - started,
+                'discovery_publishes': sum(1 for topic, *_ in client.published if topic.endswith('/config')),
+                'changes': repr(changes),
+            }
+    return result
+
+
+def bench_outbox(publishes: int, topics: int) -> dict:
+    """
+    Обрыв связи с брокером: publishes публикаций состояний в topics сущностей без соединения.
+    Прирост памяти процесса (tracemalloc) и число сообщений после подключения: очередь paho-клиента
+    (все, что накопилось) против Outbox (кольцо 4 МБ на диске, в каждый топик только последнее значение).
+    """
+    class RC:
+        is_failure = False
+
+    result = {}
+    for mode in ('paho_queue', 'outbox'):
+        with tempfile.TemporaryDirectory() as tmp:
+            outbox = None
+            if mode == 'outbox':
+                outbox = pyhass_mqtt.Outbox(os.path.join(tmp, 'outbox'), size=4 * 1024 * 1024, rate=0, jitter=0)
+            client = FakeClient()
+            node = make_node(client, outbox=outbox)
+            objs = make_entities(topics, BenchCompactSensor)
+            node.add_entities(objs)
+            if outbox is not None:
+                node._on_disconnect(client, None, None, RC, None)
+            client.published.clear()
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            started = time.perf_counter()
+            for i in range(publishes):
+                obj = objs[i % topics]
+                obj.value = i
+                # Без outbox нода публикует в клиент, а тот без соединения копит все в своей очереди:
+                # FakeClient.published играет роль этой очереди
+                obj.publish_state()
+            seconds = time.perf_counter() - started
+            grown = tracemalloc.get_traced_memory()[0] - before
+            tracemalloc.stop()
+            if outbox is not None:
+                client.published.clear()
+                node._on_connect(client, None, None, RC, None)
+                outbox._thread.join()
+                outbox.close()
+            result[f'{mode}[{publishes}]'] = {
+                'seconds_per_publish': seconds / publishes,
+                'memory_growth_bytes': grown,
+                'messages_after_reconnect': len(client.published),
+            }
+    return result
+
+
+def bench_zont(repeat: int) -> dict:
+    result = {}
+    stub = ZontStub(payloads.devices())
+    try:
+        api = zont.API('bench', url=stub.url)
+        api.authenticate('bench', 'bench')
+        result['request.ok'] = measure(lambda: api.request('ping', {}), repeat * 10)
+        result['request.devices_dict'] = measure(lambda: api.request('devices', {}), repeat * 5)
+        result['request.devices_typed'] = measure(lambda: api.devices(), repeat * 5)
+        result['request.devices_list_only'] = measure(lambda: api.devices(full=False), repeat * 5)
+
+        cached = zont.API('bench', url=stub.url, cache=zont.ResponseCache())
+        cached.authenticate('bench', 'bench')
+        cached.request('devices', {})
+        result['request.devices_cached'] = measure(lambda: cached.request('devices', {}), repeat, number=1000)
+
+        # Разбор записанного ответа без сети: json.loads + model_validate (так разбирает API.request())
+        # против TypeAdapter.validate_json из байтов за один проход
+        content = json.dumps({'ok': True, 'devices': stub.devices}).encode()
+        full = pydantic.TypeAdapter(zont.models.DevicesResponse)
+        brief = pydantic.TypeAdapter(zont.models.DeviceListResponse)
+        result['parse.json_loads'] = measure(lambda: json.loads(content), repeat * 5)
+        result['parse.dict_then_models'] = measure(
+            lambda: zont.models.DevicesResponse.model_validate(json.loads(content)), repeat * 5)
+        result['parse.dict_then_list_only'] = measure(
+            lambda: zont.models.DeviceListResponse.model_validate(json.loads(content)), repeat * 5)
+        result['parse.validate_json_full'] = measure(lambda: full.validate_json(content), repeat * 5)
+        result['parse.validate_json_list_only'] = measure(lambda: brief.validate_json(content), repeat * 5)
+        result['parse.bytes'] = len(content)
+    finally:
+        stub.close()
+    return result
+
+
+def bench_zont_batch(count: int) -> dict:
+    """
+    count команд записи в два устройства ZONT (заглушка с задержкой 50 мс): по одному вызову API
+    на команду против WriteBatcher без склейки и со склейкой команд устройства в один вызов.
+    """
+    result = {}
+    stub = ZontStub(latency=0.05)
+    try:
+        api = zont.API('bench', url=stub.url)
+        api.authenticate('bench', 'bench')
+        commands = [('update_device', {'device_id': i % 2, f'field{i}': i}) for i in range(count)]
+
+        started = time.perf_counter()
+        for method, data in commands:
+            api.request(method, data)
+        result['direct'] = {'seconds': time.perf_counter() - started, 'http_calls': stub.calls['update_device']}
+
+        # Без склейки (по умолчанию) команды устройства идут по очереди, разные устройства - параллельно.
+        # Склейку update_device включаем явно: в этом бенче поля команд независимы
+        for name, merge in (('batched_unmerged', None), ('batched', {'update_device': zont.merge_fields})):
+            stub.calls.clear()
+            batcher = zont.WriteBatcher(api, window=0.05, merge=merge)
+            started = time.perf_counter()
+            futures = [batcher.submit(method, data) for method, data in commands]
+            for future in futures:
+                future.result()
+            result[name] = {'seconds': time.perf_counter() - started, 'http_calls': stub.calls['update_device']}
+            batcher.close()
+    finally:
+        stub.close()
+    for value in result.values():
+        value['commands'] = count
+    return result
+
+
+def bench_async_vs_threaded(count: int) -> dict:
+    """
+    Публикация count состояний с QoS 1 с ожиданием всех PUBACK: Node на потоке loop_start() против AsyncNode.
+    """
+    result = {}
+    broker = BrokerStub()
+    try:
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id='bench-threaded')
+        client.max_inflight_messages_set(100)
+        client.connect('127.0.0.1', broker.port)
+        client.loop_start()
+        node = make_node(client)
+        objs = make_entities(count, BenchSensor)
+        for obj in objs:
+            obj.model.qos = 1
+        node.add_entities(objs).wait(30)
+        started = time.perf_counter()
+        node.publish_state_all().wait(60)
+        result['threaded'] = {'seconds': time.perf_counter() - started, 'messages': count}
+        client.disconnect()
+        client.loop_stop()
+
+        async def run_async() -> float:
+            client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id='bench-async')
+            client.max_inflight_messages_set(100)
+            node = pyhass_mqtt.AsyncNode('BENCH', client, models.Device(name='Bench'))
+            await node.connect('127.0.0.1', broker.port)
+            objs = make_entities(count, BenchAsyncSensor)
+            for obj in objs:
+                obj.model.qos = 1
+            await node.add_entities_async(objs)
+            started = time.perf_counter()
+            await node.publish_state_all_async()
+            elapsed = time.perf_counter() - started
+            await node.disconnect()
+            return elapsed
+
+        result['async'] = {'seconds': asyncio.run(run_async()), 'messages': count}
+    finally:
+        broker.close()
+    for value in result.values():
+        value['messages_per_second'] = value['messages'] / value['seconds']
+    return result
+
+
+SUITES: dict[str, t.Callable[[bool], dict]] = {
+    'add_entity': lambda quick: bench_add_entity([100, 1000] if quick else [100, 1000, 10000], 3 if quick else 5),
+    'publish_state_all': lambda quick: bench_publish_state_all([100, 1000] if quick else [100, 1000, 10000],
+                                                               3 if quick else 10),
+    'hot_publish': lambda quick: bench_hot_publish(10000, 3 if quick else 10),
+    'discovery': lambda quick: bench_discovery(3 if quick else 10),
+    'command_dispatch': lambda quick: bench_command_dispatch([100, 1000] if quick else [100, 1000, 10000],
+                                                             3 if quick else 10),
+    'memory': lambda quick: bench_memory([5000] if quick else [50000]),
+    'restart': lambda quick: bench_restart([100, 1000] if quick else [100, 1000, 10000]),
+    'reconcile': lambda quick: bench_reconcile([500] if quick else [500, 5000]),
+    'outbox': lambda quick: bench_outbox(20000 if quick else 200000, 1000),
+    'zont': lambda quick: bench_zont(3 if quick else 10),
+    'zont_batch': lambda quick: bench_zont_batch(20 if quick else 100),
+    'async_vs_threaded': lambda quick: bench_async_vs_threaded(500 if quick else 5000),
+}
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m bench', description=__doc__)
+    parser.add_argument('--quick', action='store_true', help='меньше размеров и повторов')
+    parser.add_argument('--only', nargs='+', choices=sorted(SUITES), help='запустить только эти наборы')
+    parser.add_argument('--output', help='записать JSON в файл вместо stdout')
+    args = parser.parse_args(argv)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': args.quick,
+        'results': {},
+    }
+    for name in args.only or SUITES:
+        print(f'running {name}...', file=sys.stderr)
+        report['results'][name] = SUITES[name](args.quick)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
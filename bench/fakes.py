@@ -0,0 +1,229 @@
+import asyncio
+import json
+import struct
+import threading
+import time
+import typing as t
+import http.server
+import paho.mqtt.client as mqtt
+
+
+__all__ = [
+    'FakeClient',
+    'NullClient',
+    'ZontStub',
+    'BrokerStub',
+]
+
+
+class FakeClient:
+    """
+    Подделка paho.mqtt.client.Client, работающая в процессе: ничего не шлет по сети, а запоминает
+    публикации и подписки. Публикации сразу считаются подтвержденными.
+    Retained-публикации хранятся в retained (можно передать общий словарь, как у брокера) и доставляются
+    при подписке, как это делает брокер.
+    """
+    max_inflight_messages = 20
+
+    def __init__(self, record: bool = True, retained: dict[str, bytes] | None = None) -> None:
+        """
+        :param record: Запоминать публикации (иначе только считать)
+        :param retained: Хранилище retained-сообщений
+        """
+        self.record = record
+        self.retained = {} if retained is None else retained
+        self.published: list[tuple[str, bytes, int, bool]] = []
+        self.publish_count = 0
+        self.subscribe_calls: list[t.Any] = []
+        self.unsubscribe_calls: list[t.Any] = []
+        self.callbacks: dict[str, t.Callable] = {}
+        self._mid = 0
+
+    def publish(self, topic: str, payload: bytes = b'', qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        self._mid += 1
+        self.publish_count += 1
+        if self.record:
+            self.published.append((topic, payload, qos, retain))
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+        info = mqtt.MQTTMessageInfo(self._mid)
+        info._published = True
+        return info
+
+    def subscribe(self, topic: t.Any, qos: int = 0, *args: t.Any, **kwargs: t.Any) -> tuple[int, int]:
+        self.subscribe_calls.append(topic)
+        self._mid += 1
+        subs = [topic] if isinstance(topic, str) else [sub for sub, *_ in topic]
+        for retained_topic, payload in list(self.retained.items()):
+            if any(mqtt.topic_matches_sub(sub, retained_topic) for sub in subs):
+                self.deliver(retained_topic, payload, retain=True)
+        return mqtt.MQTT_ERR_SUCCESS, self._mid
+
+    def unsubscribe(self, topic: t.Any, *args: t.Any, **kwargs: t.Any) -> tuple[int, int]:
+        self.unsubscribe_calls.append(topic)
+        self._mid += 1
+        return mqtt.MQTT_ERR_SUCCESS, self._mid
+
+    def will_set(self, topic: str, payload: t.Any = None, qos: int = 0, retain: bool = False,
+                 *args: t.Any, **kwargs: t.Any) -> None:
+        self.will = (topic, payload, qos, retain)
+
+    def message_callback_add(self, sub: str, callback: t.Callable) -> None:
+        self.callbacks[sub] = callback
+
+    def message_callback_remove(self, sub: str) -> None:
+        self.callbacks.pop(sub, None)
+
+    def deliver(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        """
+        Доставить входящее сообщение так, как это сделал бы paho: в коллбек, чей фильтр подходит под топик.
+        """
+        msg = mqtt.MQTTMessage(topic=topic.encode())
+        msg.payload = payload
+        msg.retain = retain
+        for sub, callback in self.callbacks.items():
+            if mqtt.topic_matches_sub(sub, topic):
+                callback(self, None, msg)
+                return
+
+
+class NullClient(FakeClient):
+    """
+    FakeClient, который ничего не запоминает и на каждую публикацию возвращает один и тот же
+    MQTTMessageInfo: в замерах остаются только расходы самой библиотеки.
+    """
+    def __init__(self) -> None:
+        super().__init__(record=False)
+        self._info = mqtt.MQTTMessageInfo(0)
+        self._info._published = True
+
+    def publish(self, topic: str, payload: bytes = b'', qos: int = 0, retain: bool = False) -> mqtt.MQTTMessageInfo:
+        self.publish_count += 1
+        return self._info
+
+
+class ZontStub:
+    """
+    Локальная заглушка ZONT API на http.server. Отвечает на get_authtoken и devices,
+    на остальные методы - {"ok": true}. Считает запросы по методам.
+    """
+    def __init__(self, devices: list[dict] | None = None, latency: float = 0.0) -> None:
+        """
+        :param devices: Что отдавать в ответе devices
+        :param latency: Искусственная задержка ответа, секунды
+        """
+        self.devices = devices or []
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self.bodies: list[tuple[str, t.Any]] = []
+        self._devices_body = json.dumps({'ok': True, 'devices': self.devices}).encode()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Ответ уходит одним сегментом, иначе keep-alive упирается в Nagle + delayed ACK
+            wbufsize = 65536
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get('Content-Length', 0))
+                body = self.rfile.read(length)
+                method = self.path.rsplit('/', 1)[-1]
+                stub.calls[method] = stub.calls.get(method, 0) + 1
+                stub.bodies.append((method, json.loads(body) if body else None))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if method == 'get_authtoken':
+                    out = b'{"ok": true, "token": "stub-token"}'
+                elif method == 'devices':
+                    out = stub._devices_body
+                else:
+                    out = b'{"ok": true}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args: t.Any) -> None:
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='zont-stub', daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server.server_port}/api'
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BrokerStub:
+    """
+    Минимальная заглушка MQTT 3.1.1 брокера на asyncio: принимает CONNECT, SUBSCRIBE, PUBLISH, PINGREQ
+    и отвечает CONNACK, SUBACK, PUBACK, PINGRESP. Сообщения никому не пересылает.
+    Работает в собственном потоке со своим event loop.
+    """
+    def __init__(self) -> None:
+        self.publishes = 0
+        self._started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+        self._server: asyncio.Server | None = None
+        threading.Thread(target=self._run, name='broker-stub', daemon=True).start()
+        self._started.wait()
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, '127.0.0.1', 0))
+        self._started.set()
+        self._loop.run_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = await reader.readexactly(length)
+                command = header & 0xF0
+                if command == 0x10:    # CONNECT
+                    writer.write(b'\x20\x02\x00\x00')
+                elif command == 0x80:  # SUBSCRIBE
+                    count, pos = 0, 2
+                    while pos < len(body):
+                        pos += 2 + struct.unpack('!H', body[pos:pos + 2])[0] + 1
+                        count += 1
+                    writer.write(bytes((0x90, 2 + count)) + body[:2] + b'\x00' * count)
+                elif command == 0xA0:  # UNSUBSCRIBE
+                    writer.write(b'\xb0\x02' + body[:2])
+                elif command == 0x30:  # PUBLISH
+                    self.publishes += 1
+                    if (header >> 1) & 3:
+                        topic_length = struct.unpack('!H', body[:2])[0]
+                        writer.write(b'\x40\x02' + body[2 + topic_length:4 + topic_length])
+                elif command == 0xC0:  # PINGREQ
+                    writer.write(b'\xd0\x00')
+                elif command == 0xE0:  # DISCONNECT
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._server.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
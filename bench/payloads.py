@@ -0,0 +1,45 @@
+import random
+
+
+def device(i: int, sensors: int, circuits: int, rng: random.Random) -> dict:
+    """
+    Устройство ZONT в том виде, в каком его отдает метод devices (с лишними для нас поддеревьями).
+    """
+    return {
+        'id': 1000 + i,
+        'serial': f'{rng.getrandbits(48):012X}',
+        'name': f'Controller {i}',
+        'device_type': {'code': 'H2000+', 'name': 'ZONT H2000+ PRO'},
+        'online': True,
+        'is_active': True,
+        'thermometers': [
+            {
+                'uuid': f'{i:04x}-{j:04x}',
+                'name': f'Sensor {j}',
+                'is_assigned_to_slot': True,
+                'last_state': 'ok',
+                'last_value': round(rng.uniform(-30, 70), 1),
+                'last_value_time': 1700000000 + j,
+                'slot': j,
+                'history': [round(rng.uniform(-30, 70), 1) for _ in range(16)],
+            }
+            for j in range(sensors)
+        ],
+        'heating_circuits': [
+            {'id': j, 'name': f'Circuit {j}', 'active': True, 'status': 'ok', 'target_temp': 22.0,
+             'current_temp': round(rng.uniform(15, 25), 1), 'mode': 1}
+            for j in range(circuits)
+        ],
+        'io': {
+            'z3k-state': {str(k): {'value': rng.random(), 'flags': [0, 1, 2]} for k in range(64)},
+            'last-boiler-state': {'ot': {'s': [1, 0, 1], 'ff': 0, 'mt': 0.0}},
+        },
+    }
+
+
+def devices(count: int = 24, sensors: int = 16, circuits: int = 4, seed: int = 1) -> list[dict]:
+    """
+    :return: Детерминированный список устройств для заглушки ZONT API
+    """
+    rng = random.Random(seed)
+    return [device(i, sensors, circuits, rng) for i in range(count)]
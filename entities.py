@@ -2,31 +2,50 @@ from pyhass_mqtt import *
 import paho.mqtt.client as mqtt
 import typing as t
 import random
+import concurrent.futures
+import logging
+import threading
+import zont
+import zont.models
+
+
+logger = logging.getLogger(__name__)
 
 
 class TemperatureSensor(Entity):
+    # Общая модель-шаблон для всех датчиков: у каждого датчика хранятся только его собственные поля
+    template = models.Sensor(
+        device_class=enums.SensorDeviceClass.temperature,
+        suggested_display_precision=1,
+    )
+    # Не публикуем, пока температура не сдвинется хотя бы на 0.2. Повторять состояние, чтобы датчик
+    # не протух, не нужно: доступность всей ноды ведется по Last Will (см. Node(availability=True)).
+    # Политика не хранит состояния, так что одна на все датчики
+    policy = PublishPolicy(deadband=0.2)
+    __slots__ = ()
 
     def __init__(self, id_: str) -> None:
-        super().__init__(id_, model_cls=models.Sensor)
+        super().__init__(id_, model_cls=self.template.view)
         self.model.name = f'Dummy thermosensor from python {id_}'
-        self.model.expire_after = 600
-        self.model.device_class = enums.SensorDeviceClass.temperature
-        self.model.suggested_display_precision = 1
+        self.publish_policy = self.policy
 
     def get_state(self) -> str:
         return str(random.randrange(-300, +700) / 10)
 
 
 class Relay(Entity):
+    template = models.Switch(
+        optimistic=False,   # это значит, что HA после отправки команды должен дождаться подтверждения от нас
+        payload_off='OFF',  # это HA будет слать в командный топик, чтобы нас выключить
+        payload_on='ON',    # это HA будет слать в командный топик, чтобы нас включить
+        state_off='OFF',    # это мы пишем в топик состояния, когда выключаемся
+        state_on='ON',      # это мы пишем в топик состояния, когда включаемся
+    )
+    __slots__ = ('state',)
 
     def __init__(self, id_: str) -> None:
-        super().__init__(id_, model_cls=models.Switch)
+        super().__init__(id_, model_cls=self.template.view)
         self.model.name = f'Dummy relay "{id_}"'
-        self.model.optimistic = False   # это значит, что HA после отправки команды должен дождаться подтверждения от нас
-        self.model.payload_off = 'OFF'  # это HA будет слать в командный топик, чтобы нас выключить
-        self.model.payload_on = 'ON'    # это HA будет слать в командный топик, чтобы нас включить
-        self.model.state_off = 'OFF'    # это мы пишем в топик состояния, когда выключаемся
-        self.model.state_on = 'ON'      # это мы пишем в топик состояния, когда включаемся
         self.state = False              # это типа наше реле
 
     def get_state(self) -> str:
@@ -41,7 +60,7 @@ class Relay(Entity):
         '''
         super().set_node(node)
         if node:
-            self.model.command_topic = f'{node.id}/{self.id}/command'
+            self.model.command_topic = self.command_topic('command')
         else:
             self.model.command_topic = None
 
@@ -60,24 +79,133 @@ class Relay(Entity):
         # Надо известить о своем новом состоянии
         self.publish_state()
 
-    def subscribe(self) -> None:
-        '''
-        Это охуенно важный метод. В нем мы подписываемся на свой командный топик.
-        Этот метод вызывается только нодой и она во время его выполнения гарантировано определена
-        '''
-        # Дернули папский метод (там тупо проверка)
-        super().subscribe()
-        # Сказали MQTT-клиенту, что желаем подписаться вот на этот топик
-        self.node.client.subscribe(self.model.command_topic)
-        # Сказали MQTT-клиенту, что, сука, не просто так подписались, а чтобы он коллбек дернул по факту сообщения
-        self.node.client.message_callback_add(self.model.command_topic, self.on_set_command)
-
-    def unsubscribe(self) -> None:
+    def command_handlers(self) -> dict[str, t.Callable]:
         '''
-        Здесь иы отписывааемся к ебаной матери от всех топиков, на которые имели подписку.
-        Подписался - отпишись.
-        Метод, как и subscribe(), вызывается только нодой, не вручную.
+        Здесь говорим, какие командные топики нас интересуют и кто их обрабатывает.
+        Подписывается на них нода сама (и отписывается тоже), руками client.subscribe() дергать не надо.
+        Суффикс 'command' дает топик '{node.id}/{self.id}/command' - тот же, что мы прописали в модель в set_node()
         '''
-        super().unsubscribe()
-        self.node.client.message_callback_remove(self.model.command_topic)
-        self.node.client.unsubscribe(self.model.command_topic)
+        return {'command': self.on_set_command}
+
+
+class ZontRelay(Relay):
+    """
+    Реле, которое переключается командой в ZONT API через WriteBatcher.
+    Получив команду от HA, реле сразу публикует ожидаемое (optimistic) состояние, а команду ставит
+    в пакет устройства. Когда вызов API завершится, состояние подтверждается, а при ошибке откатывается
+    к последнему подтвержденному и публикуется заново. Если за это время пришла более новая команда,
+    результат старой состояние уже не трогает.
+    """
+    __slots__ = ('batcher', 'device_id', 'method', 'field', 'confirmed', '_seq', '_lock')
+
+    def __init__(self, id_: str, batcher: zont.WriteBatcher, device_id: int, method: str, field: str) -> None:
+        """
+        :param batcher: Пакетная запись в ZONT API
+        :param device_id: id устройства ZONT
+        :param method: Метод API, переключающий реле
+        :param field: Поле тела запроса со значением true/false
+        """
+        super().__init__(id_)
+        self.batcher = batcher
+        self.device_id = device_id
+        self.method = method
+        self.field = field
+        # Последнее состояние, подтвержденное ZONT API
+        self.confirmed = self.state
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def on_set_command(self, client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+        state = msg.payload.decode(self.model.encoding) == self.model.payload_on
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            self.state = state
+        self.publish_state()
+        future = self.batcher.submit(self.method, {'device_id': self.device_id, self.field: state})
+        future.add_done_callback(lambda future: self.on_result(seq, state, future))
+
+    def on_result(self, seq: int, state: bool, future: concurrent.futures.Future) -> None:
+        """
+        Подтвердить или откатить ожидаемое состояние по результату вызова API.
+        """
+        failed = future.exception() is not None
+        with self._lock:
+            if not failed:
+                self.confirmed = state
+            if seq != self._seq or not failed:
+                return
+            self.state = self.confirmed
+        logger.warning('%s: command failed (%s), rolling back', self.model.name, future.exception())
+        if self.node is not None:
+            self.publish_state(force=True)
+
+
+class ZontTemperature(Entity):
+    """
+    Температура из ZONT: датчик устройства или текущая температура контура отопления.
+    Создается и обновляется сверкой дерева устройств ZONT (см. zont_reconciler())
+    """
+    template = models.Sensor(
+        device_class=enums.SensorDeviceClass.temperature,
+        suggested_display_precision=1,
+    )
+    policy = PublishPolicy(deadband=0.1)
+    __slots__ = ('value',)
+
+    def __init__(self, id_: str, name: str) -> None:
+        super().__init__(id_, model_cls=self.template.view)
+        self.model.name = name
+        self.publish_policy = self.policy
+        self.value: float | None = None
+
+    def get_state(self) -> str:
+        # 'None' Home Assistant понимает как неизвестное состояние
+        return str(self.value)
+
+
+# Источник сущности: устройство и его датчик или контур
+ZontSource = tuple[zont.models.Device, zont.models.Thermometer | zont.models.HeatingCircuit]
+
+
+def zont_sources(devices: t.Iterable[zont.models.Device]) -> dict[str, ZontSource]:
+    """
+    Разложить дерево устройств ZONT по стабильным ключам: id устройства + uuid датчика или id контура.
+    Ключи не зависят от порядка и имен, так что переименование не пересоздает сущность.
+    """
+    sources: dict[str, ZontSource] = {}
+    for device in devices:
+        for thermometer in device.thermometers:
+            sources[f'zont_{device.id}_t_{thermometer.uuid}'] = (device, thermometer)
+        for circuit in device.heating_circuits:
+            sources[f'zont_{device.id}_hc_{circuit.id}'] = (device, circuit)
+    return sources
+
+
+def _zont_name(source: ZontSource) -> str:
+    device, item = source
+    return f'{device.name} {item.name or getattr(item, "uuid", None) or item.id}'
+
+
+def _zont_configure(obj: ZontTemperature, source: ZontSource) -> None:
+    obj.model.name = _zont_name(source)
+
+
+def _zont_feed(obj: ZontTemperature, source: ZontSource) -> None:
+    item = source[1]
+    obj.value = item.last_value if isinstance(item, zont.models.Thermometer) else item.current_temp
+
+
+def zont_reconciler(node: Node) -> Reconciler:
+    """
+    Reconciler, который держит в ноде по сущности на каждый датчик и контур устройств ZONT:
+        reconciler.reconcile(zont_sources(api.devices()), publish_state=True)
+    Discovery публикуется только при появлении датчика или смене его имени.
+    """
+    return Reconciler(
+        node,
+        factory=lambda key, source: ZontTemperature(key, _zont_name(source)),
+        fingerprint=_zont_name,
+        configure=_zont_configure,
+        feed=_zont_feed,
+    )
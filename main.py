@@ -1,5 +1,3 @@
-import time
-
 from pyhass_mqtt import *
 import paho.mqtt.client as mqtt
 import config
@@ -14,16 +12,8 @@ def init_node(id_: str) -> Node:
         clean_session=False,
         reconnect_on_failure=True,
     )
-    # Подключаемся к MQTT и запускаем thread с внутренним циклом MQTT-клиента
-    client.username_pw_set(config.MQTT_USER, config.MQTT_PASSWD)
-    client.connect(
-        host=config.MQTT_HOST,
-        port=config.MQTT_PORT,
-    )
-    client.loop_start()
-
-    # Создаем собственно node
-    return Node(
+    # Создаем собственно node. До подключения: нода задает клиенту Last Will для топика доступности
+    node = Node(
         id_=id_,
         client=client,
         device=models.Device(
@@ -31,8 +21,18 @@ def init_node(id_: str) -> Node:
             name=config.NODE_DEVICE_NAME,
             model=config.NODE_DEVICE_MODEL,
             sw_version='0.0.1'
-        )
+        ),
+        retain_discovery=True,
+        availability=True,
     )
+    # Подключаемся к MQTT и запускаем thread с внутренним циклом MQTT-клиента
+    client.username_pw_set(config.MQTT_USER, config.MQTT_PASSWD)
+    client.connect(
+        host=config.MQTT_HOST,
+        port=config.MQTT_PORT,
+    )
+    client.loop_start()
+    return node
 
 
 def main() -> None:
@@ -41,33 +41,35 @@ def main() -> None:
     boiler_temp = entities.TemperatureSensor('boiler_temp')
     boiler_temp.model.icon = 'mdi:thermometer-water'
     boiler_temp.model.name = 'Температура бойлера'
-    node.add_entity(boiler_temp)
+    boiler_temp.poll_interval = 5
 
     home_temp = entities.TemperatureSensor('home_temp')
     home_temp.model.icon = 'mdi:home-thermometer-outline'
     home_temp.model.name = 'Температура в доме'
-    node.add_entity(home_temp)
+    home_temp.poll_interval = 30
 
     outdoor_temp = entities.TemperatureSensor('outdoor_temp')
     outdoor_temp.model.icon = 'mdi:sun-thermometer'
     outdoor_temp.model.name = 'Уличная температура'
-    node.add_entity(outdoor_temp)
+    outdoor_temp.poll_interval = 60
 
     gate = entities.Relay('gate_switch')
     gate.model.icon = 'mdi:boom-gate-up'
     gate.model.name = 'Ворота'
-    node.add_entity(gate)
 
     street_lamp = entities.Relay('street_lamp')
     street_lamp.model.icon = 'mdi:outdoor-lamp'
     street_lamp.model.name = 'Уличное освещение'
-    node.add_entity(street_lamp)
 
-    while (True):
-        time.sleep(5)
-        boiler_temp.publish_state()
-        home_temp.publish_state()
-        outdoor_temp.publish_state()
+    # Добавляем все сущности разом: одна подписка на все командные топики, discovery и состояния - пачкой.
+    # Discovery публикуется только для новых и изменившихся сущностей, остальное уже лежит на брокере
+    node.add_entities([boiler_temp, home_temp, outdoor_temp, gate, street_lamp], reconcile=True)
+
+    # Каждый датчик публикуется со своим периодом
+    scheduler = Scheduler()
+    for obj in (boiler_temp, home_temp, outdoor_temp):
+        scheduler.add(obj)
+    scheduler.run()
 
 
 if __name__ == '__main__':
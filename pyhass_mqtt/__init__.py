@@ -1,3 +1,13 @@
 from . import enums
 from . import models
 from .main import *
+from .pipeline import *
+from .commands import *
+from .policy import *
+from .aio import *
+from .metrics import *
+from .scheduler import *
+from .shard import *
+from .group import *
+from .reconcile import *
+from .outbox import *
@@ -0,0 +1,232 @@
+import asyncio
+import inspect
+import logging
+import socket
+import typing as t
+import paho.mqtt.client as mqtt
+from . import models
+from .main import Entity, Node
+
+
+__all__ = [
+    'AsyncEntity',
+    'AsyncNode',
+]
+
+logger = logging.getLogger(__name__)
+
+
+class _LoopBridge:
+    """
+    Крутит сетевой цикл paho-клиента из asyncio event loop вместо отдельного потока (client.loop_start()).
+    Сокет клиента регистрируется в event loop через add_reader()/add_writer(), раз в секунду вызывается loop_misc().
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, client: mqtt.Client) -> None:
+        self.loop = loop
+        self.client = client
+        self.misc: asyncio.Task | None = None
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def on_socket_open(self, client: mqtt.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self.loop.add_reader(sock, client.loop_read)
+        self.misc = self.loop.create_task(self.misc_loop())
+
+    def on_socket_close(self, client: mqtt.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self.loop.remove_reader(sock)
+        self.loop.remove_writer(sock)
+        if self.misc is not None:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client: mqtt.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self.loop.add_writer(sock, client.loop_write)
+
+    def on_socket_unregister_write(self, client: mqtt.Client, userdata: t.Any, sock: socket.socket) -> None:
+        self.loop.remove_writer(sock)
+
+    async def misc_loop(self) -> None:
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncEntity(Entity):
+    """
+    Сущность для AsyncNode. Умеет публиковать состояние с ожиданием PUBACK,
+    обработчики команд (см. command_handlers()) могут быть корутинами.
+    """
+    __slots__ = ()
+
+    async def get_state_async(self) -> str:
+        """
+        Асинхронный вариант get_state(). Переопределяем, если для получения состояния нужно куда-то сходить
+        (например, в ZONT API). По умолчанию вызывает get_state().
+        """
+        return self.get_state()
+
+    async def publish_state_async(self, force: bool = False) -> bool:
+        """
+        Опубликовать состояние и дождаться подтверждения от брокера (для QoS > 0).
+        Публикация идет в соответствии с publish_policy, как и в publish_state(). Если переопределен
+        get_state_bytes(), состояние берется из него, а не из get_state_async().
+
+        :param force: Опубликовать состояние в обход политики
+        :return: True, если состояние было опубликовано
+        """
+        if not isinstance(self.node, AsyncNode):
+            raise RuntimeError('Cannot publish state of entity without async node')
+        if not self.node.connected:
+            self.node.dirty.add(self.id)
+            return False
+        topic, qos, retain, encoding, interned, raw = self.publish_params()
+        payload = self.get_state_bytes() if raw else await self.get_state_async()
+        if not self.accept_payload(payload, force):
+            return False
+        data = self._route_state(payload, encoding, interned, raw)
+        if data is not None:
+            await self.node.publish_async(topic, data, qos, retain)
+        return True
+
+
+class AsyncNode(Node):
+    """
+    Нода, сетевой цикл MQTT-клиента которой работает в asyncio event loop, без отдельного потока.
+    Обычные (синхронные) методы Node продолжают работать: публикации ставятся в очередь клиента
+    и отправляются event loop'ом. Асинхронные методы позволяют дождаться PUBACK.
+    Все методы следует вызывать из потока event loop.
+    После обрыва связи нода сама переподключается (как client.loop_start()), с задержками
+    из client.reconnect_delay_set(); после disconnect() - нет.
+    """
+    __slots__ = ('loop', '_bridge', '_acks', '_connected', '_tasks', 'reconnect', '_reconnecting', '_closing')
+
+    def __init__(self, id_: str, client: mqtt.Client, device: models.Device | None = None,
+                 discovery_prefix: str = 'homeassistant', loop: asyncio.AbstractEventLoop | None = None,
+                 availability: bool = False, availability_topic: str | None = None, reconnect: bool = True) -> None:
+        """
+        :param loop: Event loop. По умолчанию - текущий запущенный
+        :param reconnect: Переподключаться после обрыва связи. Если False, переподключение - забота вызывающего
+        Остальные параметры - см. Node
+        """
+        super().__init__(id_, client, device, discovery_prefix, availability=availability,
+                         availability_topic=availability_topic)
+        self.loop = loop or asyncio.get_running_loop()
+        self._bridge = _LoopBridge(self.loop, client)
+        self._acks: dict[int, asyncio.Future] = {}
+        self._connected: asyncio.Future | None = None
+        client.on_publish = self._on_publish
+        self._tasks: set[asyncio.Task] = set()
+        self.reconnect = reconnect
+        self._reconnecting: asyncio.Task | None = None
+        self._closing = False
+
+    async def connect(self, host: str, port: int = 1883, keepalive: int = 60) -> None:
+        """
+        Подключиться к брокеру и дождаться CONNACK.
+        """
+        self._closing = False
+        self._connected = self.loop.create_future()
+        self.client.connect(host, port, keepalive)
+        await self._connected
+
+    async def disconnect(self) -> None:
+        """
+        Отключиться от брокера. Переподключение, если оно идет, прекращается.
+        """
+        self._closing = True
+        if self._reconnecting is not None:
+            self._reconnecting.cancel()
+            self._reconnecting = None
+        self.client.disconnect()
+
+    def _on_connect(self, client: mqtt.Client, userdata: t.Any, flags: t.Any, reason_code: t.Any,
+                    properties: t.Any) -> None:
+        super()._on_connect(client, userdata, flags, reason_code, properties)
+        if self._connected is not None and not self._connected.done():
+            if reason_code.is_failure:
+                self._connected.set_exception(ConnectionError(str(reason_code)))
+            else:
+                self._connected.set_result(None)
+
+    def _on_disconnect(self, client: mqtt.Client, userdata: t.Any, flags: t.Any, reason_code: t.Any,
+                       properties: t.Any) -> None:
+        super()._on_disconnect(client, userdata, flags, reason_code, properties)
+        if self.reconnect and not self._closing and self._reconnecting is None:
+            self._reconnecting = self.loop.create_task(self._reconnect_loop())
+
+    async def _reconnect_loop(self) -> None:
+        # Та же экспоненциальная задержка, что у paho в loop_forever()
+        delay = getattr(self.client, '_reconnect_min_delay', 1)
+        max_delay = getattr(self.client, '_reconnect_max_delay', 120)
+        try:
+            while not self._closing:
+                await asyncio.sleep(delay)
+                try:
+                    self.client.reconnect()
+                except OSError as e:
+                    logger.warning('Node "%s" failed to reconnect: %s', self.id, e)
+                    delay = min(delay * 2, max_delay)
+                else:
+                    # Дальше - CONNACK и resync() в _on_connect()
+                    return
+        finally:
+            if self._reconnecting is asyncio.current_task():
+                self._reconnecting = None
+
+    def _on_publish(self, client: mqtt.Client, userdata: t.Any, mid: int, reason_code: t.Any,
+                    properties: t.Any) -> None:
+        future = self._acks.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def _ack(self, info: mqtt.MQTTMessageInfo) -> asyncio.Future:
+        future = self.loop.create_future()
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            future.set_exception(ConnectionError(mqtt.error_string(info.rc)))
+        elif info.is_published():
+            future.set_result(None)
+        else:
+            self._acks[info.mid] = future
+        return future
+
+    async def publish_async(self, topic: str, payload: bytes, qos: int = 0,
+                            retain: bool = False) -> mqtt.MQTTMessageInfo:
+        """
+        Опубликовать сообщение и дождаться, пока брокер его подтвердит (для QoS 0 - пока оно уйдет в сокет).
+        """
+        info = self.publish(topic, payload, qos, retain)
+        await self._ack(info)
+        return info
+
+    async def add_entities_async(self, objs: t.Iterable[Entity]) -> None:
+        """
+        То же, что add_entities(), но с ожиданием подтверждения всех discovery и начальных состояний.
+        """
+        completion = self.add_entities(objs)
+        await asyncio.gather(*(self._ack(info) for info in completion.infos))
+
+    async def publish_state_all_async(self, force: bool = False) -> None:
+        """
+        Опубликовать состояния всех сущностей конкурентно. Для AsyncEntity состояние берется из get_state_async().
+        """
+        await asyncio.gather(*(
+            obj.publish_state_async(force) if isinstance(obj, AsyncEntity) else self._publish_state_sync(obj, force)
+            for obj in self.entities.values()
+        ))
+
+    async def _publish_state_sync(self, obj: Entity, force: bool) -> None:
+        obj.publish_state(force)
+
+    def _run_handler(self, handler: t.Callable[[mqtt.Client, t.Any, mqtt.MQTTMessage], t.Any],
+                     client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+        result = handler(client, userdata, msg)
+        if inspect.isawaitable(result):
+            task = self.loop.create_task(result)
+            self._tasks.add(task)
+            task.add_done_callback(lambda task: self._handler_done(task, msg.topic))
+
+    def _handler_done(self, task: asyncio.Task, topic: str) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Command handler for "%s" failed', topic, exc_info=task.exception())
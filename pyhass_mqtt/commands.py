@@ -0,0 +1,163 @@
+import collections
+import logging
+import threading
+import time
+import typing as t
+import paho.mqtt.client as mqtt
+
+if t.TYPE_CHECKING:
+    from .metrics import Registry
+
+
+__all__ = [
+    'CommandExecutor',
+]
+
+
+logger = logging.getLogger(__name__)
+
+Handler = t.Callable[[mqtt.Client, t.Any, mqtt.MQTTMessage], t.Any]
+
+
+class CommandExecutor:
+    """
+    Пул потоков для обработчиков команд ноды. Сетевой поток paho только ставит команду в очередь и сразу
+    возвращается к приему сообщений и отправке PUBACK, так что медленный обработчик (например, запись
+    в ZONT API) не задерживает остальные сущности.
+
+    У каждой сущности своя очередь (lane): ее команды выполняются строго по одной и по порядку,
+    разные сущности обрабатываются параллельно. Если collapse включен, то из еще не начатых команд
+    сущности с одним суффиксом топика остается только самая свежая (например, при движении слайдера
+    в HA выполнится текущее и последнее положение, а не все промежуточные). Тогда длина очереди
+    ограничена числом обработчиков.
+
+    Не подходит для AsyncNode: там обработчики-корутины и так не блокируют event loop.
+    """
+    def __init__(self, workers: int = 4, collapse: bool = True) -> None:
+        """
+        :param workers: Число потоков
+        :param collapse: Схлопывать еще не начатые команды сущности с одним суффиксом до последней
+        """
+        self.workers = workers
+        self.collapse = collapse
+        self.metrics: t.Optional['Registry'] = None
+        self.submitted = 0
+        self.executed = 0
+        self.collapsed = 0
+        self.failed = 0
+        # id сущности -> суффикс (или номер, если collapse выключен) -> (обработчик, аргументы, время постановки)
+        self._lanes: dict[str, collections.OrderedDict[t.Any, tuple]] = {}
+        # Сущности, у которых есть команды и которые сейчас никем не обрабатываются
+        self._ready: collections.deque[str] = collections.deque()
+        self._active: set[str] = set()
+        self._depth = 0
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._threads: list[threading.Thread] = []
+        self._running = False
+
+    def __len__(self) -> int:
+        return self._depth
+
+    def start(self) -> None:
+        """
+        Запустить потоки пула.
+        """
+        if self._threads:
+            return
+        self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'pyhass-mqtt-command-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, drain: bool = True, timeout: float | None = None) -> None:
+        """
+        Остановить пул.
+
+        :param drain: Сначала выполнить все поставленные команды
+        :param timeout: Сколько ждать завершения каждого потока
+        """
+        with self._cond:
+            if not drain:
+                self._lanes = {obj_id: lane for obj_id, lane in self._lanes.items() if obj_id in self._active}
+                for lane in self._lanes.values():
+                    lane.clear()
+                self._ready.clear()
+                self._depth = 0
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, entity_id: str, suffix: str, handler: Handler, client: mqtt.Client, userdata: t.Any,
+               msg: mqtt.MQTTMessage) -> None:
+        """
+        Поставить команду в очередь сущности entity_id.
+        """
+        with self._cond:
+            self.submitted += 1
+            lane = self._lanes.get(entity_id)
+            if lane is None:
+                lane = self._lanes[entity_id] = collections.OrderedDict()
+            if not lane and entity_id not in self._active:
+                self._ready.append(entity_id)
+                self._cond.notify()
+            if self.collapse:
+                key = suffix
+                if lane.pop(key, None) is not None:
+                    self.collapsed += 1
+                    self._depth -= 1
+            else:
+                key = self._seq = self._seq + 1
+            lane[key] = (suffix, handler, client, userdata, msg, time.perf_counter())
+            self._depth += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._ready or not self._running)
+                if not self._ready:
+                    return
+                entity_id = self._ready.popleft()
+                lane = self._lanes[entity_id]
+                _, (suffix, handler, client, userdata, msg, queued) = lane.popitem(last=False)
+                self._depth -= 1
+                self._active.add(entity_id)
+            started = time.perf_counter()
+            failed = False
+            try:
+                handler(client, userdata, msg)
+            except Exception:
+                failed = True
+                logger.exception('Command handler for "%s" failed', msg.topic)
+            finished = time.perf_counter()
+            metrics = self.metrics
+            if metrics is not None:
+                metrics.observe('pyhass_mqtt_command_wait_seconds', started - queued,
+                                'Time commands spend in executor queue', suffix=suffix)
+                metrics.observe('pyhass_mqtt_command_seconds', finished - started,
+                                'Command dispatch duration', suffix=suffix)
+            with self._cond:
+                self.executed += 1
+                self.failed += failed
+                self._active.discard(entity_id)
+                if lane:
+                    self._ready.append(entity_id)
+                    self._cond.notify()
+                elif self._lanes.get(entity_id) is lane:
+                    del self._lanes[entity_id]
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Счетчики пула
+        """
+        return {
+            'depth': self._depth,
+            'active': len(self._active),
+            'submitted': self.submitted,
+            'executed': self.executed,
+            'collapsed': self.collapsed,
+            'failed': self.failed,
+        }
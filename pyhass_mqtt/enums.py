@@ -9,6 +9,8 @@ __all__ = [
     'SwitchDeviceClass',
     'LightCommandType',
     'NumberMode',
+    'EntityCategory',
+    'AvailabilityMode',
 ]
 
 
@@ -18,6 +20,11 @@ class AvailabilityMode(enum.StrEnum):
     latest = 'latest'
 
 
+class EntityCategory(enum.StrEnum):
+    config = 'config'
+    diagnostic = 'diagnostic'
+
+
 class SensorStateClass(enum.StrEnum):
     measurement = 'measurement'
     total = 'total'
@@ -0,0 +1,112 @@
+import json
+import paho.mqtt.client as mqtt
+from .main import Entity, Node
+
+
+__all__ = [
+    'StateGroup',
+]
+
+
+class StateGroup:
+    """
+    Общий топик состояния для группы сущностей одной ноды. Вместо отдельного сообщения в
+    '{node.id}/{entity.id}/state' на каждую сущность в '{node.id}/{group}/state' уходит один JSON-документ
+    {id сущности: состояние, ...}, а в discovery каждой сущности автоматически прописывается
+    value_template вида '{{ value_json["<id>"] }}' (или state_value_template - см. models.Entity.state_template_field_).
+
+    Документ отправляется, только если состояние хотя бы одной сущности изменилось (по ее publish_policy).
+    Публикация состояния одной сущности сразу отправляет документ, а в пакетных операциях ноды
+    (add_entities(), publish_state_all(), resync()) и в publish_state() группы документ уходит один раз в конце.
+    Группу можно отдать Scheduler как сущность: по сроку опрашиваются все ее сущности.
+    """
+    def __init__(self, node: Node, name: str = 'group', qos: int = 0, retain: bool = False,
+                 poll_interval: float | None = None) -> None:
+        """
+        :param node: Нода, в которую будут добавлены сущности группы
+        :param name: Имя группы, уникальное в рамках ноды (не должно совпадать с id сущностей)
+        :param qos: QoS документа
+        :param retain: Публиковать документ как retained
+        :param poll_interval: Период опроса группы для Scheduler
+        """
+        self.node = node
+        self.id = name
+        self.topic = f'{node.id}/{name}/state'
+        self.qos = qos
+        self.retain = retain
+        self.poll_interval = poll_interval
+        self.members: dict[str, Entity] = {}
+        # Последние опубликованные состояния сущностей группы
+        self.values: dict[str, str] = {}
+        self.dirty = False
+        self.published = 0
+
+    def add(self, obj: Entity) -> None:
+        """
+        Включить сущность в группу. Вызывается до добавления сущности в ноду.
+        """
+        if obj.node is not None:
+            raise RuntimeError(f'Entity "{obj.id}" must join state group before it is added to node')
+        if obj.model.state_template_field_ is None:
+            raise TypeError(f'{type(obj.model).__name__} cannot take state from JSON')
+        if obj.state_group is not None:
+            obj.state_group.discard(obj)
+        obj.state_group = self
+        self.members[obj.id] = obj
+
+    def discard(self, obj: Entity) -> None:
+        """
+        Исключить сущность из группы. Если сущность в ноде, ее нужно сначала удалить из ноды.
+        """
+        if obj.node is not None:
+            raise RuntimeError(f'Entity "{obj.id}" must be removed from node before leaving state group')
+        if self.members.pop(obj.id, None) is obj:
+            obj.state_group = None
+
+    def value_template(self, obj: Entity) -> str:
+        """
+        :return: Шаблон Home Assistant, извлекающий состояние сущности из документа группы
+        """
+        # Только индексом: value_json.items, value_json.get и т.п. в Jinja - методы словаря, а не ключи
+        return f'{{{{ value_json[{json.dumps(obj.id, ensure_ascii=False)}] }}}}'
+
+    def update(self, obj: Entity, payload: str) -> None:
+        """
+        Принять новое состояние сущности группы (вызывается из Entity.publish_state()).
+        """
+        self.values[obj.id] = payload
+        self.dirty = True
+        if not self.node.defer_group(self):
+            self.flush()
+
+    def forget(self, obj: Entity) -> None:
+        """
+        Убрать состояние сущности из документа (сущность уходит из ноды).
+        """
+        if self.values.pop(obj.id, None) is not None:
+            self.dirty = True
+
+    def flush(self) -> mqtt.MQTTMessageInfo | None:
+        """
+        Отправить документ, если с прошлой отправки что-то изменилось.
+        """
+        if not self.dirty:
+            return None
+        self.dirty = False
+        self.published += 1
+        payload = json.dumps(self.values, ensure_ascii=False, separators=(',', ':')).encode()
+        return self.node.publish(self.topic, payload, self.qos, self.retain)
+
+    def publish_state(self, force: bool = False) -> bool:
+        """
+        Опросить все сущности группы и отправить документ один раз.
+
+        :param force: Опубликовать состояния в обход политик
+        :return: True, если документ был отправлен
+        """
+        published = self.published
+        with self.node.batch():
+            for obj in list(self.members.values()):
+                if obj.node is self.node:
+                    obj.publish_state(force)
+        return self.published != published
@@ -1,23 +1,65 @@
+import contextlib
+import functools
+import hashlib
+import logging
+import threading
+import time
 import typing as t
 import paho.mqtt.client as mqtt
 from . import models
+from .commands import CommandExecutor
+from .outbox import Outbox
+from .pipeline import PipelineTicket, PublishPipeline
+from .policy import PublishPolicy
+
+if t.TYPE_CHECKING:
+    from .group import StateGroup
+    from .metrics import Registry
+
+
+logger = logging.getLogger(__name__)
+
+# Заранее закодированные payload фиксированных состояний по кодировкам. Общие для всех сущностей процесса
+_interned: dict[str, dict[str, bytes]] = {}
 
 
 class Entity:
     """
     Базовый класс для определения MQTT-сущностей, которые понимаются Home Assistant.
     https://www.home-assistant.io/integrations/mqtt/
+
+    Класс со __slots__: наследники, которым важна память, тоже объявляют __slots__ со своими атрибутами.
     """
-    def __init__(self, id_: str, model_cls: type) -> None:
+    # Фиксированные состояния сущности (кроме тех, что и так есть в модели, см. models.Entity.state_payload_fields_),
+    # которые стоит закодировать один раз, например режимы работы
+    state_payloads: t.ClassVar[tuple[str, ...]] = ()
+
+    __slots__ = ('node', 'model', 'id', 'discovery_topic', 'publish_policy', 'last_payload', 'last_published',
+                 'poll_interval', 'state_group', '_publish_cache')
+
+    def __init__(self, id_: str, model_cls: t.Callable[[], t.Any]) -> None:
         """
         :param id_: Строка, содержащая уникальный идентификатор сущности в рамках Node.
         :param model_cls: Класс (фабрика) модели сущности. См. pyhass_mqtt.models или
                           https://www.home-assistant.io/integrations/mqtt/
+                          Для множества однотипных сущностей - template.view, где template - общая модель-шаблон
+                          (см. pyhass_mqtt.models.ModelView)
         """
         self.node: t.Optional['Node'] = None
         self.model = model_cls()
         self.id = id_
         self.discovery_topic: str | None = None
+        # Политика публикации состояния (см. PublishPolicy). None - публиковать всегда
+        self.publish_policy: PublishPolicy | None = None
+        # Последнее опубликованное состояние и момент его публикации (по часам политики)
+        self.last_payload: str | bytes | None = None
+        self.last_published: float = 0.0
+        # Период опроса/публикации состояния в секундах для Scheduler. None - сущность сама не опрашивается
+        self.poll_interval: float | None = None
+        # Группа с общим топиком состояния (см. StateGroup). None - свой state_topic
+        self.state_group: t.Optional['StateGroup'] = None
+        # Параметры публикации состояния (см. publish_params())
+        self._publish_cache: tuple | None = None
 
     def set_node(self, node: t.Optional['Node']) -> None:
         """
@@ -27,25 +69,62 @@ class Entity:
 
         :param node: Экземпляр класса Node или None
         """
+        old = self.node
+        if old is not None and old.availability is not None and self.model.availability:
+            own = [item for item in self.model.availability if item is not old.availability]
+            self.model.availability = own or None
+        group = self.state_group
+        if group is not None:
+            if node is not None and group.node is not node:
+                raise RuntimeError(f'Entity "{self.id}" belongs to state group of another node')
+            if node is None:
+                group.forget(self)
+            setattr(self.model, self.model.state_template_field_, group.value_template(self) if node else None)
         self.node = node
+        self.last_payload = None
         if node is not None:
             self.model.object_id = self.model.unique_id = f'{node.id}_{self.id}'
-            self.model.state_topic = f'{node.id}/{self.id}/state'
+            self.model.state_topic = group.topic if group is not None else f'{node.id}/{self.id}/state'
             self.model.device = node.device
             self.discovery_topic = f'{node.discovery_prefix}/{self.model.discovery_class_}/{node.id}/{self.id}/config'
+            if node.availability is not None:
+                self.model.availability = [node.availability] + (self.model.availability or [])
         else:
             self.model.unique_id = None
             self.model.object_id = None
             self.model.state_topic = None
             self.model.device = None
             self.discovery_topic = None
+        self._publish_cache = self._publish_params() if node is not None else None
+
+    def command_topic(self, suffix: str) -> str:
+        """
+        :param suffix: Суффикс командного топика, например 'command'
+        :return: Командный топик сущности вида '{node.id}/{entity.id}/{suffix}'
+        """
+        if self.node is None:
+            raise RuntimeError('Cannot make command topic of entity without node')
+        return f'{self.node.id}/{self.id}/{suffix}'
+
+    def command_handlers(self) -> dict[str, t.Callable[[mqtt.Client, t.Any, mqtt.MQTTMessage], None]]:
+        """
+        Обработчики команд сущности. Ключ - суффикс командного топика (см. command_topic()), значение - обработчик:
+            def on_msg(client: mqtt.Client, userdata: t.Any, message: mqtt.MQTTMessage) -> None
+        Нода не подписывается на каждый такой топик, а держит одну подписку '{node.id}/+/{suffix}' на каждый
+        суффикс и раздает сообщения сущностям через словарь (см. Node.subscribe_commands()).
+        В наследниках переопределяем этот метод вместо subscribe(), если нужно только принимать команды.
+
+        :return: Словарь {суффикс: обработчик}
+        """
+        return {}
 
     def subscribe(self) -> None:
         """
         Этот метод вызывается нодой, чтобы данная сущность подписалась на все интересующие ее топики.
+        Базовая реализация регистрирует обработчики из command_handlers() в диспетчере команд ноды.
         В наследниках этого класса при переопределении сначала желательно вызвать родительскую реализацию.
 
-        Чтобы подписаться, используем:
+        Чтобы подписаться на что-то еще, используем:
             self.node.client.subscribe(topic)
             self.node.client.message_callback_add(topic, on_msg)
         Обработчик должен быть таким:
@@ -53,6 +132,7 @@ class Entity:
         """
         if self.node is None:
             raise RuntimeError('Cannot subscribe entity without node')
+        self.node.subscribe_commands([self])
 
     def unsubscribe(self) -> None:
         """
@@ -65,6 +145,7 @@ class Entity:
         """
         if self.node is None:
             raise RuntimeError('Cannot unsubscribe entity without node')
+        self.node.unsubscribe_commands([self])
 
     def get_state(self) -> str:
         """
@@ -74,18 +155,106 @@ class Entity:
         """
         raise NotImplementedError('get_state')
 
-    def publish_state(self) -> None:
+    def get_state_bytes(self) -> bytes:
         """
-        При вызове этого метода, сущность опубликует в своем state_topic свое состояние (см. get_state())
+        Переопределяем вместо get_state(), если сущности проще сразу отдать закодированное состояние
+        (например, готовые bytes на каждое значение): тогда publish_state() ничего не кодирует.
+        publish_policy в этом случае сравнивает bytes (deadband для чисел тоже работает).
+
+        :return: Текущее состояние (state) сущности в кодировке модели.
         """
-        if self.node is None:
+        raise NotImplementedError('get_state_bytes')
+
+    def _publish_params(self) -> tuple:
+        model = self.model
+        encoding = model.encoding or 'utf-8'
+        interned = _interned.setdefault(encoding, {})
+        for state in (*(getattr(model, name) for name in model.state_payload_fields_), *self.state_payloads):
+            if state is not None and state not in interned:
+                interned[state] = state.encode(encoding)
+        raw = type(self).get_state_bytes is not Entity.get_state_bytes
+        # Версия модели, по которой считались параметры, и сами параметры (см. publish_params())
+        return model.version, (model.state_topic, model.qos, model.retain, encoding, interned, raw)
+
+    def publish_params(self) -> tuple[str, int, bool, str, dict[str, bytes], bool]:
+        """
+        Параметры публикации состояния, вычисленные в set_node(), а не на каждую публикацию. Пересчитываются,
+        только если модель изменилась (по ее версии).
+
+        :return: (state_topic, qos, retain, кодировка, заранее закодированные фиксированные состояния,
+                 переопределен ли get_state_bytes())
+        """
+        cache = self._publish_cache
+        if cache is None or cache[0] != self.model.version:
+            cache = self._publish_cache = self._publish_params()
+        return cache[1]
+
+    def publish_state(self, force: bool = False) -> bool:
+        """
+        При вызове этого метода, сущность опубликует в своем state_topic свое состояние (см. get_state()).
+        Если задана publish_policy, то состояние публикуется, только если политика это разрешает.
+        Пока нода не подключена к брокеру, состояние не публикуется, а сущность помечается для публикации
+        после переподключения (см. Node.resync()). Если у ноды есть outbox, состояние уходит в него.
+        Состояние сущности из StateGroup уходит не в свой топик, а в общий документ группы.
+        Топик и параметры публикации берутся из publish_params(), фиксированные состояния не кодируются заново.
+
+        :param force: Опубликовать состояние в обход политики
+        :return: True, если состояние было опубликовано
+        """
+        node = self.node
+        if node is None:
             raise RuntimeError('Cannot publish state of entity without node')
-        self.node.client.publish(
-            self.model.state_topic,
-            self.get_state().encode(self.model.encoding),
-            self.model.qos,
-            self.model.retain
-        )
+        if not node.connected and node.outbox is None:
+            node.dirty.add(self.id)
+            return False
+        topic, qos, retain, encoding, interned, raw = self.publish_params()
+        metrics = node.metrics
+        if metrics is None:
+            payload = self.get_state_bytes() if raw else self.get_state()
+        else:
+            started = time.perf_counter()
+            payload = self.get_state_bytes() if raw else self.get_state()
+            metrics.observe('pyhass_mqtt_get_state_seconds', time.perf_counter() - started,
+                            'Duration of Entity.get_state()', entity=type(self).__name__)
+        if not self.accept_payload(payload, force):
+            return False
+        data = self._route_state(payload, encoding, interned, raw)
+        if data is not None:
+            node.publish(topic, data, qos, retain)
+        return True
+
+    def _route_state(self, payload: str | bytes, encoding: str, interned: dict[str, bytes],
+                     raw: bool) -> bytes | None:
+        """
+        Передать принятое политикой состояние в StateGroup или закодировать его для state_topic.
+        Общая часть publish_state() и AsyncEntity.publish_state_async().
+
+        :return: Payload для state_topic или None, если состояние ушло в документ группы
+        """
+        if self.state_group is not None:
+            self.state_group.update(self, payload.decode(encoding) if raw else payload)
+            return None
+        if raw:
+            return payload
+        data = interned.get(payload)
+        return data if data is not None else payload.encode(encoding)
+
+    def accept_payload(self, payload: str | bytes, force: bool = False) -> bool:
+        """
+        Спросить publish_policy, публиковать ли состояние payload, и если да - запомнить его как опубликованное.
+
+        :param payload: Состояние, полученное из get_state() (или get_state_bytes())
+        :param force: Не спрашивать политику
+        :return: True, если состояние нужно публиковать
+        """
+        policy = self.publish_policy
+        if policy is not None:
+            now = policy.clock()
+            if not force and not policy.should_publish(self, payload, now):
+                return False
+            self.last_published = now
+        self.last_payload = payload
+        return True
 
     def publish_discovery(self) -> None:
         """
@@ -95,7 +264,10 @@ class Entity:
         """
         if self.node is None:
             raise RuntimeError('Cannot publish discovery of entity without node')
-        self.node.client.publish(self.discovery_topic, self.model.discovery_json(), 1, False)
+        payload = self.model.discovery_payload()
+        if self.node.discovery_unchanged(self.discovery_topic, payload):
+            return
+        self.node.publish(self.discovery_topic, payload, 1, self.node.retain_discovery)
 
     def unpublish_discovery(self) -> None:
         """
@@ -104,48 +276,427 @@ class Entity:
         """
         if self.node is None:
             raise RuntimeError('Cannot un-publish discovery of entity without node')
-        self.node.client.publish(self.discovery_topic, '', 1, False)
+        self.node.publish(self.discovery_topic, b'', 1, self.node.retain_discovery)
 
 
 class Node:
     """
     Класс, воплощающий Home Assistant MQTT device.
     """
+    # Значения по умолчанию Home Assistant, поэтому в discovery их не пишем
+    PAYLOAD_AVAILABLE = 'online'
+    PAYLOAD_NOT_AVAILABLE = 'offline'
+
+    __slots__ = ('client', 'reconnects', '_downtime', '_disconnected_at', 'dirty', '_chained_on_connect',
+                 '_chained_on_disconnect', 'connected', 'metrics', 'pipeline', 'id', 'device', 'discovery_prefix',
+                 'retain_discovery', 'availability', 'known_discovery', 'entities', '_pending', '_handlers',
+                 '_suffixes', 'command_qos', 'command_wildcard', '_deferred_groups', 'executor', 'outbox', '_local')
+
     def __init__(self, id_: str, client: mqtt.Client, device: models.Device | None = None,
-                 discovery_prefix: str = 'homeassistant') -> None:
+                 discovery_prefix: str = 'homeassistant', pipeline: PublishPipeline | None = None,
+                 retain_discovery: bool = False, availability: bool = False,
+                 availability_topic: str | None = None, executor: CommandExecutor | None = None,
+                 outbox: Outbox | None = None, command_wildcard: bool = True) -> None:
         """
         :param id_: Уникальный идентификатор ноды, используется для генерации object_id и топиков
         :param client: MQTT-клиент, экземпляр paho.mqtt.client.Client
         :param device: Модель, описывающая устройство для Home Assistant. Для всех сущностей этой ноды
                        поле device в discovery JSON будет равно этой модели
         :param discovery_prefix: Префикс для discovery топиков в Home Assistant
+        :param pipeline: Очередь публикаций (см. PublishPipeline). Если задана, все публикации ноды идут через нее,
+                         а не напрямую в клиент. Нода сама ее запускает
+        :param retain_discovery: Публиковать discovery как retained. Нужно для add_entities(reconcile=True)
+        :param availability: Вести доступность ноды в одном топике: при подключении нода публикует туда
+                             retained 'online', а 'offline' за нее опубликует брокер по Last Will, когда
+                             соединение пропадет. Топик автоматически прописывается в discovery всех сущностей,
+                             так что им не нужны expire_after и периодические повторы состояния.
+                             Last Will задается клиенту здесь, поэтому ноду нужно создавать до client.connect().
+                             Если клиент уже подключен, нода сразу публикует 'online', а Last Will начнет
+                             действовать только после переподключения (об этом пишется предупреждение в лог)
+        :param availability_topic: Топик доступности. По умолчанию '{node.id}/availability'
+        :param executor: Пул для обработчиков команд (см. CommandExecutor). Если задан, сетевой поток клиента
+                         только ставит команды в очередь, а обработчики выполняются в пуле. Нода сама его запускает
+        :param outbox: Буфер на диске для публикаций без соединения (см. Outbox). Если задан, все публикации
+                       ноды (в т.ч. состояния, вместо пометки dirty) без соединения пишутся в него и отправляются
+                       после подключения
+        :param command_wildcard: Подписываться на команды одним wildcard-топиком '{node.id}/+/{suffix}' на суффикс.
+                                 False - на командный топик каждой сущности: нужно, когда сущности одного id ноды
+                                 разложены по нескольким соединениям (см. ShardedNode), иначе каждое соединение
+                                 получает команды всех сущностей
         """
         self.client: mqtt.Client = client
+        # Состояние соединения с брокером, число переподключений и суммарное время без соединения
+        self.reconnects = 0
+        self._downtime = 0.0
+        self._disconnected_at: float | None = None
+        # id сущностей, состояние которых не удалось опубликовать без соединения (см. resync())
+        self.dirty: set[str] = set()
+        self._chained_on_connect = getattr(client, 'on_connect', None)
+        self._chained_on_disconnect = getattr(client, 'on_disconnect', None)
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        is_connected = getattr(client, 'is_connected', None)
+        self.connected: bool = is_connected() if is_connected is not None else True
+        # Реестр метрик (см. attach_metrics())
+        self.metrics: t.Optional['Registry'] = None
+        self.pipeline = pipeline
+        if pipeline is not None:
+            pipeline.start()
+        self.executor = executor
+        if executor is not None:
+            executor.start()
+        self.outbox = outbox
+        # Состояние потока: выполняется ли в нем обработчик команды (см. _run_handler())
+        self._local = threading.local()
         self.id = id_
         self.device = device
         if self.device.identifiers is None:
             self.device.identifiers = [self.id]
         self.discovery_prefix = discovery_prefix
-        self.entities = {}
+        self.retain_discovery = retain_discovery
+        # Доступность ноды (см. publish_availability()). Одна модель на все сущности ноды
+        self.availability: models.Availability | None = None
+        if availability:
+            self.availability = models.Availability(topic=availability_topic or f'{id_}/availability')
+            client.will_set(self.availability.topic, self.PAYLOAD_NOT_AVAILABLE, 1, True)
+        # Хэши discovery, которые уже лежат на брокере (см. add_entities(reconcile=True)). None - не сверять
+        self.known_discovery: dict[str, bytes] | None = None
+        self.entities: dict[str, Entity] = {}
+        # Сюда собираются результаты публикаций во время пакетных операций (см. add_entities())
+        self._pending: list[mqtt.MQTTMessageInfo | PipelineTicket] | None = None
+        # Диспетчер команд: (id сущности, суффикс топика) -> обработчик, и число обработчиков на каждый суффикс
+        self._handlers: dict[tuple[str, str], t.Callable[[mqtt.Client, t.Any, mqtt.MQTTMessage], None]] = {}
+        self._suffixes: dict[str, int] = {}
+        self.command_qos = 0
+        self.command_wildcard = command_wildcard
+        # Группы состояний, документы которых отправляются в конце пакетной операции (см. batch())
+        self._deferred_groups: set['StateGroup'] | None = None
+        if outbox is not None and self.connected:
+            # Записи, оставшиеся от прошлого запуска
+            self.outbox.replay(self._send, lambda: self.connected)
+        if self.availability is not None and is_connected is not None and self.connected:
+            # on_connect для этого соединения уже был, и 'online' за нас никто не опубликует
+            logger.warning('Node "%s" is created after client.connect(): Last Will for "%s" is not set until '
+                           'reconnect', id_, self.availability.topic)
+            self.publish_availability(True)
 
-    def add_entity(self, obj: Entity) -> None:
+    def attach_metrics(self, registry: 'Registry', **labels: t.Any) -> None:
         """
-        Добавить сущность в ноду.
+        Подключить реестр метрик (см. pyhass_mqtt.metrics.Registry). Без него нода метрики не собирает.
+        Gauge ноды получают метку node=id ноды, так что в одном реестре может быть несколько нод.
 
-        :param obj: Экземпляр класса, отнаследованного от Entity
+        :param labels: Дополнительные метки gauge ноды (ShardedNode добавляет shard)
         """
-        if obj.node == self:
+        self.metrics = registry
+        labels = {'node': self.id, **labels}
+        registry.gauge('pyhass_mqtt_entities', lambda: len(self.entities), 'Entities in node', **labels)
+        registry.gauge('pyhass_mqtt_connected', lambda: int(self.connected), 'Whether node is connected to broker',
+                       **labels)
+        registry.gauge('pyhass_mqtt_reconnects', lambda: self.reconnects, 'Reconnects to broker', **labels)
+        registry.gauge('pyhass_mqtt_downtime_seconds', lambda: self.downtime, 'Total time without broker connection',
+                       **labels)
+        registry.gauge('pyhass_mqtt_dirty_entities', lambda: len(self.dirty),
+                       'Entities waiting for state publish after reconnect', **labels)
+        registry.gauge('pyhass_mqtt_client_queue_depth', lambda: len(getattr(self.client, '_out_packet', ())),
+                       'Packets waiting in the paho outgoing queue', **labels)
+        if self.pipeline is not None:
+            registry.gauge('pyhass_mqtt_pipeline_depth', lambda: len(self.pipeline), 'Topics in publish pipeline',
+                           **labels)
+            registry.gauge('pyhass_mqtt_pipeline_dropped', lambda: self.pipeline.dropped,
+                           'Messages dropped by publish pipeline', **labels)
+        if self.executor is not None:
+            self.executor.metrics = registry
+            registry.gauge('pyhass_mqtt_command_queue_depth', lambda: len(self.executor),
+                           'Commands waiting in executor', **labels)
+            registry.gauge('pyhass_mqtt_commands_collapsed', lambda: self.executor.collapsed,
+                           'Commands replaced by a newer one before execution', **labels)
+        if self.outbox is not None:
+            registry.gauge('pyhass_mqtt_outbox_records', lambda: len(self.outbox), 'Messages waiting in outbox',
+                           **labels)
+            registry.gauge('pyhass_mqtt_outbox_bytes', lambda: self.outbox.used, 'Bytes used in outbox file', **labels)
+            registry.gauge('pyhass_mqtt_outbox_dropped', lambda: self.outbox.dropped,
+                           'Messages overwritten in full outbox', **labels)
+
+    @property
+    def downtime(self) -> float:
+        """
+        Суммарное время без соединения с брокером после первого подключения (включая текущий разрыв), секунды
+        """
+        if self._disconnected_at is None:
+            return self._downtime
+        return self._downtime + time.monotonic() - self._disconnected_at
+
+    def _on_connect(self, client: mqtt.Client, userdata: t.Any, flags: t.Any, reason_code: t.Any,
+                    properties: t.Any) -> None:
+        if self.pipeline is not None:
+            # on_connect приходит в сетевом потоке клиента: в нем pipeline не должен блокироваться
+            self.pipeline.network_thread = threading.get_ident()
+        if not reason_code.is_failure:
+            if self._disconnected_at is not None:
+                self.reconnects += 1
+                self._downtime += time.monotonic() - self._disconnected_at
+                self._disconnected_at = None
+            self.connected = True
+            if self.availability is not None:
+                self.publish_availability(True)
+            self.resync()
+            if self.outbox is not None:
+                self.outbox.replay(self._send, lambda: self.connected)
+        if self._chained_on_connect is not None:
+            self._chained_on_connect(client, userdata, flags, reason_code, properties)
+
+    def _on_disconnect(self, client: mqtt.Client, userdata: t.Any, flags: t.Any, reason_code: t.Any,
+                       properties: t.Any) -> None:
+        if self.connected:
+            self.connected = False
+            self._disconnected_at = time.monotonic()
+        if self._chained_on_disconnect is not None:
+            self._chained_on_disconnect(client, userdata, flags, reason_code, properties)
+
+    def publish_availability(self, available: bool) -> mqtt.MQTTMessageInfo | None:
+        """
+        Опубликовать доступность ноды (retained). 'online' нода публикует сама при каждом подключении,
+        'offline' стоит публиковать перед штатным отключением: Last Will при client.disconnect() не срабатывает.
+        """
+        if self.availability is None:
+            raise RuntimeError('Node availability is not enabled')
+        payload = self.PAYLOAD_AVAILABLE if available else self.PAYLOAD_NOT_AVAILABLE
+        return self.publish(self.availability.topic, payload.encode(), 1, True, urgent=True)
+
+    def resync(self) -> 'Completion':
+        """
+        Восстановить состояние на брокере после (пере)подключения. Вызывается нодой из on_connect.
+        Командные топики переподписываются одним SUBSCRIBE-пакетом (см. resubscribe()), сущности
+        с собственным subscribe() подписываются заново. Состояния публикуются только для сущностей,
+        которые пытались их опубликовать без соединения (dirty), и только если это разрешит publish_policy.
+        Discovery с QoS 1 не теряются: их хранит очередь paho-клиента (или outbox, если он задан).
+
+        :return: Completion по публикациям состояний
+        """
+        self.resubscribe()
+        for obj in list(self.entities.values()):
+            if type(obj).subscribe is not Entity.subscribe:
+                obj.subscribe()
+        dirty, self.dirty = self.dirty, set()
+        with self._collect() as completion, self.batch():
+            for obj_id in dirty:
+                obj = self.entities.get(obj_id)
+                if obj is not None:
+                    obj.publish_state()
+        return completion
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False,
+                urgent: bool = False) -> mqtt.MQTTMessageInfo | PipelineTicket | None:
+        """
+        Опубликовать сообщение через MQTT-клиент ноды. Все публикации сущностей идут через этот метод.
+
+        :param urgent: При соединении отправить сообщение мимо outbox, даже если тот еще отправляет
+                       накопленное (см. Outbox.offer()). Публикации из обработчиков команд срочные всегда
+
+        :return: MQTTMessageInfo, PipelineTicket, если сообщение поставлено в очередь pipeline,
+                 или None, если оно записано в outbox
+        """
+        if self.metrics is not None:
+            kind = 'discovery' if topic.startswith(self.discovery_prefix + '/') else \
+                'state' if topic.endswith('/state') else 'other'
+            self.metrics.inc('pyhass_mqtt_publishes_total', 1, 'MQTT publishes by topic class', kind=kind)
+        if self.outbox is not None and self.outbox.offer(topic, payload, qos, retain, self.connected,
+                                                         urgent or getattr(self._local, 'command', False)):
+            return None
+        info = self._send(topic, payload, qos, retain)
+        if self._pending is not None:
+            self._pending.append(info)
+        return info
+
+    def _send(self, topic: str, payload: bytes, qos: int, retain: bool) -> mqtt.MQTTMessageInfo | PipelineTicket:
+        # Отправка без outbox: в pipeline, если он есть, иначе в клиент. Так же outbox отправляет накопленное
+        if self.pipeline is not None:
+            return self.pipeline.submit(topic, payload, qos, retain)
+        return self.client.publish(topic, payload, qos, retain)
+
+    @contextlib.contextmanager
+    def _collect(self) -> t.Iterator['Completion']:
+        """
+        Собрать результаты всех публикаций внутри блока with в Completion. Блоки можно вкладывать:
+        публикации внутреннего блока попадают и во внешний. На этом построены add_entities(), remove_entities()
+        и publish_state_all().
+        """
+        outer = self._pending
+        completion = Completion([])
+        self._pending = completion.infos
+        try:
+            yield completion
+        finally:
+            self._pending = outer
+            if outer is not None:
+                outer.extend(completion.infos)
+
+    @contextlib.contextmanager
+    def batch(self) -> t.Iterator[None]:
+        """
+        Пакетная операция: документы групп состояний (см. StateGroup), изменившиеся внутри блока with,
+        отправляются по одному разу в его конце.
+        """
+        if self._deferred_groups is not None:
+            yield
             return
+        self._deferred_groups = set()
+        try:
+            yield
+        finally:
+            groups, self._deferred_groups = self._deferred_groups, None
+            for group in groups:
+                group.flush()
+
+    def defer_group(self, group: 'StateGroup') -> bool:
+        """
+        Отложить отправку документа группы до конца пакетной операции.
+
+        :return: False, если пакетной операции нет и документ нужно отправить сразу
+        """
+        if self._deferred_groups is None:
+            return False
+        self._deferred_groups.add(group)
+        return True
+
+    def _attach(self, obj: Entity) -> None:
         if obj.node is not None:
             obj.node.remove_entity(obj)
         if obj.id in self.entities:
             raise KeyError(f'Duplicate entity "{obj.id}"')
         self.entities[obj.id] = obj
         obj.set_node(self)
+
+    def _detach(self, obj: Entity) -> None:
+        obj.set_node(None)
+        del self.entities[obj.id]
+
+    def add_entity(self, obj: Entity) -> None:
+        """
+        Добавить сущность в ноду.
+
+        :param obj: Экземпляр класса, отнаследованного от Entity
+        """
+        if obj.node == self:
+            return
+        self._attach(obj)
         obj.subscribe()
         obj.publish_discovery()
         obj.publish_state()
 
+    def add_entities(self, objs: t.Iterable[Entity], reconcile: bool = False) -> 'Completion':
+        """
+        Добавить много сущностей сразу. В отличие от add_entity(), командные топики всех сущностей
+        подписываются одним SUBSCRIBE-пакетом, а discovery и начальные состояния публикуются подряд,
+        не дожидаясь подтверждений от брокера.
+
+        С reconcile=True (режим старта, нужен retain_discovery) нода сначала забирает с брокера свои
+        retained discovery (см. retained_discovery()) и публикует discovery только новых и изменившихся
+        сущностей. Retained discovery сущностей, которых в ноде больше нет, очищаются.
+        При перезапуске без изменений discovery не публикуется вообще, и Home Assistant не перечитывает сущности.
+
+        :param objs: Сущности
+        :param reconcile: Сверить discovery с retained-сообщениями на брокере
+        :return: Completion, по которому можно дождаться доставки всех discovery и состояний.
+                 Если вызов вложен в другую пакетную операцию, эти публикации попадут и в ее Completion
+        """
+        if reconcile:
+            self.known_discovery = self.retained_discovery()
+        try:
+            added = []
+            for obj in objs:
+                if obj.node == self:
+                    continue
+                self._attach(obj)
+                added.append(obj)
+
+            self.subscribe_commands(obj for obj in added if type(obj).subscribe is Entity.subscribe)
+            for obj in added:
+                if type(obj).subscribe is not Entity.subscribe:
+                    obj.subscribe()
+
+            with self._collect() as completion, self.batch():
+                for obj in added:
+                    obj.publish_discovery()
+                for obj in added:
+                    obj.publish_state()
+                if reconcile:
+                    self.clear_stale_discovery(self.known_discovery, self.entities.values())
+        finally:
+            if reconcile:
+                self.known_discovery = None
+        return completion
+
+    def retained_discovery(self, timeout: float = 5.0, settle: float = 0.5) -> dict[str, bytes]:
+        """
+        Забрать с брокера retained discovery этой ноды: нода ненадолго подписывается на
+        '{discovery_prefix}/+/{node.id}/+/config', брокер сразу присылает все retained-сообщения.
+        Сбор заканчивается, когда settle секунд не приходит новых сообщений, но не позже timeout.
+        Нужен работающий сетевой цикл клиента в другом потоке (loop_start()), поэтому не для AsyncNode.
+
+        :return: Топик -> хэш discovery (см. discovery_digest())
+        """
+        if not self.retain_discovery:
+            raise RuntimeError('Discovery reconciliation requires retain_discovery')
+        pattern = f'{self.discovery_prefix}/+/{self.id}/+/config'
+        found: dict[str, bytes] = {}
+        cond = threading.Condition()
+        last = time.monotonic()
+
+        def on_config(client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+            nonlocal last
+            if not msg.retain or not msg.payload:
+                return
+            with cond:
+                found[msg.topic] = self.discovery_digest(msg.payload)
+                last = time.monotonic()
+
+        self.client.message_callback_add(pattern, on_config)
+        self.client.subscribe(pattern, 1)
+        try:
+            deadline = last + timeout
+            with cond:
+                while (now := time.monotonic()) < deadline and now - last < settle:
+                    cond.wait(min(deadline, last + settle) - now)
+        finally:
+            self.client.unsubscribe(pattern)
+            self.client.message_callback_remove(pattern)
+        with cond:
+            return dict(found)
+
+    @staticmethod
+    def discovery_digest(payload: bytes) -> bytes:
+        """
+        :return: Хэш discovery JSON, по которому сверяются retained-сообщения
+        """
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def discovery_unchanged(self, topic: str, payload: bytes) -> bool:
+        """
+        Проверить (во время сверки, см. add_entities(reconcile=True)), лежит ли на брокере такой же discovery.
+        Проверенный топик убирается из known_discovery.
+
+        :return: True, если публиковать discovery не нужно
+        """
+        known = self.known_discovery
+        if known is None or known.pop(topic, None) != self.discovery_digest(payload):
+            return False
+        if self.metrics is not None:
+            self.metrics.inc('pyhass_mqtt_discovery_skipped_total', 1, 'Discovery publishes skipped by reconciliation')
+        return True
+
+    def clear_stale_discovery(self, known: dict[str, bytes], objs: t.Iterable[Entity]) -> int:
+        """
+        Очистить retained discovery из known, которым не соответствует ни одна из сущностей objs.
+
+        :return: Сколько discovery очищено
+        """
+        keep = {obj.discovery_topic for obj in objs}
+        stale = [topic for topic in known if topic not in keep]
+        for topic in stale:
+            self.publish(topic, b'', 1, True)
+        return len(stale)
+
     def remove_entity(self, obj: str | Entity) -> None:
         """
         Удалить сущность из ноды
@@ -156,12 +707,152 @@ class Node:
             obj = self.entities[obj]
         obj.unpublish_discovery()
         obj.unsubscribe()
-        obj.set_node(None)
-        del self.entities[obj.unique_id]
+        self._detach(obj)
 
-    def publish_state_all(self) -> None:
-        for obj in self.entities.values():
-            obj.publish_state()
+    def remove_entities(self, objs: t.Iterable[str | Entity]) -> 'Completion':
+        """
+        Удалить много сущностей сразу. Отписка от командных топиков - одним UNSUBSCRIBE-пакетом.
+
+        :param objs: Строки с id сущностей или сами сущности
+        :return: Completion, по которому можно дождаться доставки всех пустых discovery.
+                 Если вызов вложен в другую пакетную операцию, эти публикации попадут и в ее Completion
+        """
+        removed = [self.entities[obj] if isinstance(obj, str) else obj for obj in objs]
+        with self._collect() as completion:
+            for obj in removed:
+                obj.unpublish_discovery()
+        self.release_entities(removed)
+        return completion
+
+    def release_entities(self, objs: t.Iterable[str | Entity]) -> list[Entity]:
+        """
+        Отцепить сущности от ноды, не снимая их discovery: Home Assistant их не потеряет.
+        Нужно, чтобы передать сущности другой ноде с тем же id (например, другому шарду, см. ShardedNode).
+
+        :param objs: Строки с id сущностей или сами сущности
+        :return: Отцепленные сущности
+        """
+        released = [self.entities[obj] if isinstance(obj, str) else obj for obj in objs]
+        self.unsubscribe_commands(obj for obj in released if type(obj).unsubscribe is Entity.unsubscribe)
+        for obj in released:
+            if type(obj).unsubscribe is not Entity.unsubscribe:
+                obj.unsubscribe()
+        for obj in released:
+            self._detach(obj)
+        return released
+
+    def command_pattern(self, suffix: str) -> str:
+        """
+        :return: Wildcard-топик, по которому нода принимает команды с суффиксом suffix для всех своих сущностей
+        """
+        return f'{self.id}/+/{suffix}'
+
+    def _command_subscription(self, entity_id: str, suffix: str, count: int) -> str | None:
+        # Топик, на который надо (от)писаться ради обработчика (entity_id, suffix), если count - число
+        # остальных обработчиков этого суффикса. None - подписка общая и еще нужна другим
+        if not self.command_wildcard:
+            return f'{self.id}/{entity_id}/{suffix}'
+        return None if count else self.command_pattern(suffix)
+
+    def subscribe_commands(self, objs: t.Iterable[Entity]) -> None:
+        """
+        Зарегистрировать обработчики команд сущностей (см. Entity.command_handlers()) в диспетчере ноды.
+        На каждый новый суффикс нода подписывается на '{node.id}/+/{suffix}' (с command_wildcard=False -
+        на командный топик каждой сущности), все новые подписки - одним пакетом.
+        Повторная регистрация того же обработчика ничего не делает.
+        """
+        patterns = []
+        for obj in objs:
+            for suffix, handler in obj.command_handlers().items():
+                key = (obj.id, suffix)
+                if key in self._handlers:
+                    self._handlers[key] = handler
+                    continue
+                self._handlers[key] = handler
+                count = self._suffixes.get(suffix, 0)
+                self._suffixes[suffix] = count + 1
+                pattern = self._command_subscription(obj.id, suffix, count)
+                if pattern is not None:
+                    self.client.message_callback_add(pattern, self._dispatch_command)
+                    patterns.append((pattern, self.command_qos))
+        if patterns:
+            self.client.subscribe(patterns)
+
+    def unsubscribe_commands(self, objs: t.Iterable[Entity]) -> None:
+        """
+        Убрать обработчики команд сущностей из диспетчера ноды.
+        От '{node.id}/+/{suffix}' нода отписывается, когда у суффикса не осталось обработчиков
+        (с command_wildcard=False - сразу от командного топика сущности).
+        """
+        patterns = []
+        for obj in objs:
+            for suffix in obj.command_handlers():
+                if self._handlers.pop((obj.id, suffix), None) is None:
+                    continue
+                count = self._suffixes.pop(suffix) - 1
+                if count:
+                    self._suffixes[suffix] = count
+                pattern = self._command_subscription(obj.id, suffix, count)
+                if pattern is not None:
+                    self.client.message_callback_remove(pattern)
+                    patterns.append(pattern)
+        if patterns:
+            self.client.unsubscribe(patterns)
+
+    def resubscribe(self) -> None:
+        """
+        Заново подписаться на командные топики ноды (например, после переподключения к брокеру).
+        Уходит один SUBSCRIBE-пакет на столько топиков, сколько разных суффиксов, а не сущностей
+        (с command_wildcard=False - по топику на каждый обработчик).
+        """
+        if not self.command_wildcard:
+            if self._handlers:
+                self.client.subscribe([(f'{self.id}/{entity_id}/{suffix}', self.command_qos)
+                                       for entity_id, suffix in self._handlers])
+        elif self._suffixes:
+            self.client.subscribe([(self.command_pattern(suffix), self.command_qos) for suffix in self._suffixes])
+
+    def _dispatch_command(self, client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+        rest, _, suffix = msg.topic.rpartition('/')
+        entity_id = rest[len(self.id) + 1:]
+        handler = self._handlers.get((entity_id, suffix))
+        if handler is None:
+            return
+        if self.executor is not None:
+            self.executor.submit(entity_id, suffix, functools.partial(self._run_handler, handler),
+                                 client, userdata, msg)
+            if self.metrics is not None:
+                self.metrics.inc('pyhass_mqtt_commands_total', 1, 'Dispatched commands', suffix=suffix)
+            return
+        if self.metrics is None:
+            self._run_handler(handler, client, userdata, msg)
+            return
+        started = time.perf_counter()
+        self._run_handler(handler, client, userdata, msg)
+        self.metrics.inc('pyhass_mqtt_commands_total', 1, 'Dispatched commands', suffix=suffix)
+        self.metrics.observe('pyhass_mqtt_command_seconds', time.perf_counter() - started,
+                             'Command dispatch duration', suffix=suffix)
+
+    def _run_handler(self, handler: t.Callable[[mqtt.Client, t.Any, mqtt.MQTTMessage], t.Any],
+                     client: mqtt.Client, userdata: t.Any, msg: mqtt.MQTTMessage) -> None:
+        # Ответ на команду (новое состояние) не должен ждать за накопленным в outbox
+        local = self._local
+        local.command = True
+        try:
+            handler(client, userdata, msg)
+        finally:
+            local.command = False
+
+    def publish_state_all(self, force: bool = False) -> 'Completion':
+        """
+        Опубликовать состояния всех сущностей (по их publish_policy, с force=True - все).
+
+        :return: Completion опубликованных состояний
+        """
+        with self._collect() as completion, self.batch():
+            for obj in self.entities.values():
+                obj.publish_state(force)
+        return completion
 
     def publish_discovery_all(self) -> None:
         for obj in self.entities.values():
@@ -178,3 +869,43 @@ class Node:
     def unsubscribe_all(self) -> None:
         for obj in self.entities.values():
             obj.unsubscribe()
+
+
+class Completion:
+    """
+    Результат пакетной операции ноды: набор публикаций, отправленных без ожидания подтверждения.
+    Для ноды с pipeline это квитанции очереди (см. PipelineTicket): публикация считается завершенной,
+    когда публикатор отдал сообщение клиенту и брокер его подтвердил.
+    """
+    __slots__ = ('infos',)
+
+    def __init__(self, infos: list[mqtt.MQTTMessageInfo | PipelineTicket]) -> None:
+        self.infos = infos
+
+    def __len__(self) -> int:
+        return len(self.infos)
+
+    @property
+    def done(self) -> bool:
+        """
+        True, если все публикации подтверждены брокером (для QoS 0 - отправлены)
+        """
+        return all(info.is_published() for info in self.infos)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Дождаться подтверждения всех публикаций.
+
+        :param timeout: Общий таймаут в секундах, None - ждать бесконечно
+        :return: True, если все публикации подтверждены до истечения таймаута
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for info in self.infos:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                info.wait_for_publish(remaining)
+            except (RuntimeError, ValueError):
+                return False
+            if not info.is_published():
+                return False
+        return True
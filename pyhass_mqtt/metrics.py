@@ -0,0 +1,227 @@
+import bisect
+import http.server
+import math
+import threading
+import typing as t
+from . import enums, models
+from .main import Entity
+
+
+__all__ = [
+    'Registry',
+    'MetricSensor',
+]
+
+
+def _labels_key(labels: dict[str, t.Any]) -> tuple[tuple[str, str], ...]:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: tuple[tuple[str, str], ...], extra: tuple[tuple[str, str], ...] = ()) -> str:
+    items = key + extra
+    if not items:
+        return ''
+    escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in items)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Counter:
+    type_ = 'counter'
+
+    def __init__(self, name: str, help_: str) -> None:
+        self.name = name
+        self.help = help_
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, value: float, key: tuple) -> None:
+        self.values[key] = self.values.get(key, 0) + value
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> t.Iterator[str]:
+        for key, value in self.values.items():
+            yield f'{self.name}{_format_labels(key)} {_format_value(value)}'
+
+
+class _Gauge:
+    type_ = 'gauge'
+
+    def __init__(self, name: str, help_: str) -> None:
+        self.name = name
+        self.help = help_
+        # По набору меток: функция, вычисляющая значение
+        self.fns: dict[tuple, t.Callable[[], float]] = {}
+
+    def total(self) -> float:
+        return sum(fn() for fn in self.fns.values())
+
+    def render(self) -> t.Iterator[str]:
+        for key, fn in self.fns.items():
+            yield f'{self.name}{_format_labels(key)} {_format_value(fn())}'
+
+
+class _Histogram:
+    type_ = 'histogram'
+
+    def __init__(self, name: str, help_: str, buckets: t.Sequence[float]) -> None:
+        self.name = name
+        self.help = help_
+        self.buckets = tuple(sorted(buckets))
+        # По набору меток: счетчики по корзинам (последняя - +Inf), сумма
+        self.values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, key: tuple) -> None:
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1][0] += value
+
+    def total(self) -> float:
+        return sum(sum(counts) for counts, _ in self.values.values())
+
+    def render(self) -> t.Iterator[str]:
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for le, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield f'{self.name}_bucket{_format_labels(key, (("le", _format_value(le)),))} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(key)} {_format_value(total[0])}'
+            yield f'{self.name}_count{_format_labels(key)} {cumulative}'
+
+
+class Registry:
+    """
+    Реестр метрик: счетчики, гистограммы и вычисляемые gauge. Отдается в текстовом формате Prometheus
+    (render() или встроенный HTTP-сервер serve()).
+
+    Метрики создаются при первом обращении. Инструментированные объекты (Node, zont.API) пишут метрики,
+    только если к ним подключен реестр, так что без реестра накладные расходы - одна проверка на None.
+    """
+    DEFAULT_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                                          1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Counter | _Gauge | _Histogram] = {}
+        self._lock = threading.Lock()
+        self._server: http.server.ThreadingHTTPServer | None = None
+
+    def _get(self, name: str, factory: t.Callable[[], t.Any]) -> t.Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = factory()
+        return metric
+
+    def inc(self, name: str, value: float = 1, help_: str = '', **labels: t.Any) -> None:
+        """
+        Увеличить счетчик name с метками labels на value.
+        """
+        counter = self._get(name, lambda: _Counter(name, help_))
+        with self._lock:
+            counter.inc(value, _labels_key(labels))
+
+    def observe(self, name: str, value: float, help_: str = '', buckets: t.Sequence[float] | None = None,
+                **labels: t.Any) -> None:
+        """
+        Добавить наблюдение value в гистограмму name с метками labels.
+        """
+        histogram = self._get(name, lambda: _Histogram(name, help_, buckets or self.DEFAULT_BUCKETS))
+        with self._lock:
+            histogram.observe(value, _labels_key(labels))
+
+    def gauge(self, name: str, fn: t.Callable[[], float], help_: str = '', **labels: t.Any) -> None:
+        """
+        Зарегистрировать gauge, значение которого вычисляется функцией fn в момент выгрузки.
+        Несколько объектов (например, ноды-шарды) регистрируют одну метрику с разными метками.
+
+        :raise ValueError: gauge с таким именем и метками уже есть или имя занято метрикой другого типа
+        """
+        key = _labels_key(labels)
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = _Gauge(name, help_)
+            elif not isinstance(metric, _Gauge):
+                raise ValueError(f'Metric "{name}" is already registered as {metric.type_}')
+            if key in metric.fns:
+                raise ValueError(f'Gauge "{name}{_format_labels(key)}" is already registered')
+            metric.fns[key] = fn
+
+    def value(self, name: str) -> float:
+        """
+        :return: Текущее значение метрики, просуммированное по всем меткам (для гистограммы - число наблюдений)
+        """
+        metric = self._metrics.get(name)
+        if metric is None:
+            return 0
+        with self._lock:
+            return metric.total()
+
+    def render(self) -> str:
+        """
+        :return: Все метрики в текстовом формате Prometheus
+        """
+        lines = []
+        with self._lock:
+            for metric in self._metrics.values():
+                if metric.help:
+                    lines.append(f'# HELP {metric.name} {metric.help}')
+                lines.append(f'# TYPE {metric.name} {metric.type_}')
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int = 9464, host: str = '127.0.0.1') -> http.server.ThreadingHTTPServer:
+        """
+        Запустить в фоновом потоке HTTP-сервер, отдающий метрики по GET /metrics.
+
+        :return: Сервер. Остановить - server.shutdown()
+        """
+        registry = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: t.Any) -> None:
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, name='metrics-http', daemon=True).start()
+        return self._server
+
+
+class MetricSensor(Entity):
+    """
+    Диагностический датчик Home Assistant, публикующий значение метрики из реестра
+    (сумму по всем меткам). Добавляется в ноду как обычная сущность.
+    """
+    __slots__ = ('registry', 'metric')
+
+    def __init__(self, id_: str, registry: Registry, metric: str) -> None:
+        super().__init__(id_, model_cls=models.Sensor)
+        self.registry = registry
+        self.metric = metric
+        self.model.name = metric
+        self.model.entity_category = enums.EntityCategory.diagnostic
+        self.model.state_class = enums.SensorStateClass.measurement
+
+    def get_state(self) -> str:
+        return _format_value(self.registry.value(self.metric))
@@ -4,13 +4,214 @@ from .enums import *
 
 
 class Model(pydantic.BaseModel):
+    """
+    Базовая модель. Кэширует закодированный discovery-пакет и сбрасывает кэш при присваивании любого поля.
+    Изменения вложенных моделей (например, Device) отслеживаются по их счетчику версий.
+    Мутация списков на месте (model.availability.append(...)) не отслеживается - в этом случае
+    нужно вызвать invalidate_discovery() вручную.
+    """
+    # Сколько раз discovery-пакет реально сериализовался (на все модели процесса). Метрика для проверки кэша
+    discovery_encodes: t.ClassVar[int] = 0
+
+    _version: int = pydantic.PrivateAttr(0)
+    _discovery_cache: tuple[tuple, bytes] | None = pydantic.PrivateAttr(None)
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        super().__setattr__(name, value)
+        if name in self.model_fields:
+            self.invalidate_discovery()
+
+    def invalidate_discovery(self) -> None:
+        """
+        Сбросить кэш discovery-пакета и увеличить версию модели
+        """
+        # Приватные атрибуты pydantic трогаем напрямую: через __getattr__/__setattr__ это заметно медленнее
+        private = self.__pydantic_private__
+        private['_version'] += 1
+        private['_discovery_cache'] = None
+
+    @property
+    def version(self) -> int:
+        """
+        Версия модели: растет при каждом присваивании поля (изменения вложенных моделей не учитываются)
+        """
+        return self.__pydantic_private__['_version']
+
+    @classmethod
+    def _nested_fields(cls) -> tuple[str, ...]:
+        """
+        :return: Имена полей, в которых могут лежать вложенные модели. Вычисляется один раз на класс
+        """
+        nested = cls.__dict__.get('_nested_fields_')
+        if nested is None:
+            def has_model(annotation: t.Any) -> bool:
+                if isinstance(annotation, type) and issubclass(annotation, Model):
+                    return True
+                return any(has_model(arg) for arg in t.get_args(annotation))
+            nested = tuple(name for name, field in cls.model_fields.items() if has_model(field.annotation))
+            type.__setattr__(cls, '_nested_fields_', nested)
+        return nested
+
+    def _discovery_stamp(self) -> tuple:
+        """
+        :return: Кортеж версий этой модели и всех вложенных моделей. Если он не изменился - кэш актуален
+        """
+        stamp = [self.__pydantic_private__['_version']]
+        for name in self._nested_fields():
+            value = self.__dict__.get(name)
+            if isinstance(value, Model):
+                stamp.append(value._discovery_stamp())
+            elif isinstance(value, list) and value and isinstance(value[0], Model):
+                stamp.extend(v._discovery_stamp() for v in value)
+        return tuple(stamp)
+
+    def discovery_payload(self) -> bytes:
+        """
+        Закодированный JSON-пакет для Home Assistant MQTT discovery. Сериализуется только при изменении модели.
+
+        :return: bytes, содержащие JSON discovery-пакета
+        """
+        stamp = self._discovery_stamp()
+        private = self.__pydantic_private__
+        cache = private['_discovery_cache']
+        if cache is None or cache[0] != stamp:
+            cache = (stamp, self._encode_discovery())
+            private['_discovery_cache'] = cache
+        return cache[1]
+
+    def _encode_discovery(self) -> bytes:
+        Model.discovery_encodes += 1
+        return self.model_dump_json(exclude_none=True, exclude={'discovery_class_'}).encode()
+
     def discovery_json(self) -> str:
         """
         Выгрузить JSON-описание, совместимое с Home Assistant MQTT discovery
 
         :return: Строка, содержащая JSON discovery-пакета
         """
-        return self.json(exclude_none=True, exclude={'discovery_class_'})
+        return self.discovery_payload().decode()
+
+    def view(self, **overrides: t.Any) -> 'ModelView':
+        """
+        Создать модель сущности на основе этой модели как шаблона (см. ModelView).
+        Метод подходит как фабрика модели для Entity: Entity(id_, model_cls=template.view)
+        """
+        return ModelView(self, **overrides)
+
+
+class ModelView:
+    """
+    Модель сущности поверх общего шаблона. Тысячи однотипных сущностей (например, датчики температуры)
+    делят один экземпляр модели-шаблона с общими полями (icon, device_class, точность и т.п.), а сами
+    хранят только отличающиеся поля (unique_id, топики, name). Полная модель собирается только
+    для сериализации discovery, в кэше остается только готовый пакет.
+
+    Чтение поля возвращает свое значение или значение шаблона, запись меняет только свои поля
+    (шаблон не трогается). Изменение шаблона видно всем его сущностям: версия шаблона входит
+    в штамп кэша discovery, так что их пакеты пересериализуются.
+    """
+    __slots__ = ('template', 'overrides', '_version', '_discovery_cache')
+
+    def __init__(self, template: Model, **overrides: t.Any) -> None:
+        """
+        :param template: Модель-шаблон
+        :param overrides: Собственные значения полей
+        """
+        object.__setattr__(self, 'template', template)
+        object.__setattr__(self, 'overrides', {})
+        object.__setattr__(self, '_version', 0)
+        object.__setattr__(self, '_discovery_cache', None)
+        for name, value in overrides.items():
+            setattr(self, name, value)
+
+    def __getattr__(self, name: str) -> t.Any:
+        # Сюда попадаем за полями модели и ее ClassVar: слоты и методы вида находятся обычным путем.
+        # Методы шаблона не отдаем: они работали бы с данными шаблона без собственных полей
+        overrides = self.overrides
+        if name in overrides:
+            return overrides[name]
+        cls = type(self.template)
+        if name in cls.model_fields or name in cls.__class_vars__:
+            return getattr(self.template, name)
+        raise AttributeError(f'"{type(self).__name__}" of "{cls.__name__}" has no attribute "{name}"')
+
+    def __setattr__(self, name: str, value: t.Any) -> None:
+        template = self.template
+        if name not in type(template).model_fields:
+            raise ValueError(f'"{type(template).__name__}" object has no field "{name}"')
+        inherited = template.__dict__[name]
+        # Совпадающие с шаблоном значения не храним. Модели и списки - только тот же самый объект
+        if value is inherited or (not isinstance(value, (Model, list)) and value == inherited):
+            self.overrides.pop(name, None)
+        else:
+            self.overrides[name] = value
+        self.invalidate_discovery()
+
+    @property
+    def model_fields(self) -> dict[str, t.Any]:
+        return type(self.template).model_fields
+
+    def invalidate_discovery(self) -> None:
+        """
+        Сбросить кэш discovery-пакета и увеличить версию модели
+        """
+        object.__setattr__(self, '_version', self._version + 1)
+        object.__setattr__(self, '_discovery_cache', None)
+
+    @property
+    def version(self) -> int:
+        """
+        Версия модели с учетом шаблона: обе версии только растут, так что их сумма меняется при изменении любой
+        """
+        return self._version + self.template.version
+
+    def _discovery_stamp(self) -> tuple:
+        stamp = [self._version, self.template._discovery_stamp()]
+        for value in self.overrides.values():
+            if isinstance(value, Model):
+                stamp.append(value._discovery_stamp())
+            elif isinstance(value, list) and value and isinstance(value[0], Model):
+                stamp.extend(v._discovery_stamp() for v in value)
+        return tuple(stamp)
+
+    def materialize(self) -> Model:
+        """
+        :return: Полная модель: копия шаблона с собственными полями
+        """
+        return self.template.model_copy(update=self.overrides)
+
+    def model_dump(self, **kwargs: t.Any) -> dict[str, t.Any]:
+        """
+        Model.model_dump() полной модели (см. materialize())
+        """
+        return self.materialize().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs: t.Any) -> str:
+        """
+        Model.model_dump_json() полной модели (см. materialize())
+        """
+        return self.materialize().model_dump_json(**kwargs)
+
+    def model_copy(self, update: dict[str, t.Any] | None = None, deep: bool = False) -> Model:
+        """
+        :return: Полная модель (см. materialize()) с изменениями из update. Шаблон и вид не меняются
+        """
+        return self.materialize().model_copy(update=update, deep=deep)
+
+    def discovery_payload(self) -> bytes:
+        """
+        Закодированный JSON-пакет для Home Assistant MQTT discovery. Сериализуется только при изменении
+        собственных полей, шаблона или вложенных моделей.
+        """
+        stamp = self._discovery_stamp()
+        cache = self._discovery_cache
+        if cache is None or cache[0] != stamp:
+            cache = (stamp, self.materialize()._encode_discovery())
+            object.__setattr__(self, '_discovery_cache', cache)
+        return cache[1]
+
+    def discovery_json(self) -> str:
+        return self.discovery_payload().decode()
 
 
 class Device(Model):
@@ -38,6 +239,11 @@ class Entity(Model):
     """
     Базовая модель для всех MQTT-сущностей HA
     """
+    # Поле, в которое пишется шаблон извлечения состояния из state_topic (см. StateGroup). None - такого поля нет
+    state_template_field_: t.ClassVar[str | None] = None
+    # Поля с фиксированными значениями состояния: их payload кодируются один раз (см. pyhass_mqtt.Entity)
+    state_payload_fields_: t.ClassVar[tuple[str, ...]] = ()
+
     unique_id: str | None = None
     object_id: str | None = None
     name: str | None = None
@@ -46,8 +252,9 @@ class Entity(Model):
     retain: bool = False
     encoding: str | None = 'utf-8'
     icon: str | None = None
+    entity_category: EntityCategory | None = None
     availability: list[Availability] | None = None
-    availability_mode: Availability | None = None
+    availability_mode: AvailabilityMode | None = None
 
 
 class WaterHeater(Entity):
@@ -85,6 +292,8 @@ class BinarySensor(Entity):
     Двоичный датчик. Может возвращать только два состояния
     """
     discovery_class_: str = 'binary_sensor'
+    state_template_field_: t.ClassVar[str | None] = 'value_template'
+    state_payload_fields_: t.ClassVar[tuple[str, ...]] = ('payload_on', 'payload_off')
 
     expire_after: int | None = None
     force_update: bool | None = None
@@ -103,6 +312,7 @@ class Sensor(Entity):
     следует указывать подходящие единицы измерения в поле unit_of_measurement.
     """
     discovery_class_: str = 'sensor'
+    state_template_field_: t.ClassVar[str | None] = 'value_template'
 
     expire_after: int | None = None
     force_update: bool | None = None
@@ -120,6 +330,8 @@ class Switch(Entity):
     Простейший эффектор с двумя состояниями.
     """
     discovery_class_: str = 'switch'
+    state_template_field_: t.ClassVar[str | None] = 'value_template'
+    state_payload_fields_: t.ClassVar[tuple[str, ...]] = ('state_on', 'state_off')
 
     command_topic: str | None = None
     device_class: SwitchDeviceClass | None = None
@@ -129,6 +341,7 @@ class Switch(Entity):
     payload_on: str | None = None
     state_off: str | None = None
     state_on: str | None = None
+    value_template: str | None = None
 
 
 class Fan(Entity):
@@ -136,6 +349,8 @@ class Fan(Entity):
     Вентилятор/вентиляционная система
     """
     discovery_class_: str = 'fan'
+    state_template_field_: t.ClassVar[str | None] = 'state_value_template'
+    state_payload_fields_: t.ClassVar[tuple[str, ...]] = ('payload_on', 'payload_off')
 
     state_topic: str | None = None
     state_value_template: str | None = None
@@ -173,6 +388,8 @@ class Light(Entity):
     Освещение, в т.ч. регулируемой яркости и цвета.
     """
     discovery_class_: str = 'light'
+    state_template_field_: t.ClassVar[str | None] = 'state_value_template'
+    state_payload_fields_: t.ClassVar[tuple[str, ...]] = ('payload_on', 'payload_off')
 
     brightness_command_topic: str | None = None
     brightness_command_template: str | None = None
@@ -227,6 +444,7 @@ class Number(Entity):
     Эффектор с float-состоянием.
     """
     discovery_class_: str = 'number'
+    state_template_field_: t.ClassVar[str | None] = 'value_template'
 
     command_template: str | None = None
     command_topic: str | None = None
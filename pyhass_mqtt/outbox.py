@@ -0,0 +1,331 @@
+import collections
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+import typing as t
+
+
+__all__ = [
+    'Outbox',
+]
+
+
+logger = logging.getLogger(__name__)
+
+# Заголовок файла: сигнатура, версия, емкость кольца, логические позиции начала и конца записей
+_HEADER = struct.Struct('<4sIQQQ')
+_HEADER_SIZE = 64
+_MAGIC = b'PHMO'
+_VERSION = 1
+_HEAD_OFFSET = 16
+_TAIL_OFFSET = 24
+# Заголовок записи: полная длина записи, QoS, retain, длина топика, время постановки (unix time)
+_RECORD = struct.Struct('<IBBHd')
+
+Publish = t.Callable[[str, bytes, int, bool], t.Any]
+
+
+class Outbox:
+    """
+    Исходящий буфер на диске для времени без соединения с брокером (см. Node(outbox=...)).
+    Пока нода не подключена, ее публикации не уходят в память paho-клиента, а дописываются в кольцевой
+    файл, отображенный в память (mmap): записи (топик, payload, QoS, retain, время) идут подряд,
+    при нехватке места затираются самые старые. Память процесса не растет, сколько бы ни длился обрыв,
+    а записанное переживает перезапуск процесса (данные лежат в page cache ядра; от потери питания
+    защищает только flush()).
+
+    После подключения буфер отправляется в фоновом потоке не быстрее rate сообщений в секунду
+    и после случайной задержки до jitter секунд, чтобы много нод, переподключившихся к брокеру
+    одновременно, не завалили его разом. По умолчанию в каждый топик уходит только последнее значение
+    (для состояний и discovery промежуточные не нужны), с history=True - вся история по порядку.
+    Пока буфер не пуст, новые публикации тоже встают в его конец, так что порядок сообщений в топике
+    сохраняется. Исключение - срочные публикации (доступность ноды, ответы на команды, см. offer(urgent=True)):
+    при соединении они уходят сразу, а более ранние записи в тот же топик при отправке пропускаются.
+
+    Не подходит для AsyncNode: отправка идет из своего потока, а не из event loop.
+    """
+    def __init__(self, path: str | os.PathLike, size: int = 16 * 1024 * 1024, history: bool = False,
+                 rate: float = 200.0, jitter: float = 1.0, max_age: float | None = None,
+                 clock: t.Callable[[], float] = time.time) -> None:
+        """
+        :param path: Файл буфера. Если он уже есть, записи из него будут отправлены после подключения
+        :param size: Емкость кольца в байтах
+        :param history: Отправлять все сообщения, а не только последнее в каждый топик
+        :param rate: Сколько сообщений в секунду отправлять после подключения. 0 - без ограничения
+        :param jitter: Наибольшая случайная задержка перед отправкой, секунды
+        :param max_age: Не отправлять сообщения старше стольких секунд. None - отправлять все
+        :param clock: Часы для времени записей, секунды
+        """
+        self.path = os.fspath(path)
+        self.capacity = size
+        self.history = history
+        self.rate = rate
+        self.jitter = jitter
+        self.max_age = max_age
+        self.clock = clock
+        self.appended = 0
+        self.replayed = 0
+        self.dropped = 0
+        self.expired = 0
+        self.superseded = 0
+        # Идет ли отправка буфера (см. replay())
+        self.replaying = False
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        # Топик -> позиция, записи до которой в этот топик устарели: новое значение ушло мимо буфера
+        self._superseded: dict[str, int] = {}
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != _HEADER_SIZE + size:
+            os.ftruncate(self._fd, _HEADER_SIZE + size)
+        self._map = mmap.mmap(self._fd, _HEADER_SIZE + size)
+        self.head = 0
+        self.tail = 0
+        self.count = 0
+        self._load()
+
+    def _load(self) -> None:
+        magic, version, capacity, head, tail = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION or capacity != self.capacity or not 0 <= tail - head <= capacity:
+            if magic == _MAGIC:
+                logger.warning('Outbox "%s" has incompatible layout, discarding it', self.path)
+            _HEADER.pack_into(self._map, 0, _MAGIC, _VERSION, self.capacity, 0, 0)
+            return
+        self.head = head
+        self.tail = pos = head
+        # Запись дописывается до сдвига tail, так что оборванных записей быть не должно,
+        # но битый файл не должен валить ноду: останавливаемся на первой невозможной длине
+        while pos < tail:
+            length = _RECORD.unpack(self._read(pos, _RECORD.size))[0]
+            if length < _RECORD.size or pos + length > tail:
+                logger.warning('Outbox "%s" is corrupted at %d, dropping the rest', self.path, pos)
+                break
+            pos += length
+            self.count += 1
+        self._set_tail(pos)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def used(self) -> int:
+        """
+        Сколько байт кольца занято
+        """
+        return self.tail - self.head
+
+    def _write(self, pos: int, data: bytes) -> None:
+        offset = pos % self.capacity
+        first = min(len(data), self.capacity - offset)
+        start = _HEADER_SIZE + offset
+        self._map[start:start + first] = data[:first]
+        if first < len(data):
+            self._map[_HEADER_SIZE:_HEADER_SIZE + len(data) - first] = data[first:]
+
+    def _read(self, pos: int, size: int) -> bytes:
+        offset = pos % self.capacity
+        first = min(size, self.capacity - offset)
+        start = _HEADER_SIZE + offset
+        data = self._map[start:start + first]
+        if first < size:
+            data += self._map[_HEADER_SIZE:_HEADER_SIZE + size - first]
+        return data
+
+    def _set_head(self, head: int) -> None:
+        self.head = head
+        struct.pack_into('<Q', self._map, _HEAD_OFFSET, head)
+
+    def _set_tail(self, tail: int) -> None:
+        self.tail = tail
+        struct.pack_into('<Q', self._map, _TAIL_OFFSET, tail)
+
+    def _record(self, pos: int) -> tuple[int, float, str, bytes, int, bool]:
+        length, qos, retain, topic_size, timestamp = _RECORD.unpack(self._read(pos, _RECORD.size))
+        body = self._read(pos + _RECORD.size, length - _RECORD.size)
+        return length, timestamp, body[:topic_size].decode(), body[topic_size:], qos, bool(retain)
+
+    def _topic(self, pos: int) -> tuple[int, str]:
+        length, _, _, topic_size, _ = _RECORD.unpack(self._read(pos, _RECORD.size))
+        return length, self._read(pos + _RECORD.size, topic_size).decode()
+
+    def _pop(self) -> None:
+        self._set_head(self.head + _RECORD.unpack(self._read(self.head, _RECORD.size))[0])
+        self.count -= 1
+
+    def append(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> bool:
+        """
+        Дописать сообщение в буфер, затерев самые старые, если не хватает места.
+
+        :return: False, если сообщение больше всего буфера и не записано
+        """
+        with self._lock:
+            return self._append(topic, payload, qos, retain)
+
+    def _append(self, topic: str, payload: bytes, qos: int, retain: bool) -> bool:
+        encoded = topic.encode()
+        length = _RECORD.size + len(encoded) + len(payload)
+        if length > self.capacity:
+            self.dropped += 1
+            return False
+        # Сначала освобождаем место и сдвигаем head, потом пишем запись и только после нее сдвигаем tail:
+        # при падении посередине файл остается целым
+        while self.tail - self.head + length > self.capacity:
+            self._pop()
+            self.dropped += 1
+        self._write(self.tail, _RECORD.pack(length, qos, int(retain), len(encoded), self.clock()) + encoded + payload)
+        self._set_tail(self.tail + length)
+        self.count += 1
+        self.appended += 1
+        return True
+
+    def offer(self, topic: str, payload: bytes, qos: int, retain: bool, connected: bool,
+              urgent: bool = False) -> bool:
+        """
+        Записать сообщение в буфер, если его нельзя отправить сразу: нет соединения или в буфере
+        есть более ранние сообщения. Вызывается из Node.publish().
+
+        :param urgent: При соединении отправить сообщение сразу, не дожидаясь буфера. Записи в этот топик,
+                       уже лежащие в буфере, отправлены не будут (с history=True тоже)
+        :return: True, если сообщение записано в буфер и отправлять его сейчас не нужно
+        """
+        with self._lock:
+            if connected and not self.replaying and self.tail == self.head:
+                return False
+            if connected and urgent:
+                self._superseded[topic] = self.tail
+                return False
+            self._append(topic, payload, qos, retain)
+            return True
+
+    def records(self) -> t.Iterator[tuple[float, str, bytes, int, bool]]:
+        """
+        :return: Записи буфера от старых к новым: (время, топик, payload, QoS, retain)
+        """
+        with self._lock:
+            pos, tail = self.head, self.tail
+            found = []
+            while pos < tail:
+                length, *record = self._record(pos)
+                found.append(tuple(record))
+                pos += length
+        return iter(found)
+
+    def replay(self, publish: Publish, active: t.Callable[[], bool] = lambda: True) -> None:
+        """
+        Начать отправку буфера в фоновом потоке (если она еще не идет). Вызывается нодой при подключении.
+
+        :param publish: Функция отправки (topic, payload, qos, retain)
+        :param active: Есть ли соединение. Как только оно пропадет, отправка прервется,
+                       а неотправленное останется в буфере до следующего подключения
+        """
+        with self._lock:
+            if self.replaying or self.tail == self.head:
+                return
+            self.replaying = True
+            self._thread = threading.Thread(target=self._replay, args=(publish, active), name='pyhass-mqtt-outbox',
+                                            daemon=True)
+            self._thread.start()
+
+    def _replay(self, publish: Publish, active: t.Callable[[], bool]) -> None:
+        try:
+            if self.jitter:
+                time.sleep(random.uniform(0, self.jitter))
+            interval = 1 / self.rate if self.rate else 0.0
+            pace = time.monotonic()
+            while True:
+                with self._lock:
+                    if not active() or self.tail == self.head:
+                        if self.tail == self.head:
+                            self._superseded.clear()
+                        self.replaying = False
+                        return
+                    if self.history:
+                        batch = [self.head]
+                        stop = self.head + _RECORD.unpack(self._read(self.head, _RECORD.size))[0]
+                    else:
+                        batch, stop = self._coalesce()
+                oldest = self.clock() - self.max_age if self.max_age is not None else None
+                superseded = self._superseded
+                sent = 0
+                for pos in batch:
+                    # Payload читается только перед отправкой: запись могли успеть затереть новые
+                    with self._lock:
+                        if pos < self.head:
+                            continue
+                        _, timestamp, topic, payload, qos, retain = self._record(pos)
+                    if oldest is not None and timestamp < oldest:
+                        self.expired += 1
+                        continue
+                    if superseded.get(topic, -1) > pos:
+                        self.superseded += 1
+                        continue
+                    if interval:
+                        now = time.monotonic()
+                        if pace > now:
+                            time.sleep(pace - now)
+                        pace = max(now, pace) + interval
+                    if not active():
+                        break
+                    publish(topic, payload, qos, retain)
+                    sent += 1
+                else:
+                    with self._lock:
+                        self.replayed += sent
+                        # Пока мы отправляли, новые записи могли затереть часть отправленных
+                        while self.head < stop:
+                            self._pop()
+                    continue
+                # Соединение пропало: уже отправленные значения при следующем подключении уйдут еще раз,
+                # для состояний и discovery это безвредно
+                with self._lock:
+                    self.replayed += sent
+        except Exception:
+            logger.exception('Outbox replay failed')
+            with self._lock:
+                self.replaying = False
+
+    def _coalesce(self) -> tuple[list[int], int]:
+        # Только позиции последних записей в каждый топик, по порядку; payload здесь не читается
+        last: collections.OrderedDict[str, int] = collections.OrderedDict()
+        pos, tail = self.head, self.tail
+        while pos < tail:
+            length, topic = self._topic(pos)
+            last.pop(topic, None)
+            last[topic] = pos
+            pos += length
+        return list(last.values()), tail
+
+    def flush(self) -> None:
+        """
+        Сбросить буфер на диск (msync). Нужно только для защиты от потери питания.
+        """
+        self._map.flush()
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Дождаться потока отправки (если он идет) и закрыть файл.
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        with self._lock:
+            self._map.flush()
+            self._map.close()
+            os.close(self._fd)
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Счетчики буфера
+        """
+        return {
+            'records': self.count,
+            'bytes': self.used,
+            'appended': self.appended,
+            'replayed': self.replayed,
+            'dropped': self.dropped,
+            'expired': self.expired,
+            'superseded': self.superseded,
+        }
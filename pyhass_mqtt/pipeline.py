@@ -0,0 +1,220 @@
+import collections
+import enum
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+
+__all__ = [
+    'Backpressure',
+    'PipelineFullError',
+    'PipelineTicket',
+    'PublishPipeline',
+]
+
+
+class Backpressure(enum.StrEnum):
+    block = 'block'              # ждать, пока в очереди освободится место (кроме сетевого потока клиента)
+    drop_oldest = 'drop_oldest'  # выбросить самое старое сообщение
+    error = 'error'              # выбросить PipelineFullError
+
+
+class PipelineFullError(RuntimeError):
+    pass
+
+
+class PipelineTicket:
+    """
+    Квитанция о сообщении, поставленном в PublishPipeline. Ведет себя как MQTTMessageInfo
+    (is_published(), wait_for_publish()), поэтому попадает в Completion пакетных операций ноды.
+    Если сообщение в очереди заменили более свежим в тот же топик, квитанция переходит к новому.
+    """
+    __slots__ = ('pipeline', 'info', 'dropped')
+
+    def __init__(self, pipeline: 'PublishPipeline') -> None:
+        self.pipeline = pipeline
+        # MQTTMessageInfo, когда сообщение отдано клиенту
+        self.info: mqtt.MQTTMessageInfo | None = None
+        # Сообщение выброшено из очереди и отправлено не будет
+        self.dropped = False
+
+    def is_published(self) -> bool:
+        return self.info is not None and self.info.is_published()
+
+    def wait_for_publish(self, timeout: float | None = None) -> None:
+        """
+        Дождаться, пока публикатор отдаст сообщение клиенту, а брокер его подтвердит.
+
+        :raises RuntimeError: Сообщение выброшено из очереди
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.pipeline._cond:
+            self.pipeline._cond.wait_for(lambda: self.info is not None or self.dropped, timeout)
+        if self.dropped:
+            raise RuntimeError('Message was dropped by publish pipeline')
+        if self.info is not None:
+            self.info.wait_for_publish(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+
+class PublishPipeline:
+    """
+    Очередь публикаций с отдельным потоком-публикатором. Вызывающий (в т.ч. сетевой поток paho внутри
+    обработчика команды) только кладет сообщение в очередь.
+
+    В очереди на каждый топик хранится только самое свежее сообщение: если в топик еще не отправленного
+    сообщения пришло новое, старое заменяется (порядок топиков в очереди сохраняется). Так при медленном
+    брокере устаревшие состояния выбрасываются, а память ограничена maxsize.
+    Публикатор не отдает клиенту больше сообщений с QoS > 0, чем client.max_inflight_messages,
+    чтобы очередь не переезжала в неограниченную внутреннюю очередь paho.
+
+    Сетевой поток клиента (из него вызываются обработчики команд) никогда не ждет места в очереди:
+    подтверждения, которых ждет публикатор, читает именно он. При полной очереди в сетевом потоке
+    Backpressure.block работает как drop_oldest. Сетевой поток - это поток loop_start() клиента или
+    поток, в котором пришел on_connect (нода сообщает его в network_thread).
+
+    Не подходит для AsyncNode: клиент там можно трогать только из потока event loop.
+    """
+    def __init__(self, client: mqtt.Client, maxsize: int = 1000,
+                 backpressure: Backpressure = Backpressure.block, max_inflight: int | None = None) -> None:
+        """
+        :param client: MQTT-клиент
+        :param maxsize: Максимальное число разных топиков в очереди
+        :param backpressure: Что делать, если очередь полна (см. Backpressure)
+        :param max_inflight: Сколько QoS > 0 сообщений может ждать подтверждения. По умолчанию
+                             client.max_inflight_messages, 0 - без ограничения
+        """
+        self.client = client
+        self.maxsize = maxsize
+        self.backpressure = Backpressure(backpressure)
+        self.max_inflight = getattr(client, 'max_inflight_messages', 20) if max_inflight is None else max_inflight
+        self.submitted = 0
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        # Идентификатор сетевого потока клиента (threading.get_ident()), если он известен
+        self.network_thread: int | None = None
+        # Сколько отправителей сейчас ждут места в очереди
+        self._blocked = 0
+        self._queue: collections.OrderedDict[str, tuple[bytes, int, bool, PipelineTicket]] = \
+            collections.OrderedDict()
+        self._inflight: collections.deque[mqtt.MQTTMessageInfo] = collections.deque()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def in_network_thread(self) -> bool:
+        """
+        :return: True, если вызывающий - сетевой поток клиента, которому нельзя блокироваться
+        """
+        return (threading.get_ident() == self.network_thread or
+                threading.current_thread() is getattr(self.client, '_thread', None))
+
+    def submit(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False,
+               timeout: float | None = None) -> PipelineTicket:
+        """
+        Поставить сообщение в очередь.
+
+        :param timeout: Для Backpressure.block - сколько ждать места в очереди, None - бесконечно
+        :return: Квитанция, по которой можно дождаться публикации
+        """
+        with self._cond:
+            self.submitted += 1
+            queued = self._queue.get(topic)
+            if queued is not None:
+                ticket = queued[3]
+                self._queue[topic] = (payload, qos, retain, ticket)
+                self.coalesced += 1
+                return ticket
+            if len(self._queue) >= self.maxsize:
+                if self.backpressure == Backpressure.error:
+                    raise PipelineFullError(f'Publish queue is full ({self.maxsize} topics)')
+                if self.backpressure == Backpressure.drop_oldest or self.in_network_thread():
+                    self._queue.popitem(last=False)[1][3].dropped = True
+                    self.dropped += 1
+                else:
+                    # Пока кто-то ждет места, публикатор не ждет подтверждений (см. _wait_inflight())
+                    self._blocked += 1
+                    self._cond.notify_all()
+                    try:
+                        if not self._cond.wait_for(lambda: len(self._queue) < self.maxsize, timeout):
+                            raise PipelineFullError(f'Publish queue is full ({self.maxsize} topics)')
+                    finally:
+                        self._blocked -= 1
+            ticket = PipelineTicket(self)
+            self._queue[topic] = (payload, qos, retain, ticket)
+            self._cond.notify_all()
+            return ticket
+
+    def start(self) -> None:
+        """
+        Запустить поток-публикатор.
+        """
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='pyhass-mqtt-publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self, flush: bool = True, timeout: float | None = None) -> None:
+        """
+        Остановить поток-публикатор.
+
+        :param flush: Сначала отправить все, что есть в очереди
+        :param timeout: Сколько ждать завершения потока
+        """
+        with self._cond:
+            if not flush:
+                for *_, ticket in self._queue.values():
+                    ticket.dropped = True
+                self._queue.clear()
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _wait_inflight(self) -> None:
+        while self._inflight and self._inflight[0].is_published():
+            self._inflight.popleft()
+        while self.max_inflight and len(self._inflight) >= self.max_inflight and not self._blocked:
+            try:
+                self._inflight[0].wait_for_publish(0.1)
+            except (RuntimeError, ValueError):
+                # Клиент не смог отправить сообщение - дальше его не ждем
+                self._inflight.popleft()
+            while self._inflight and self._inflight[0].is_published():
+                self._inflight.popleft()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or not self._running)
+                if not self._queue:
+                    return
+                topic, (payload, qos, retain, ticket) = self._queue.popitem(last=False)
+                self._cond.notify_all()
+            if qos:
+                self._wait_inflight()
+            info = self.client.publish(topic, payload, qos, retain)
+            self.published += 1
+            if qos:
+                self._inflight.append(info)
+            with self._cond:
+                ticket.info = info
+                self._cond.notify_all()
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Счетчики очереди
+        """
+        return {
+            'depth': len(self._queue),
+            'inflight': len(self._inflight),
+            'submitted': self.submitted,
+            'published': self.published,
+            'coalesced': self.coalesced,
+            'dropped': self.dropped,
+        }
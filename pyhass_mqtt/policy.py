@@ -0,0 +1,71 @@
+import math
+import time
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .main import Entity
+
+
+__all__ = [
+    'PublishPolicy',
+]
+
+
+class PublishPolicy:
+    """
+    Политика публикации состояния сущности. Позволяет не слать в брокер то, что не изменилось.
+    Один экземпляр политики можно разделять между многими сущностями - состояние хранится в самих сущностях.
+    """
+    def __init__(self, on_change: bool = True, deadband: float | None = None, heartbeat: float | None = None,
+                 clock: t.Callable[[], float] = time.monotonic) -> None:
+        """
+        :param on_change: Пропускать публикацию, если состояние не изменилось с прошлой публикации
+        :param deadband: Для числовых состояний: публиковать, только если значение ушло от опубликованного
+                         не меньше, чем на deadband. Нечисловые состояния сравниваются как строки
+        :param heartbeat: Через сколько секунд после последней публикации опубликовать состояние принудительно,
+                          даже если оно не изменилось. Если не задано, а у модели есть expire_after,
+                          используется половина expire_after, чтобы HA не пометил сущность недоступной
+        :param clock: Монотонные часы, секунды
+        """
+        self.on_change = on_change
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.clock = clock
+
+    def heartbeat_for(self, entity: 'Entity') -> float | None:
+        """
+        :return: Период принудительной публикации для сущности в секундах или None
+        """
+        if self.heartbeat is not None:
+            return self.heartbeat
+        expire_after = getattr(entity.model, 'expire_after', None)
+        if expire_after:
+            return expire_after / 2
+        return None
+
+    def changed(self, previous: str, payload: str) -> bool:
+        """
+        :return: True, если payload отличается от previous с учетом deadband
+        """
+        if self.deadband is not None:
+            try:
+                diff = abs(float(payload) - float(previous))
+            except ValueError:
+                pass
+            else:
+                # Шаг ровно в deadband в двоичной арифметике может выйти чуть меньше: 20.2 - 20.0 < 0.2
+                return diff >= self.deadband or math.isclose(diff, self.deadband)
+        return payload != previous
+
+    def should_publish(self, entity: 'Entity', payload: str, now: float) -> bool:
+        """
+        Решить, публиковать ли состояние payload сущности entity в момент now.
+        """
+        if entity.last_payload is None:
+            return True
+        heartbeat = self.heartbeat_for(entity)
+        if heartbeat is not None and now - entity.last_published >= heartbeat:
+            return True
+        if not self.on_change:
+            return True
+        return self.changed(entity.last_payload, payload)
@@ -0,0 +1,162 @@
+import typing as t
+from .main import Completion, Entity, Node
+
+
+__all__ = [
+    'Changes',
+    'Reconciler',
+]
+
+
+_MISSING = object()
+
+
+class Changes:
+    """
+    Итог одной сверки (см. Reconciler.reconcile())
+    """
+    __slots__ = ('added', 'updated', 'removed', 'completion')
+
+    def __init__(self, added: list[str], updated: list[str], removed: list[str], completion: Completion) -> None:
+        """
+        :param added: id добавленных сущностей
+        :param updated: id сущностей, у которых изменился discovery
+        :param removed: id удаленных сущностей
+        :param completion: Completion всех публикаций сверки
+        """
+        self.added = added
+        self.updated = updated
+        self.removed = removed
+        self.completion = completion
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    def __repr__(self) -> str:
+        return f'Changes(added={len(self.added)}, updated={len(self.updated)}, removed={len(self.removed)})'
+
+
+class Reconciler:
+    """
+    Сверка сущностей ноды с внешним деревом объектов (например, устройствами, датчиками и контурами ZONT).
+    На каждое обновление дерева вызывающий строит словарь {стабильный ключ: объект-источник}, ключ
+    становится id сущности. Reconciler сравнивает его с тем, что создал раньше, и:
+    - создает сущности для новых ключей (factory) и добавляет их в ноду одной пачкой;
+    - удаляет из ноды сущности пропавших ключей;
+    - для оставшихся сравнивает отпечаток настроек источника (fingerprint, например имя датчика) с прошлым
+      и только при его изменении перенастраивает модель (configure) и публикует discovery, если он
+      действительно изменился.
+
+    Работа с моделями и MQTT пропорциональна числу изменений: добавление одного датчика к контроллеру
+    с 500 датчиками - это один discovery. Для неизменившихся источников остается поиск в словаре
+    и сравнение отпечатков. Состояния (например, показания датчиков) в отпечаток не входят: их сущность
+    получает через feed на каждой сверке и публикует по своей publish_policy.
+
+    Сущности ноды, созданные не этим Reconciler, не трогаются.
+    """
+    def __init__(self, node: Node, factory: t.Callable[[str, t.Any], Entity],
+                 fingerprint: t.Callable[[t.Any], t.Hashable],
+                 configure: t.Callable[[Entity, t.Any], None] | None = None,
+                 feed: t.Callable[[Entity, t.Any], None] | None = None) -> None:
+        """
+        :param node: Нода (Node или ShardedNode)
+        :param factory: Создать сущность по ключу и источнику. Модель уже должна быть настроена по источнику
+        :param fingerprint: Отпечаток настроек источника, влияющих на модель сущности
+        :param configure: Перенастроить модель существующей сущности по изменившемуся источнику.
+                          None - пересоздать сущность
+        :param feed: Передать сущности текущий источник (вызывается на каждой сверке для всех сущностей,
+                     например, чтобы get_state() видел свежие показания)
+        """
+        self.node = node
+        self.factory = factory
+        self.fingerprint = fingerprint
+        self.configure = configure
+        self.feed = feed
+        # Сущности, созданные этим Reconciler, и отпечатки источников, по которым они настроены сейчас
+        self.entities: dict[str, Entity] = {}
+        self.fingerprints: dict[str, t.Hashable] = {}
+
+    def reconcile(self, sources: t.Mapping[str, t.Any], publish_state: bool = False) -> Changes:
+        """
+        Привести сущности ноды в соответствие с источниками.
+
+        :param sources: Стабильный ключ (id сущности) -> объект-источник
+        :param publish_state: Опубликовать состояния всех остальных сущностей после сверки (по их publish_policy).
+                              Новые сущности публикуют состояние при добавлении в ноду в любом случае
+        :return: Что изменилось
+        """
+        entities = self.entities
+        fingerprints = self.fingerprints
+        feed = self.feed
+        removed = [key for key in fingerprints if key not in sources]
+        added: list[Entity] = []
+        updated: list[Entity] = []
+        recreated: list[Entity] = []
+        for key, source in sources.items():
+            fingerprint = self.fingerprint(source)
+            old = fingerprints.get(key, _MISSING)
+            if old == fingerprint:
+                if feed is not None:
+                    feed(entities[key], source)
+                continue
+            if old is _MISSING:
+                obj = self.factory(key, source)
+                added.append(obj)
+            elif self.configure is None:
+                recreated.append(entities[key])
+                obj = self.factory(key, source)
+                added.append(obj)
+            else:
+                obj = entities[key]
+                before = obj.model.discovery_payload()
+                self.configure(obj, source)
+                if obj.model.discovery_payload() != before:
+                    updated.append(obj)
+            entities[key] = obj
+            fingerprints[key] = fingerprint
+            if feed is not None:
+                feed(obj, source)
+
+        infos = []
+        gone = [entities.pop(key) for key in removed]
+        for key in removed:
+            del fingerprints[key]
+        if gone or recreated:
+            infos.extend(self.node.remove_entities(gone + recreated).infos)
+        if added:
+            infos.extend(self.node.add_entities(added).infos)
+        states = []
+        if publish_state:
+            fresh = {obj.id for obj in added}
+            states = [obj for key, obj in entities.items() if key not in fresh]
+        if updated or states:
+            infos.extend(self._publish(updated, states))
+
+        recreated_ids = {obj.id for obj in recreated}
+        changes = Changes([obj.id for obj in added if obj.id not in recreated_ids],
+                          [obj.id for obj in updated] + list(recreated_ids), removed, Completion(infos))
+        metrics = getattr(self.node, 'metrics', None)
+        if metrics is not None:
+            for kind in ('added', 'updated', 'removed'):
+                count = len(getattr(changes, kind))
+                if count:
+                    metrics.inc('pyhass_mqtt_reconciled_total', count, 'Entities changed by Reconciler', kind=kind)
+        return changes
+
+    @staticmethod
+    def _publish(updated: list[Entity], states: list[Entity]) -> list:
+        # Сущности ShardedNode живут в разных нодах-шардах: публикуем пачкой в каждой
+        nodes: dict[int, tuple[Node, list[Entity], list[Entity]]] = {}
+        for obj in updated:
+            nodes.setdefault(id(obj.node), (obj.node, [], []))[1].append(obj)
+        for obj in states:
+            nodes.setdefault(id(obj.node), (obj.node, [], []))[2].append(obj)
+        infos = []
+        for node, discovery, state in nodes.values():
+            with node._collect() as completion, node.batch():
+                for obj in discovery:
+                    obj.publish_discovery()
+                for obj in state:
+                    obj.publish_state()
+            infos.extend(completion.infos)
+        return infos
@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .main import Entity
+
+
+__all__ = [
+    'Scheduler',
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class _Job:
+    def __init__(self, entity: 'Entity', interval: float, action: t.Callable[[], t.Any]) -> None:
+        self.entity = entity
+        self.interval = interval
+        self.action = action
+        self.deadline = 0.0
+        self.runs = 0
+        self.missed = 0
+        self.cancelled = False
+
+
+class Scheduler:
+    """
+    Планировщик периодического опроса/публикации сущностей. У каждой сущности свой период
+    (Entity.poll_interval или явно в add()), сроки хранятся в куче, так что цикл просыпается
+    ровно к ближайшему сроку.
+
+    Следующий срок отсчитывается от предыдущего срока, а не от момента окончания публикации,
+    поэтому расписание не уплывает. Если срок пропущен (публикации заняли больше периода),
+    пропущенные такты не догоняются, а учитываются в счетчике missed.
+    Начальная фаза каждой сущности сдвигается случайно в пределах доли jitter периода,
+    чтобы сущности с одинаковым периодом не публиковались одной пачкой.
+    """
+    def __init__(self, jitter: float = 0.1, clock: t.Callable[[], float] = time.monotonic,
+                 rng: random.Random | None = None) -> None:
+        """
+        :param jitter: Доля периода (0..1), в пределах которой случайно сдвигается начальная фаза сущности
+        :param clock: Монотонные часы, секунды
+        :param rng: Генератор случайных чисел для jitter
+        """
+        self.jitter = jitter
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self._heap: list[tuple[float, int, _Job]] = []
+        self._jobs: dict[int, _Job] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def add(self, entity: 'Entity', interval: float | None = None, action: t.Callable[[], t.Any] | None = None,
+            jitter: float | None = None) -> None:
+        """
+        Добавить сущность в расписание.
+
+        :param entity: Сущность
+        :param interval: Период в секундах. По умолчанию entity.poll_interval
+        :param action: Что делать по сроку. По умолчанию entity.publish_state()
+        :param jitter: Доля периода для сдвига начальной фазы. По умолчанию jitter планировщика
+        """
+        interval = entity.poll_interval if interval is None else interval
+        if not interval or interval <= 0:
+            raise ValueError(f'Entity "{entity.id}" has no poll interval')
+        job = _Job(entity, interval, action or entity.publish_state)
+        job.deadline = self.clock() + self.rng.uniform(0, interval * (self.jitter if jitter is None else jitter))
+        with self._lock:
+            self.remove(entity)
+            self._jobs[id(entity)] = job
+            heapq.heappush(self._heap, (job.deadline, next(self._seq), job))
+        self._wakeup.set()
+
+    def remove(self, entity: 'Entity') -> None:
+        """
+        Убрать сущность из расписания.
+        """
+        job = self._jobs.pop(id(entity), None)
+        if job is not None:
+            job.cancelled = True
+
+    def run_pending(self) -> float | None:
+        """
+        Выполнить все действия, срок которых наступил.
+
+        :return: Сколько секунд до ближайшего срока или None, если расписание пусто
+        """
+        while True:
+            with self._lock:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    return None
+                now = self.clock()
+                deadline, _, job = self._heap[0]
+                if deadline > now:
+                    return deadline - now
+                # Следующий срок - от предыдущего срока. Пропущенные такты не выполняем, а считаем
+                behind = int((now - deadline) // job.interval)
+                job.missed += behind
+                job.deadline = deadline + (behind + 1) * job.interval
+                heapq.heapreplace(self._heap, (job.deadline, next(self._seq), job))
+            job.runs += 1
+            try:
+                job.action()
+            except Exception:
+                logger.exception('Scheduled action of entity "%s" failed', job.entity.id)
+
+    def run(self) -> None:
+        """
+        Крутить расписание в текущем потоке до вызова stop().
+        """
+        self._stopped = False
+        while not self._stopped:
+            delay = self.run_pending()
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def stop(self) -> None:
+        """
+        Остановить run().
+        """
+        self._stopped = True
+        self._wakeup.set()
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """
+        :return: По id сущности: период, число выполнений и число пропущенных сроков
+        """
+        return {
+            job.entity.id: {'interval': job.interval, 'runs': job.runs, 'missed': job.missed}
+            for job in list(self._jobs.values())
+        }
@@ -0,0 +1,311 @@
+import hashlib
+import multiprocessing
+import queue
+import threading
+import typing as t
+import paho.mqtt.client as mqtt
+from . import models
+from .main import Completion, Entity, Node
+from .scheduler import Scheduler
+
+
+__all__ = [
+    'shard_owner',
+    'ShardedNode',
+    'ProcessShardRunner',
+]
+
+
+def shard_owner(entity_id: str, shards: t.Iterable[str]) -> str:
+    """
+    Выбрать шард для сущности по rendezvous-хэшированию: у каждой пары (шард, сущность) свой вес,
+    сущность достается шарду с максимальным весом. При добавлении или удалении шарда переезжают
+    только сущности, которые он забирает или отдает. Хэш стабилен между процессами и запусками.
+
+    :param entity_id: id сущности
+    :param shards: Имена шардов
+    :return: Имя шарда-владельца
+    """
+    return max(shards, key=lambda shard: hashlib.blake2b(f'{shard}/{entity_id}'.encode(), digest_size=8).digest())
+
+
+class ShardedNode:
+    """
+    Одна Home Assistant нода, сущности которой разложены по нескольким MQTT-соединениям.
+    Каждый шард - обычная Node с тем же id, device и discovery_prefix, но своим MQTT-клиентом
+    (и своим сетевым потоком), поэтому топики и discovery не отличаются от одной Node, и HA видит
+    одно устройство. Сущность попадает в шард по shard_owner(). Каждый шард подписан только на командные
+    топики своих сущностей (Node(command_wildcard=False)), так что команда приходит один раз.
+
+    MQTT-клиенты создает и подключает вызывающий, client_id у них должны различаться.
+    С availability=True клиенты подключаются после создания ShardedNode (см. Node).
+    """
+    def __init__(self, id_: str, clients: dict[str, mqtt.Client], device: models.Device | None = None,
+                 discovery_prefix: str = 'homeassistant', node_cls: type[Node] = Node,
+                 retain_discovery: bool = False, availability: bool = False) -> None:
+        """
+        :param id_: Идентификатор ноды (общий для всех шардов)
+        :param clients: MQTT-клиенты шардов по именам шардов
+        :param device: Модель устройства для Home Assistant (общая для всех шардов)
+        :param discovery_prefix: Префикс для discovery топиков в Home Assistant
+        :param node_cls: Класс ноды шарда
+        :param retain_discovery: Публиковать discovery как retained (см. Node)
+        :param availability: Вести доступность по Last Will (см. Node). У каждого шарда свой топик
+                             '{id}/{shard}/availability', так что при обрыве одного соединения недоступными
+                             становятся только его сущности
+        """
+        self.id = id_
+        self.device = device
+        self.discovery_prefix = discovery_prefix
+        self.node_cls = node_cls
+        self.retain_discovery = retain_discovery
+        self.availability = availability
+        # Реестр метрик (см. attach_metrics())
+        self.metrics: t.Any = None
+        self.shards: dict[str, Node] = {}
+        for name, client in clients.items():
+            self.shards[name] = self._make_node(name, client)
+
+    def _make_node(self, name: str, client: mqtt.Client) -> Node:
+        node = self.node_cls(self.id, client, self.device, self.discovery_prefix,
+                             retain_discovery=self.retain_discovery, availability=self.availability,
+                             availability_topic=f'{self.id}/{name}/availability', command_wildcard=False)
+        if self.metrics is not None:
+            node.attach_metrics(self.metrics, shard=name)
+        return node
+
+    def attach_metrics(self, registry: t.Any) -> None:
+        """
+        Подключить реестр метрик ко всем шардам (и к добавленным потом). Gauge шардов различаются меткой shard.
+        """
+        self.metrics = registry
+        for name, node in self.shards.items():
+            node.attach_metrics(registry, shard=name)
+
+    @property
+    def entities(self) -> dict[str, Entity]:
+        return {obj_id: obj for node in self.shards.values() for obj_id, obj in node.entities.items()}
+
+    def shard_for(self, entity_id: str) -> Node:
+        """
+        :return: Нода шарда, которому принадлежит сущность entity_id
+        """
+        return self.shards[shard_owner(entity_id, self.shards)]
+
+    def add_entity(self, obj: Entity) -> None:
+        self.shard_for(obj.id).add_entity(obj)
+
+    def add_entities(self, objs: t.Iterable[Entity], reconcile: bool = False) -> Completion:
+        """
+        Добавить сущности, разложив их по шардам. Каждый шард добавляет свою часть одной пачкой.
+
+        :param reconcile: Сверить discovery с retained-сообщениями на брокере (см. Node.add_entities()).
+                          Retained discovery забираются один раз на всю ноду, а очищаются только те,
+                          которых нет ни в одном шарде
+        """
+        groups: dict[str, list[Entity]] = {}
+        for obj in objs:
+            groups.setdefault(shard_owner(obj.id, self.shards), []).append(obj)
+        first = next(iter(self.shards.values()))
+        known = first.retained_discovery() if reconcile else None
+        infos = []
+        try:
+            for name, group in groups.items():
+                self.shards[name].known_discovery = known
+                infos.extend(self.shards[name].add_entities(group).infos)
+        finally:
+            for node in self.shards.values():
+                node.known_discovery = None
+        if known is not None:
+            with first._collect() as completion:
+                first.clear_stale_discovery(known, self.entities.values())
+            infos.extend(completion.infos)
+        return Completion(infos)
+
+    def remove_entity(self, obj: str | Entity) -> None:
+        self.shard_for(obj if isinstance(obj, str) else obj.id).remove_entity(obj)
+
+    def remove_entities(self, objs: t.Iterable[str | Entity]) -> Completion:
+        groups: dict[str, list[str | Entity]] = {}
+        for obj in objs:
+            groups.setdefault(shard_owner(obj if isinstance(obj, str) else obj.id, self.shards), []).append(obj)
+        infos = []
+        for name, group in groups.items():
+            infos.extend(self.shards[name].remove_entities(group).infos)
+        return Completion(infos)
+
+    def publish_state_all(self, force: bool = False) -> Completion:
+        infos = []
+        for node in self.shards.values():
+            infos.extend(node.publish_state_all(force).infos)
+        return Completion(infos)
+
+    def publish_discovery_all(self) -> None:
+        for node in self.shards.values():
+            node.publish_discovery_all()
+
+    def add_shard(self, name: str, client: mqtt.Client) -> int:
+        """
+        Добавить шард и перенести в него сущности, которые ему теперь принадлежат.
+        Перенос не снимает discovery, так что для HA сущности не исчезают.
+
+        :return: Сколько сущностей переехало
+        """
+        if name in self.shards:
+            raise KeyError(f'Duplicate shard "{name}"')
+        self.shards[name] = self._make_node(name, client)
+        return self._rebalance()
+
+    def remove_shard(self, name: str) -> int:
+        """
+        Убрать шард, раздав его сущности оставшимся. MQTT-клиент шарда после этого можно отключать.
+
+        :return: Сколько сущностей переехало
+        """
+        if len(self.shards) == 1:
+            raise ValueError('Cannot remove the last shard')
+        node = self.shards.pop(name)
+        moved = node.release_entities(list(node.entities.values()))
+        self.add_entities(moved)
+        return len(moved)
+
+    def _rebalance(self) -> int:
+        moved = []
+        for name, node in self.shards.items():
+            leaving = [obj for obj_id, obj in node.entities.items() if shard_owner(obj_id, self.shards) != name]
+            moved.extend(node.release_entities(leaving))
+        self.add_entities(moved)
+        return len(moved)
+
+
+def _worker(name: str, id_: str, device: models.Device | None, discovery_prefix: str,
+            entity_factory: t.Callable[[], t.Iterable[Entity]], client_factory: t.Callable[[str], mqtt.Client],
+            shards: list[str], control: multiprocessing.Queue, acks: multiprocessing.Queue) -> None:
+    client = client_factory(name)
+    node = Node(id_, client, device, discovery_prefix, command_wildcard=False)
+    scheduler = Scheduler()
+    entities = {obj.id: obj for obj in entity_factory()}
+
+    def apply(shards: list[str]) -> None:
+        owned = {obj_id for obj_id in entities if shard_owner(obj_id, shards) == name}
+        leaving = [obj for obj_id, obj in node.entities.items() if obj_id not in owned]
+        for obj in leaving:
+            scheduler.remove(obj)
+        node.release_entities(leaving)
+        joining = [entities[obj_id] for obj_id in owned if obj_id not in node.entities]
+        node.add_entities(joining)
+        for obj in joining:
+            if obj.poll_interval:
+                scheduler.add(obj)
+
+    apply(shards)
+    thread = threading.Thread(target=scheduler.run, name=f'shard-{name}-scheduler', daemon=True)
+    thread.start()
+    try:
+        while True:
+            shards = control.get()
+            if shards is None:
+                break
+            apply(shards)
+            # Отданные сущности отпущены: теперь их может забрать новый процесс (см. ProcessShardRunner.resize())
+            acks.put(name)
+    finally:
+        scheduler.stop()
+        thread.join()
+        client.disconnect()
+        client.loop_stop()
+
+
+class ProcessShardRunner:
+    """
+    Запуск шардов одной ноды в отдельных процессах: каждый процесс со своим MQTT-соединением,
+    своим GIL и своим планировщиком (сущности с poll_interval публикуются в процессе-владельце).
+
+    Сущности и клиенты создаются внутри процессов фабриками, поэтому фабрики должны быть
+    функциями уровня модуля (их передают в процесс через pickle). Все процессы создают
+    одинаковый набор сущностей и оставляют себе только свои (см. shard_owner()).
+    При resize() существующие процессы получают новый список шардов и отдают/забирают только
+    переехавшие сущности, не снимая discovery. У сущности в каждый момент не больше одного владельца:
+    новые процессы стартуют только после того, как старые отпустят отданные им сущности.
+    """
+    def __init__(self, id_: str, entity_factory: t.Callable[[], t.Iterable[Entity]],
+                 client_factory: t.Callable[[str], mqtt.Client], device: models.Device | None = None,
+                 discovery_prefix: str = 'homeassistant', shards: int = 2) -> None:
+        """
+        :param id_: Идентификатор ноды
+        :param entity_factory: Функция, создающая все сущности ноды
+        :param client_factory: Функция, создающая и подключающая MQTT-клиент по имени шарда и запускающая
+                               его сетевой цикл (loop_start()). client_id у шардов должны различаться
+        :param device: Модель устройства для Home Assistant
+        :param discovery_prefix: Префикс для discovery топиков в Home Assistant
+        :param shards: Начальное число процессов
+        """
+        self.id = id_
+        self.entity_factory = entity_factory
+        self.client_factory = client_factory
+        self.device = device
+        self.discovery_prefix = discovery_prefix
+        self.initial = shards
+        self._context = multiprocessing.get_context('spawn')
+        self._workers: dict[str, tuple[multiprocessing.Process, multiprocessing.Queue]] = {}
+        # Сюда процессы сообщают свои имена, перестроившись по новому списку шардов
+        self._acks = self._context.Queue()
+        self._next = 0
+
+    @property
+    def shards(self) -> list[str]:
+        return list(self._workers)
+
+    def _spawn(self, name: str, shards: list[str]) -> None:
+        control = self._context.Queue()
+        process = self._context.Process(
+            target=_worker, name=f'{self.id}-shard-{name}', daemon=True,
+            args=(name, self.id, self.device, self.discovery_prefix, self.entity_factory, self.client_factory,
+                  shards, control, self._acks),
+        )
+        process.start()
+        self._workers[name] = (process, control)
+
+    def start(self) -> None:
+        self.resize(self.initial)
+
+    def resize(self, shards: int) -> None:
+        """
+        Изменить число процессов. Сначала останавливаются лишние процессы, затем оставшиеся получают
+        новый список шардов и перестраиваются (отпускают отданные и забирают освободившиеся сущности),
+        и только после этого стартуют новые процессы со своей долей сущностей.
+        """
+        if shards < 1:
+            raise ValueError('At least one shard is required')
+        names = list(self._workers)
+        while len(names) < shards:
+            names.append(str(self._next))
+            self._next += 1
+        removed = names[shards:]
+        names = names[:shards]
+        for name in removed:
+            process, control = self._workers.pop(name)
+            control.put(None)
+            process.join()
+        pending = set(self._workers)
+        for name in pending:
+            self._workers[name][1].put(names)
+        while pending:
+            try:
+                pending.discard(self._acks.get(timeout=1.0))
+            except queue.Empty:
+                # Упавший процесс не ответит, а его сущностями уже никто не владеет
+                pending = {name for name in pending if self._workers[name][0].is_alive()}
+        for name in names:
+            if name not in self._workers:
+                self._spawn(name, names)
+
+    def stop(self, timeout: float | None = None) -> None:
+        for process, control in self._workers.values():
+            control.put(None)
+        for process, control in self._workers.values():
+            process.join(timeout)
+        self._workers.clear()
+
+    def alive(self) -> dict[str, bool]:
+        return {name: process.is_alive() for name, (process, _) in self._workers.items()}
@@ -0,0 +1,93 @@
+import asyncio
+from pyhass_mqtt import AsyncEntity, AsyncNode, models
+from bench.fakes import FakeClient
+
+
+class RawSwitch(AsyncEntity):
+    """
+    Асинхронная сущность, которая отдает только готовые bytes
+    """
+    def __init__(self, id_: str) -> None:
+        super().__init__(id_, model_cls=models.Switch)
+        self.state = True
+
+    def get_state_bytes(self) -> bytes:
+        return b'ON' if self.state else b'OFF'
+
+
+def test_async_publish_uses_state_bytes():
+    async def run():
+        client = FakeClient()
+        node = AsyncNode('TEST', client, models.Device(name='Test'))
+        obj = RawSwitch('switch')
+        node.add_entity(obj)
+        client.published.clear()
+        obj.state = False
+        assert await obj.publish_state_async()
+        return client.published
+
+    assert asyncio.run(run()) == [('TEST/switch/state', b'OFF', 0, False)]
+
+
+class CommandSwitch(RawSwitch):
+    def command_handlers(self):
+        return {'command': self.on_command}
+
+    async def on_command(self, client, userdata, msg):
+        raise ValueError('boom')
+
+
+class RC:
+    is_failure = True
+
+
+class FlakyClient(FakeClient):
+    """
+    FakeClient, у которого первая попытка переподключения падает
+    """
+    _reconnect_min_delay = 0.01
+    _reconnect_max_delay = 0.02
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reconnects = 0
+
+    def reconnect(self) -> None:
+        self.reconnects += 1
+        if self.reconnects == 1:
+            raise ConnectionRefusedError('refused')
+
+    def disconnect(self) -> None:
+        pass
+
+
+def test_failed_async_handler_is_logged(caplog):
+    async def run():
+        client = FakeClient()
+        node = AsyncNode('TEST', client, models.Device(name='Test'))
+        obj = CommandSwitch('switch')
+        node.add_entity(obj)
+        client.deliver(obj.command_topic('command'), b'OFF')
+        await asyncio.gather(*node._tasks, return_exceptions=True)
+        await asyncio.sleep(0)
+        return node._tasks
+
+    assert asyncio.run(run()) == set()
+    assert 'Command handler for "TEST/switch/command" failed' in caplog.text
+    assert 'ValueError: boom' in caplog.text
+
+
+def test_reconnects_after_connection_loss():
+    async def run():
+        client = FlakyClient()
+        node = AsyncNode('TEST', client, models.Device(name='Test'))
+        node._on_disconnect(client, None, None, RC, None)
+        # Повторный обрыв во время переподключения не запускает второй цикл
+        node._on_disconnect(client, None, None, RC, None)
+        await asyncio.wait_for(node._reconnecting, 1)
+        reconnects = client.reconnects
+        await node.disconnect()
+        node._on_disconnect(client, None, None, RC, None)
+        return reconnects, node._reconnecting
+
+    assert asyncio.run(run()) == (2, None)
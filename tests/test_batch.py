@@ -0,0 +1,72 @@
+import paho.mqtt.client as mqtt
+import pytest
+import zont
+import entities
+from pyhass_mqtt import Node, models
+from bench.fakes import FakeClient, ZontStub
+
+
+@pytest.fixture
+def stub():
+    stub = ZontStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def api(stub):
+    api = zont.API('test', url=stub.url)
+    api.authenticate('test', 'test')
+    return api
+
+
+def writes(stub, method):
+    return [body for name, body in stub.bodies if name == method]
+
+
+def test_unmerged_by_default(stub, api):
+    batcher = zont.WriteBatcher(api, window=0.05)
+    futures = [batcher.submit('set_target_temp', {'device_id': 1, 'circuit': 1, 'temp': 21}),
+               batcher.submit('set_target_temp', {'device_id': 1, 'circuit': 2, 'temp': 23})]
+    for future in futures:
+        assert future.result(5) == {'ok': True}
+    batcher.close()
+    assert writes(stub, 'set_target_temp') == [{'device_id': 1, 'circuit': 1, 'temp': 21},
+                                               {'device_id': 1, 'circuit': 2, 'temp': 23}]
+
+
+def test_merged_when_opted_in(stub, api):
+    batcher = zont.WriteBatcher(api, window=0.05, merge={'update_device': zont.merge_fields})
+    futures = [batcher.submit('update_device', {'device_id': 1, 'a': 1}),
+               batcher.submit('update_device', {'device_id': 1, 'b': 2}),
+               batcher.submit('set_target_temp', {'device_id': 1, 'circuit': 1, 'temp': 21}),
+               batcher.submit('update_device', {'device_id': 2, 'a': 3})]
+    for future in futures:
+        assert future.result(5) == {'ok': True}
+    batcher.close()
+    assert sorted(writes(stub, 'update_device'), key=lambda body: body['device_id']) == [
+        {'device_id': 1, 'a': 1, 'b': 2}, {'device_id': 2, 'a': 3}]
+    assert writes(stub, 'set_target_temp') == [{'device_id': 1, 'circuit': 1, 'temp': 21}]
+    assert batcher.stats() == {'submitted': 4, 'calls': 3, 'pending': 0}
+
+
+class FailingAPI:
+    metrics = None
+
+    def request(self, method, data):
+        raise zont.ZontError('device_offline', 'Device is offline')
+
+
+def test_relay_rolls_back_failed_command():
+    batcher = zont.WriteBatcher(FailingAPI(), window=0.0)
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    relay = entities.ZontRelay('relay', batcher, device_id=1, method='set_relay', field='on')
+    node.add_entity(relay)
+    msg = mqtt.MQTTMessage(topic=b'TEST/relay/command')
+    msg.payload = b'ON'
+    relay.on_set_command(client, None, msg)
+    batcher.close()
+    states = [payload for topic, payload, *_ in client.published if topic == 'TEST/relay/state']
+    assert states == [b'OFF', b'ON', b'OFF']
+    assert relay.state is False
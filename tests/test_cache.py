@@ -0,0 +1,26 @@
+import threading
+from zont import ResponseCache
+
+
+def test_read_started_before_write_is_not_cached():
+    cache = ResponseCache({'devices': 60.0})
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow_read():
+        started.set()
+        release.wait(5)
+        return 'before write'
+
+    reader = threading.Thread(target=lambda: results.append(cache.fetch('devices', {}, slow_read)))
+    reader.start()
+    assert started.wait(5)
+    cache.fetch('update_device', {'device_id': 1}, lambda: None)
+    # Запрос после записи не присоединяется к запросу, начатому до нее
+    assert cache.fetch('devices', {}, lambda: 'after write') == 'after write'
+    release.set()
+    reader.join(5)
+    assert results == ['before write']
+    # Устаревший ответ не затер свежий в кэше
+    assert cache.fetch('devices', {}, lambda: 'refetched') == 'after write'
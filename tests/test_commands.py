@@ -0,0 +1,55 @@
+import threading
+import paho.mqtt.client as mqtt
+from pyhass_mqtt import CommandExecutor
+
+
+def message(topic: str, payload: bytes) -> mqtt.MQTTMessage:
+    msg = mqtt.MQTTMessage(topic=topic.encode())
+    msg.payload = payload
+    return msg
+
+
+def test_per_entity_order():
+    executor = CommandExecutor(workers=4, collapse=False)
+    done = []
+    lock = threading.Lock()
+
+    def handler(client, userdata, msg):
+        with lock:
+            done.append((msg.topic, msg.payload))
+
+    for i in range(50):
+        for entity_id in ('a', 'b'):
+            executor.submit(entity_id, 'set', handler, None, None, message(f'T/{entity_id}/set', str(i).encode()))
+    executor.start()
+    executor.stop(drain=True, timeout=5)
+    for entity_id in ('a', 'b'):
+        assert [payload for topic, payload in done if topic == f'T/{entity_id}/set'] == \
+            [str(i).encode() for i in range(50)]
+    assert executor.stats()['executed'] == 100
+
+
+def test_collapse_keeps_latest_pending_command():
+    executor = CommandExecutor(workers=2)
+    started = threading.Event()
+    release = threading.Event()
+    done = []
+
+    def handler(client, userdata, msg):
+        if msg.payload == b'0':
+            started.set()
+            release.wait(5)
+        done.append((msg.topic, msg.payload))
+
+    executor.start()
+    executor.submit('a', 'set', handler, None, None, message('T/a/set', b'0'))
+    assert started.wait(5)
+    # Пока первая команда выполняется, из очереди сущности остается последняя по каждому суффиксу
+    for payload in (b'1', b'2', b'3'):
+        executor.submit('a', 'set', handler, None, None, message('T/a/set', payload))
+    executor.submit('a', 'mode', handler, None, None, message('T/a/mode', b'heat'))
+    assert len(executor) == 2
+    release.set()
+    executor.stop(drain=True, timeout=5)
+    assert done == [('T/a/set', b'0'), ('T/a/set', b'3'), ('T/a/mode', b'heat')]
+    assert executor.collapsed == 2
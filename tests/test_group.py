@@ -0,0 +1,56 @@
+import json
+import pytest
+from pyhass_mqtt import Node, StateGroup, models
+from bench.fakes import FakeClient
+from bench.__main__ import BenchSensor
+
+
+def make_group():
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    return client, node, StateGroup(node)
+
+
+def test_value_template_always_indexes():
+    _, node, group = make_group()
+    objs = [BenchSensor(id_) for id_ in ('items', 'get', 'temp', 'a-b')]
+    for obj in objs:
+        group.add(obj)
+    node.add_entities(objs)
+    assert [obj.model.value_template for obj in objs] == [
+        '{{ value_json["items"] }}', '{{ value_json["get"] }}', '{{ value_json["temp"] }}', '{{ value_json["a-b"] }}',
+    ]
+    document = json.loads(node.client.published[-1][1])
+    assert document == {obj.id: '21.5' for obj in objs}
+
+
+def test_attach_detach():
+    client, node, group = make_group()
+    objs = [BenchSensor(f's{i}') for i in range(3)]
+    for obj in objs:
+        group.add(obj)
+    # Пакетное добавление - один документ на всю группу
+    node.add_entities(objs)
+    states = [payload for topic, payload, *_ in client.published if topic == group.topic]
+    assert [json.loads(payload) for payload in states] == [{'s0': '21.5', 's1': '21.5', 's2': '21.5'}]
+    assert objs[0].model.state_topic == group.topic
+
+    # Сущность в ноде нельзя вывести из группы, а чужую - ввести
+    with pytest.raises(RuntimeError):
+        group.discard(objs[0])
+    with pytest.raises(RuntimeError):
+        group.add(objs[0])
+
+    client.published.clear()
+    node.remove_entity(objs[0])
+    group.discard(objs[0])
+    assert objs[0].state_group is None and 's0' not in group.members
+    objs[1].value = 22.0
+    objs[1].publish_state()
+    assert [json.loads(payload) for topic, payload, *_ in client.published if topic == group.topic] == \
+        [{'s1': '22.0', 's2': '21.5'}]
+
+    # Вне группы сущность снова публикует в свой топик без value_template
+    node.add_entity(objs[0])
+    assert objs[0].model.state_topic == 'TEST/s0/state'
+    assert objs[0].model.value_template is None
@@ -0,0 +1,52 @@
+import pytest
+from pyhass_mqtt import Registry, ShardedNode, models
+from bench.fakes import FakeClient
+
+
+def test_shard_gauges_do_not_replace_each_other():
+    registry = Registry()
+    node = ShardedNode('TEST', {'a': FakeClient(), 'b': FakeClient()}, models.Device(name='Test'))
+    node.attach_metrics(registry)
+    node.add_shard('c', FakeClient())
+    text = registry.render()
+    for shard in ('a', 'b', 'c'):
+        assert f'pyhass_mqtt_connected{{node="TEST",shard="{shard}"}} 1' in text
+    assert registry.value('pyhass_mqtt_connected') == 3
+
+
+def test_duplicate_gauge_is_rejected():
+    registry = Registry()
+    registry.gauge('up', lambda: 1, node='a')
+    with pytest.raises(ValueError):
+        registry.gauge('up', lambda: 2, node='a')
+    registry.inc('requests_total')
+    with pytest.raises(ValueError):
+        registry.gauge('requests_total', lambda: 1)
+
+
+def test_prometheus_text():
+    registry = Registry()
+    registry.inc('requests_total', 2, 'Requests', method='devices')
+    registry.inc('requests_total', 1, 'Requests', method='say "hi"\n')
+    registry.observe('request_seconds', 0.3, 'Duration', buckets=(0.1, 0.5))
+    registry.observe('request_seconds', 2.0, 'Duration', buckets=(0.1, 0.5))
+    registry.gauge('temperature', lambda: 21.5, 'Temperature')
+    assert registry.render() == (
+        '# HELP requests_total Requests\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{method="devices"} 2\n'
+        'requests_total{method="say \\"hi\\"\\n"} 1\n'
+        '# HELP request_seconds Duration\n'
+        '# TYPE request_seconds histogram\n'
+        'request_seconds_bucket{le="0.1"} 0\n'
+        'request_seconds_bucket{le="0.5"} 1\n'
+        'request_seconds_bucket{le="+Inf"} 2\n'
+        'request_seconds_sum 2.3\n'
+        'request_seconds_count 2\n'
+        '# HELP temperature Temperature\n'
+        '# TYPE temperature gauge\n'
+        'temperature 21.5\n'
+    )
+    assert registry.value('requests_total') == 3
+    assert registry.value('request_seconds') == 2
+    assert registry.value('missing') == 0
@@ -0,0 +1,43 @@
+import pytest
+from pyhass_mqtt import models
+
+
+def test_view_dumps_own_fields():
+    template = models.Sensor(icon='mdi:thermometer', name='Template')
+    view = template.view(name='Own')
+    assert view.model_dump()['name'] == 'Own'
+    assert '"name":"Own"' in view.model_dump_json()
+    copy = view.model_copy(update={'icon': 'mdi:water'})
+    assert (copy.name, copy.icon, template.icon) == ('Own', 'mdi:water', 'mdi:thermometer')
+    assert view.icon == 'mdi:thermometer'
+    assert view.state_payload_fields_ == ()
+    with pytest.raises(AttributeError):
+        view.model_validate
+
+
+def test_discovery_payload_is_cached():
+    model = models.Sensor(name='Hall', device=models.Device(name='Boiler'))
+    payload = model.discovery_payload()
+    encodes = models.Model.discovery_encodes
+    assert model.discovery_payload() is payload
+    assert models.Model.discovery_encodes == encodes
+
+
+def test_discovery_cache_invalidation():
+    model = models.Sensor(name='Hall', device=models.Device(name='Boiler'))
+    model.discovery_payload()
+    model.name = 'Kitchen'
+    assert b'"name":"Kitchen"' in model.discovery_payload()
+    # Изменение вложенной модели тоже сбрасывает кэш
+    model.device.name = 'Heater'
+    assert b'"name":"Heater"' in model.discovery_payload()
+
+
+def test_view_discovery_follows_template():
+    template = models.Sensor(icon='mdi:thermometer')
+    view = template.view(name='Own')
+    assert b'"icon":"mdi:thermometer"' in view.discovery_payload()
+    template.icon = 'mdi:water'
+    assert b'"icon":"mdi:water"' in view.discovery_payload()
+    view.name = 'Other'
+    assert b'"name":"Other"' in view.discovery_payload()
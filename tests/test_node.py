@@ -0,0 +1,89 @@
+import logging
+from pyhass_mqtt import Entity, Node, models
+from bench.fakes import FakeClient
+
+
+class ConnectedClient(FakeClient):
+    def is_connected(self) -> bool:
+        return True
+
+
+def test_availability_on_connected_client(caplog):
+    client = ConnectedClient()
+    with caplog.at_level(logging.WARNING, logger='pyhass_mqtt.main'):
+        Node('TEST', client, models.Device(name='Test'), availability=True)
+    # on_connect уже прошел, так что 'online' нода публикует сама
+    assert client.published == [('TEST/availability', b'online', 1, True)]
+    assert 'Last Will' in caplog.text
+
+
+class CommandSwitch(Entity):
+    def __init__(self, id_: str) -> None:
+        super().__init__(id_, model_cls=models.Switch)
+        self.received: list[bytes] = []
+
+    def get_state(self) -> str:
+        return 'OFF'
+
+    def command_handlers(self) -> dict:
+        return {'command': lambda client, userdata, msg: self.received.append(msg.payload)}
+
+
+def test_wildcard_command_dispatch():
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    objs = [CommandSwitch(f's{i}') for i in range(3)]
+    node.add_entities(objs)
+    # Одна подписка на суффикс, а не на сущность
+    assert client.subscribe_calls == [[('TEST/+/command', 0)]]
+    client.deliver('TEST/s1/command', b'ON')
+    # Топик без обработчика (чужая или удаленная сущность) просто игнорируется
+    client.deliver('TEST/unknown/command', b'ON')
+    assert [obj.received for obj in objs] == [[], [b'ON'], []]
+
+    node.remove_entities(objs[:2])
+    assert client.unsubscribe_calls == []
+    client.deliver('TEST/s0/command', b'ON')
+    assert objs[0].received == []
+    node.remove_entity(objs[2])
+    assert client.unsubscribe_calls == [['TEST/+/command']]
+
+
+class RC:
+    is_failure = False
+
+
+def test_resync_publishes_only_dirty_entities():
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    objs = [CommandSwitch(f's{i}') for i in range(3)]
+    node.add_entities(objs)
+    node._on_disconnect(client, None, None, RC, None)
+    assert not objs[1].publish_state()
+    assert node.dirty == {'s1'}
+    # Удаленная без соединения сущность при переподключении пропускается
+    objs[2].publish_state()
+    node.remove_entity(objs[2])
+    client.published.clear()
+    client.subscribe_calls.clear()
+
+    node._on_connect(client, None, None, RC, None)
+    assert client.published == [('TEST/s1/state', b'OFF', 0, False)]
+    assert client.subscribe_calls == [[('TEST/+/command', 0)]]
+    assert node.dirty == set()
+    assert node.reconnects == 1
+
+
+def test_bulk_add_and_remove():
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    objs = [CommandSwitch(f's{i}') for i in range(100)]
+    completion = node.add_entities(objs)
+    # Одна подписка на все сущности, discovery и начальные состояния - в одном Completion
+    assert len(client.subscribe_calls) == 1
+    assert len(completion) == 200 and completion.wait(1)
+    completion = node.remove_entities([obj.id for obj in objs])
+    assert len(completion) == 100 and completion.wait(1)
+    assert node.entities == {}
+    assert client.unsubscribe_calls == [['TEST/+/command']]
+    assert all(obj.node is None for obj in objs)
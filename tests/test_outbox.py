@@ -0,0 +1,70 @@
+import os
+from pyhass_mqtt import Node, Outbox, models
+from bench.fakes import FakeClient
+from bench.__main__ import BenchSensor
+from entities import Relay
+
+
+class RC:
+    is_failure = False
+
+
+def test_urgent_publishes_skip_outbox(tmp_path):
+    outbox = Outbox(os.path.join(tmp_path, 'outbox'), rate=5, jitter=0)
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'), availability=True, outbox=outbox)
+    relay = Relay('relay')
+    sensors = [BenchSensor(f'e{i}') for i in range(5)]
+    node.add_entities([relay, *sensors])
+    node._on_disconnect(client, None, None, RC, None)
+    for obj in sensors:
+        obj.value = 1
+        obj.publish_state()
+    relay.state = True
+    relay.publish_state()
+    client.published.clear()
+
+    node._on_connect(client, None, None, RC, None)
+    # Доступность уходит сразу при подключении, а не после 6 записей outbox
+    assert client.published[0] == ('TEST/availability', b'online', 1, True)
+    # Ответ на команду тоже не ждет outbox (к этому моменту тот успевает отправить разве что одну запись),
+    # а ранее записанное состояние реле уже не отправляется
+    client.deliver(relay.command_topic('command'), b'OFF')
+    assert (relay.model.state_topic, b'OFF', 0, False) in client.published[1:3]
+    outbox._thread.join()
+    outbox.close()
+    relay_states = [payload for topic, payload, *_ in client.published if topic == relay.model.state_topic]
+    assert relay_states == [b'OFF']
+    assert len(client.published) == 7
+    assert outbox.superseded == 1
+
+
+def test_replay_sends_last_value_per_topic(tmp_path):
+    outbox = Outbox(os.path.join(tmp_path, 'outbox'), rate=0, jitter=0)
+    for topic, payload in [('a', b'1'), ('b', b'1'), ('a', b'2')]:
+        outbox.append(topic, payload)
+    sent = []
+    outbox.replay(lambda topic, payload, qos, retain: sent.append((topic, payload)))
+    outbox._thread.join()
+    outbox.close()
+    assert sent == [('b', b'1'), ('a', b'2')]
+    assert len(outbox) == 0
+
+
+def test_replay_skips_records_overwritten_while_sending(tmp_path):
+    outbox = Outbox(os.path.join(tmp_path, 'outbox'), size=100, rate=0, jitter=0)
+    for topic in 'abc':
+        outbox.append(topic, b'x' * 10)
+    sent = []
+
+    def publish(topic, payload, qos, retain):
+        if not sent:
+            # Новая запись вытесняет из кольца и отправленную "a", и еще не отправленную "b"
+            outbox.append('d', b'y' * 40)
+        sent.append(topic)
+
+    outbox.replay(publish)
+    outbox._thread.join()
+    outbox.close()
+    assert sent == ['a', 'c', 'd']
+    assert outbox.dropped == 2
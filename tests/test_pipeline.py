@@ -0,0 +1,83 @@
+import queue
+import threading
+import paho.mqtt.client as mqtt
+from pyhass_mqtt import Backpressure, Node, PublishPipeline, models
+from bench.fakes import FakeClient
+from bench.__main__ import BenchSensor
+
+
+class AckClient(FakeClient):
+    """
+    Клиент, у которого подтверждения QoS 1 (как и входящие сообщения) обрабатывает только сетевой поток
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self.events: queue.Queue = queue.Queue()
+        self.unacked: list[mqtt.MQTTMessageInfo] = []
+        self._thread = threading.Thread(target=self._network, daemon=True)
+
+    def publish(self, topic, payload=b'', qos=0, retain=False):
+        self._mid += 1
+        self.published.append((topic, payload, qos, retain))
+        info = mqtt.MQTTMessageInfo(self._mid)
+        if qos:
+            self.unacked.append(info)
+        else:
+            info._published = True
+        self.events.put(None)
+        return info
+
+    def _network(self) -> None:
+        while True:
+            event = self.events.get()
+            if event is not None:
+                event()
+            for info in self.unacked[:]:
+                info._set_as_published()
+                self.unacked.remove(info)
+
+
+def test_block_does_not_deadlock_network_thread():
+    client = AckClient()
+    pipeline = PublishPipeline(client, maxsize=2, backpressure=Backpressure.block, max_inflight=1)
+    node = Node('TEST', client, models.Device(name='Test'), pipeline=pipeline)
+    done = threading.Event()
+    handled = []
+
+    def command(i):
+        def handle():
+            # Обработчик публикует больше, чем помещается в очередь, не возвращаясь в сетевой цикл
+            for j in range(5):
+                node.publish(f'TEST/e{i}/state{j}', b'1', 1)
+            handled.append(i)
+            if len(handled) == 20:
+                done.set()
+        return handle
+
+    client._thread.start()
+    for i in range(20):
+        client.events.put(command(i))
+    assert done.wait(5)
+    pipeline.stop(timeout=5)
+    assert pipeline.published + pipeline.dropped == 100
+
+
+def test_completion_tracks_pipeline():
+    client = FakeClient()
+    pipeline = PublishPipeline(client)
+    node = Node('TEST', client, models.Device(name='Test'), pipeline=pipeline)
+    completion = node.add_entities([BenchSensor(f'e{i}') for i in range(10)])
+    assert len(completion) == 20
+    assert completion.wait(5)
+    assert all(info.is_published() for info in completion.infos)
+    pipeline.stop()
+
+
+def test_dropped_message_fails_completion():
+    client = FakeClient()
+    pipeline = PublishPipeline(client, maxsize=1, backpressure=Backpressure.drop_oldest)
+    first = pipeline.submit('a', b'1')
+    second = pipeline.submit('b', b'2')
+    pipeline.start()
+    pipeline.stop()
+    assert first.dropped and second.is_published()
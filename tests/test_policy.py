@@ -0,0 +1,61 @@
+from pyhass_mqtt import Node, PublishPolicy, models
+from bench.fakes import FakeClient
+from bench.__main__ import BenchSensor
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_deadband_edge():
+    policy = PublishPolicy(deadband=0.2)
+    assert policy.changed('20.0', '20.2')
+    assert policy.changed('1.0', '1.2')
+    assert policy.changed('1.2', '1.0')
+    assert not policy.changed('20.0', '20.1')
+    assert policy.changed('on', 'off')
+    assert not policy.changed('on', 'on')
+
+
+def make_sensor(policy):
+    node = Node('TEST', FakeClient(), models.Device(name='Test'))
+    obj = BenchSensor('t')
+    obj.publish_policy = policy
+    node.add_entity(obj)
+    node.client.published.clear()
+    return node, obj
+
+
+def test_on_change():
+    node, obj = make_sensor(PublishPolicy())
+    assert not obj.publish_state()
+    obj.value = 22.0
+    assert obj.publish_state()
+    assert obj.publish_state(force=True)
+    assert [payload for _, payload, *_ in node.client.published] == [b'22.0', b'22.0']
+
+
+def test_heartbeat():
+    clock = Clock()
+    node, obj = make_sensor(PublishPolicy(heartbeat=60, clock=clock))
+    clock.now = 59
+    assert not obj.publish_state()
+    clock.now = 60
+    assert obj.publish_state()
+    clock.now = 100
+    assert not obj.publish_state()
+
+
+def test_heartbeat_from_expire_after():
+    node, obj = make_sensor(PublishPolicy())
+    obj.model.expire_after = 300
+    assert obj.publish_policy.heartbeat_for(obj) == 150
+
+
+def test_publish_always_without_on_change():
+    node, obj = make_sensor(PublishPolicy(on_change=False))
+    assert obj.publish_state()
@@ -0,0 +1,60 @@
+from pyhass_mqtt import Node, models
+from bench.fakes import FakeClient
+from bench.__main__ import BenchSensor
+from entities import _zont_name, zont_reconciler, zont_sources
+import zont
+
+
+def device(thermometers=(), circuits=(), name='Boiler'):
+    return zont.models.Device(id=1, serial='S1', name=name, thermometers=list(thermometers), heating_circuits=list(circuits))
+
+
+def test_zont_names():
+    assert _zont_name((device(), zont.models.Thermometer(uuid='abc'))) == 'Boiler abc'
+    assert _zont_name((device(), zont.models.Thermometer(uuid='abc', name='Hall'))) == 'Boiler Hall'
+    assert _zont_name((device(), zont.models.HeatingCircuit(id=7))) == 'Boiler 7'
+
+
+def test_zont_sources_keys():
+    sources = zont_sources([device([zont.models.Thermometer(uuid='abc')], [zont.models.HeatingCircuit(id=7)])])
+    assert sorted(sources) == ['zont_1_hc_7', 'zont_1_t_abc']
+
+
+def test_reconcile_add_rename_remove():
+    client = FakeClient()
+    node = Node('TEST', client, models.Device(name='Test'))
+    reconciler = zont_reconciler(node)
+    hall = zont.models.Thermometer(uuid='abc', name='Hall', last_value=21.5)
+    circuit = zont.models.HeatingCircuit(id=7, current_temp=40.0)
+
+    changes = reconciler.reconcile(zont_sources([device([hall], [circuit])]))
+    assert sorted(changes.added) == ['zont_1_hc_7', 'zont_1_t_abc']
+    assert node.entities['zont_1_t_abc'].model.name == 'Boiler Hall'
+
+    # Без изменений сверка ничего не публикует
+    client.published.clear()
+    assert not reconciler.reconcile(zont_sources([device([hall], [circuit])]))
+    assert client.published == []
+
+    hall = zont.models.Thermometer(uuid='abc', name='Kitchen', last_value=21.5)
+    changes = reconciler.reconcile(zont_sources([device([hall])]))
+    assert (changes.added, changes.updated, changes.removed) == ([], ['zont_1_t_abc'], ['zont_1_hc_7'])
+    assert node.entities['zont_1_t_abc'].model.name == 'Boiler Kitchen'
+    assert list(node.entities) == ['zont_1_t_abc']
+
+
+def test_startup_reconcile_clears_stale_retained_discovery():
+    retained = {}
+    first = Node('TEST', FakeClient(retained=retained), models.Device(name='Test'), retain_discovery=True)
+    first.add_entities([BenchSensor(f's{i}') for i in range(3)])
+    assert len(retained) == 3
+
+    # Перезапуск: s0 не изменился, s1 переименован, s2 больше нет
+    client = FakeClient(retained=retained)
+    node = Node('TEST', client, models.Device(name='Test'), retain_discovery=True)
+    s0, s1 = BenchSensor('s0'), BenchSensor('s1')
+    s1.model.name = 'Renamed'
+    node.add_entities([s0, s1], reconcile=True)
+    configs = [topic for topic, payload, *_ in client.published if topic.endswith('/config')]
+    assert configs == [s1.discovery_topic, 'homeassistant/sensor/TEST/s2/config']
+    assert sorted(retained) == sorted([s0.discovery_topic, s1.discovery_topic])
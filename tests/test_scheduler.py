@@ -0,0 +1,56 @@
+from pyhass_mqtt import Scheduler
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Item:
+    def __init__(self, id_: str, poll_interval: float) -> None:
+        self.id = id_
+        self.poll_interval = poll_interval
+
+
+def make_scheduler(*items):
+    clock = Clock()
+    scheduler = Scheduler(jitter=0, clock=clock)
+    calls = []
+    for item in items:
+        scheduler.add(item, action=lambda item=item: calls.append((clock.now, item.id)))
+    return clock, scheduler, calls
+
+
+def test_order_by_deadline():
+    clock, scheduler, calls = make_scheduler(Item('fast', 1), Item('slow', 3))
+    for now in (0, 1, 2, 3):
+        clock.now = now
+        scheduler.run_pending()
+    assert calls == [(0, 'fast'), (0, 'slow'), (1, 'fast'), (2, 'fast'), (3, 'slow'), (3, 'fast')]
+    clock.now = 3.5
+    assert scheduler.run_pending() == 0.5
+
+
+def test_missed_deadlines_are_counted_not_replayed():
+    clock, scheduler, calls = make_scheduler(Item('fast', 1))
+    scheduler.run_pending()
+    clock.now = 3.5
+    scheduler.run_pending()
+    assert calls == [(0, 'fast'), (3.5, 'fast')]
+    assert scheduler.stats()['fast'] == {'interval': 1, 'runs': 2, 'missed': 2}
+    # Расписание не уплывает: следующий срок - 4, а не 4.5
+    assert scheduler.run_pending() == 0.5
+
+
+def test_remove():
+    fast, slow = Item('fast', 1), Item('slow', 1)
+    clock, scheduler, calls = make_scheduler(fast, slow)
+    scheduler.remove(fast)
+    scheduler.run_pending()
+    assert calls == [(0, 'slow')]
+    assert list(scheduler.stats()) == ['slow']
+    scheduler.remove(slow)
+    assert scheduler.run_pending() is None
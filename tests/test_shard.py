@@ -0,0 +1,25 @@
+from pyhass_mqtt import ShardedNode, models
+from bench.fakes import FakeClient
+from entities import Relay
+
+
+def test_shards_subscribe_to_own_commands():
+    clients = {name: FakeClient() for name in ('a', 'b', 'c')}
+    node = ShardedNode('TEST', clients, models.Device(name='Test'))
+    relays = [Relay(f'relay{i}') for i in range(30)]
+    node.add_entities(relays)
+    subscribed = {}
+    for name, client in clients.items():
+        for call in client.subscribe_calls:
+            for topic, _ in call:
+                subscribed.setdefault(topic, []).append(name)
+    # Каждую команду получает только шард-владелец сущности
+    owners = {id(shard): name for name, shard in node.shards.items()}
+    assert subscribed == {obj.command_topic('command'): [owners[id(obj.node)]] for obj in relays}
+
+    moved = node.add_shard('d', FakeClient())
+    assert moved
+    for obj in relays:
+        own = obj.node.client
+        for client in (*clients.values(), node.shards['d'].client):
+            assert (obj.command_topic('command') in client.callbacks) == (client is own)
@@ -0,0 +1,57 @@
+import json
+import os
+import stat
+import requests
+import zont
+
+
+def test_token_store_permissions(tmp_path):
+    store = zont.TokenStore(str(tmp_path / 'token.json'))
+    store.save('user', 'abc')
+    assert stat.S_IMODE(os.stat(store.path).st_mode) == 0o600
+    assert store.load('user') == 'abc'
+    assert store.load('other') is None
+    store.clear()
+    assert store.load('user') is None
+
+
+class Session:
+    """
+    Подделка requests.Session: выдает токены token-1, token-2, ... и отвергает все, кроме последнего
+    """
+    def __init__(self) -> None:
+        self.issued = 0
+        self.calls: list[tuple[str, str | None]] = []
+
+    def post(self, url, headers, json=None, timeout=None, auth=None):
+        method = url.rsplit('/', 1)[-1]
+        token = headers.get('X-ZONT-Token')
+        self.calls.append((method, token))
+        if method == 'get_authtoken':
+            self.issued += 1
+            return self.response(200, {'ok': True, 'token': f'token-{self.issued}'})
+        if token != f'token-{self.issued}':
+            return self.response(401, {'ok': False, 'error': 'invalid_token'})
+        return self.response(200, {'ok': True, 'devices': []})
+
+    @staticmethod
+    def response(status: int, body: dict) -> requests.Response:
+        r = requests.Response()
+        r.status_code = status
+        r._content = json.dumps(body).encode()
+        r.url = 'http://zont.test/api'
+        return r
+
+
+def test_reauthenticate_on_401(tmp_path):
+    store = zont.TokenStore(str(tmp_path / 'token.json'))
+    store.save('user', 'stale')
+    api = zont.API('test', url='http://zont.test/api', token_store=store)
+    api.session = Session()
+    # Сохраненный токен используется без запроса к API
+    api.authenticate('user', 'secret')
+    assert api.session.calls == []
+    assert api.request('devices', {}) == {'ok': True, 'devices': []}
+    assert api.session.calls == [('devices', 'stale'), ('get_authtoken', 'stale'), ('devices', 'token-1')]
+    # Новый токен сохранен для следующего запуска
+    assert store.load('user') == 'token-1'
@@ -0,0 +1,66 @@
+import random
+import pytest
+import requests
+import zont
+from zont import CircuitBreaker, RetryPolicy
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+def test_retry_delay_is_capped():
+    policy = RetryPolicy(base=1.0, cap=3.0, rng=random.Random(1))
+    assert all(0 <= policy.delay(attempt) <= min(3.0, 2 ** attempt) for attempt in range(10) for _ in range(20))
+
+
+def test_transient_errors():
+    assert RetryPolicy.transient(requests.ConnectionError())
+    assert RetryPolicy.transient(requests.Timeout())
+    assert RetryPolicy.transient(http_error(503))
+    assert RetryPolicy.transient(http_error(429))
+    assert not RetryPolicy.transient(http_error(404))
+    assert not RetryPolicy.transient(zont.ZontError('bad', 'bad'))
+
+
+def test_breaker_state_machine():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+    transitions = []
+    breaker.listeners.append(lambda old, new: transitions.append(new))
+    breaker.allow()
+    breaker.record_failure()
+    # Успех обнуляет счетчик ошибок подряд
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(zont.CircuitOpenError):
+        breaker.allow()
+
+    clock.now = 10
+    breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Пробный запрос только один
+    with pytest.raises(zont.CircuitOpenError):
+        breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now = 20
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert transitions == ['open', 'half_open', 'open', 'half_open', 'closed']
+    assert breaker.transitions == 5
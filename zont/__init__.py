@@ -1,28 +1,49 @@
+import threading
+import time
+import pydantic
 import requests
 import typing as t
-
-
-class ZontError(Exception):
-    def __init__(self, code: str, descr: str | list[str]) -> None:
-        self.code = code
-        self.description = descr if isinstance(descr, str) else '\n'.join(descr)
-
-
-class NotAuthorizedError(ZontError):
-    def __init__(self):
-        super('not_authorized', 'Client has not been authorized')
-
-
-class UnexpectedResponse(Exception):
-    def __init__(self):
-        super('invalid_response', 'Unexpected or malformed response')
+from . import models
+from .auth import TokenStore
+from .cache import ResponseCache
+from .errors import *
+from .resilience import CircuitBreaker, RetryPolicy
 
 
 class API:
 
     URL: str = 'https://lk.zont-online.ru/api'
+    # Коды ошибок ZONT и HTTP-статусы, означающие, что токен недействителен и нужно авторизоваться заново
+    AUTH_ERROR_CODES: frozenset[str] = frozenset({'not_authorized', 'invalid_token', 'token_expired'})
+    AUTH_HTTP_STATUSES: frozenset[int] = frozenset({401, 403})
+    # Читающие (идемпотентные) методы: только их можно повторять при временных ошибках
+    READ_METHODS: frozenset[str] = frozenset({'devices'})
 
-    def __init__(self, client_id: str) -> None:
+    def __init__(self, client_id: str, url: str | None = None, cache: ResponseCache | None = None,
+                 token_store: TokenStore | None = None, timeout: float | None = 10.0,
+                 retry: RetryPolicy | None = None, breaker: CircuitBreaker | None = None) -> None:
+        """
+        :param client_id: Идентификатор клиента (заголовок X-ZONT-Client)
+        :param url: Адрес API, по умолчанию URL
+        :param cache: Кэш ответов (см. ResponseCache). None - без кэша
+        :param token_store: Хранилище токена на диске (см. TokenStore). None - токен живет только в памяти
+        :param timeout: Таймаут HTTP-запроса по умолчанию, секунды
+        :param retry: Политика повторов для читающих методов (см. RetryPolicy). None - без повторов
+        :param breaker: Предохранитель (см. CircuitBreaker). None - без предохранителя
+        """
+        self.cache = cache
+        self.token_store = token_store
+        self.timeout = timeout
+        self.retry = retry
+        self.breaker = breaker
+        # Сколько раз запросы повторялись после временных ошибок
+        self.retries = 0
+        # Реестр метрик (см. attach_metrics())
+        self.metrics: t.Any = None
+        self._credentials: tuple[str, str, str | None] | None = None
+        self._auth_lock = threading.Lock()
+        if url is not None:
+            self.URL = url
         self.headers = {
             'Content-Type': 'application/json',
             'X-ZONT-Client': client_id
@@ -30,6 +51,24 @@ class API:
         self.token = None
         self.session = requests.Session()
 
+    def attach_metrics(self, registry: t.Any) -> None:
+        """
+        Подключить реестр метрик. Подойдет любой объект с методами inc(name, value, help_, **labels),
+        observe(name, value, help_, **labels) и gauge(name, fn, help_), например pyhass_mqtt.metrics.Registry.
+        Без реестра клиент метрики не собирает.
+        """
+        self.metrics = registry
+        registry.gauge('zont_retries', lambda: self.retries, 'Retried ZONT API requests')
+        if self.cache is not None:
+            for name in ('hits', 'misses', 'coalesced'):
+                registry.gauge(f'zont_cache_{name}', lambda name=name: getattr(self.cache, name),
+                               f'ZONT response cache {name}')
+        if self.breaker is not None:
+            registry.gauge('zont_breaker_open', lambda: int(self.breaker.state != CircuitBreaker.CLOSED),
+                           'ZONT circuit breaker is not closed')
+            registry.gauge('zont_breaker_transitions', lambda: self.breaker.transitions,
+                           'ZONT circuit breaker state transitions')
+
     @staticmethod
     def check_result(r: t.Any) -> None:
         if not isinstance(r, dict) or 'ok' not in r:
@@ -37,29 +76,179 @@ class API:
         if not r['ok']:
             raise ZontError(r.get('error', 'unknown'), r.get('error_ui', 'unknown'))
 
-    def authenticate(self, login: str, password: str, app_name: str | None = None) -> None:
+    def authenticate(self, login: str, password: str, app_name: str | None = None, force: bool = False) -> None:
+        """
+        Авторизоваться. Если задан token_store и в нем есть токен для этого логина, запрос к API не делается.
+        Логин и пароль запоминаются, чтобы прозрачно получить новый токен, когда сервер отвергнет старый.
+
+        :param force: Получить новый токен, даже если есть сохраненный
+        """
+        with self._auth_lock:
+            self._credentials = (login, password, app_name)
+            token = None if force or self.token_store is None else self.token_store.load(login)
+            if token is None:
+                token = self._get_authtoken()
+            self._set_token(token)
+
+    def _get_authtoken(self) -> str:
+        login, password, app_name = self._credentials
         r = self.session.post(
             url=f'{self.URL}/get_authtoken',
             headers=self.headers,
             auth=(login, password),
             json={'client_name': app_name or 'pyzont'},
+            timeout=self.timeout,
         )
         r.raise_for_status()
         data = r.json()
         self.check_result(data)
-        self.token = data['token']
-        self.headers['X-ZONT-Token'] = self.token
+        if self.token_store is not None:
+            self.token_store.save(login, data['token'])
+        return data['token']
+
+    def _set_token(self, token: str) -> None:
+        self.token = token
+        self.headers['X-ZONT-Token'] = token
+
+    def _reauthenticate(self, stale_token: str) -> None:
+        """
+        Получить новый токен взамен stale_token. Одновременные вызовы сериализуются:
+        если токен уже обновил другой поток, повторной авторизации не будет.
+        """
+        with self._auth_lock:
+            if self.token != stale_token:
+                return
+            if self._credentials is None:
+                raise NotAuthorizedError()
+            self._set_token(self._get_authtoken())
+
+    def is_auth_error(self, e: Exception) -> bool:
+        """
+        :return: True, если исключение означает, что сервер отверг токен
+        """
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            return e.response.status_code in self.AUTH_HTTP_STATUSES
+        return isinstance(e, ZontError) and e.code in self.AUTH_ERROR_CODES
 
-    def request(self, method: str, data: dict) -> t.Any:
+    def is_read(self, method: str) -> bool:
+        """
+        :return: True, если метод только читает данные и его можно безопасно повторять
+        """
+        return method in self.READ_METHODS or (self.cache is not None and self.cache.cacheable(method))
+
+    @staticmethod
+    def check_typed_result(r: models.ZontResponse) -> None:
+        if not r.ok:
+            raise ZontError(r.error or 'unknown', r.error_ui or 'unknown')
+
+    def request(self, method: str, data: dict, timeout: float | None = None,
+                model: type[models.ZontResponse] | None = None) -> t.Any:
+        """
+        Вызвать метод ZONT API.
+
+        :param method: Имя метода
+        :param data: Тело запроса
+        :param timeout: Таймаут HTTP-запроса, секунды. По умолчанию self.timeout
+        :param model: Модель ответа (наследник zont.models.ZontResponse). Если задана, декодированный ответ
+                      проверяется и превращается в модель через model_validate(). Поддеревья, которых нет
+                      в модели, в модели не превращаются (см. DeviceListResponse и DevicesResponse)
+        :return: Декодированный ответ: dict или экземпляр model
+        """
         if not self.token:
             raise NotAuthorizedError()
-        r = self.session.post(
-            url=f'{self.URL}/{method}',
-            json=data,
-            headers=self.headers,
-        )
+        try:
+            if self.cache is not None:
+                return self.cache.fetch(method, data, lambda: self._request_resilient(method, data, timeout, model),
+                                        variant='' if model is None else model.__qualname__)
+            return self._request_resilient(method, data, timeout, model)
+        except ZontError as e:
+            if self.metrics is not None:
+                self.metrics.inc('zont_errors_total', 1, 'ZONT API errors by code', method=method, code=e.code)
+            raise
+        except requests.RequestException as e:
+            if self.metrics is not None:
+                status = e.response.status_code if e.response is not None else type(e).__name__
+                self.metrics.inc('zont_http_errors_total', 1, 'ZONT API transport errors', method=method,
+                                 status=status)
+            raise
+
+    def devices(self, full: bool = True) -> list[models.Device] | list[models.BasicDevice]:
+        """
+        :param full: Разбирать датчики и контуры устройств. Иначе - только id/serial/name
+        :return: Список устройств аккаунта
+        """
+        response = self.request('devices', {}, model=models.DevicesResponse if full else models.DeviceListResponse)
+        return response.devices
+
+    def _request_resilient(self, method: str, data: dict, timeout: float | None,
+                           model: type[models.ZontResponse] | None = None) -> t.Any:
+        attempts = self.retry.attempts if self.retry is not None and self.is_read(method) else 1
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            if self.breaker is not None:
+                self.breaker.allow()
+            try:
+                result = self._request_authorized(method, data, timeout, model)
+            except Exception as e:
+                transient = RetryPolicy.transient(e)
+                if self.breaker is not None:
+                    if transient:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                attempt += 1
+                if not transient or attempt >= attempts:
+                    raise
+                delay = self.retry.delay(attempt - 1)
+                if self.retry.max_elapsed is not None and time.monotonic() - started + delay > self.retry.max_elapsed:
+                    raise
+                self.retries += 1
+                time.sleep(delay)
+                continue
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return result
+
+    def _request_authorized(self, method: str, data: dict, timeout: float | None,
+                            model: type[models.ZontResponse] | None = None) -> t.Any:
+        token = self.token
+        try:
+            return self._request(method, data, timeout, model)
+        except (requests.HTTPError, ZontError) as e:
+            if not self.is_auth_error(e) or self._credentials is None:
+                raise
+        self._reauthenticate(token)
+        return self._request(method, data, timeout, model)
+
+    def _request(self, method: str, data: dict, timeout: float | None,
+                 model: type[models.ZontResponse] | None = None) -> t.Any:
+        started = time.perf_counter()
+        try:
+            r = self.session.post(
+                url=f'{self.URL}/{method}',
+                json=data,
+                headers=self.headers,
+                timeout=self.timeout if timeout is None else timeout,
+            )
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe('zont_request_seconds', time.perf_counter() - started,
+                                     'ZONT API HTTP request duration', method=method)
         r.raise_for_status()
         data = r.json()
+        if model is not None:
+            # json.loads() + model_validate(), а не TypeAdapter.validate_json(): на ответе devices
+            # разбор за один проход из байтов оказался медленнее (см. bench zont, parse.*)
+            try:
+                result = model.model_validate(data)
+            except pydantic.ValidationError as e:
+                raise UnexpectedResponse() from e
+            self.check_typed_result(result)
+            return result
         self.check_result(data)
         return data
 
+
+from .aio import AsyncAPI
+from .batch import WriteBatcher, merge_fields, no_merge
@@ -0,0 +1,79 @@
+import asyncio
+import concurrent.futures
+import typing as t
+import requests.adapters
+from . import API, models
+
+
+__all__ = [
+    'AsyncAPI',
+]
+
+
+class AsyncAPI:
+    """
+    Асинхронный клиент ZONT API. Семантика authenticate()/request()/check_result() и типы исключений
+    те же, что у API: внутри работает обычный API на requests.Session, вызовы которого выполняются
+    в ограниченном пуле потоков. Пул HTTP-соединений сессии имеет тот же размер, что и пул потоков,
+    так что одновременно открыто не больше concurrency соединений, и они переиспользуются.
+    """
+    def __init__(self, client_id: str, concurrency: int = 8, api: API | None = None) -> None:
+        """
+        :param client_id: Идентификатор клиента (заголовок X-ZONT-Client)
+        :param concurrency: Максимальное число одновременных запросов к API
+        :param api: Готовый синхронный клиент. По умолчанию создается новый
+        """
+        self.api = api or API(client_id)
+        self.concurrency = concurrency
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency, pool_block=True)
+        self.api.session.mount('https://', adapter)
+        self.api.session.mount('http://', adapter)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=concurrency,
+                                                               thread_name_prefix='zont-api')
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    check_result = staticmethod(API.check_result)
+
+    @property
+    def token(self) -> str | None:
+        return self.api.token
+
+    async def _call(self, fn: t.Callable, *args: t.Any) -> t.Any:
+        async with self._semaphore:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def authenticate(self, login: str, password: str, app_name: str | None = None,
+                           force: bool = False) -> None:
+        await self._call(self.api.authenticate, login, password, app_name, force)
+
+    async def request(self, method: str, data: dict, timeout: float | None = None,
+                      model: type[models.ZontResponse] | None = None) -> t.Any:
+        return await self._call(self.api.request, method, data, timeout, model)
+
+    async def devices(self, full: bool = True) -> list[models.Device] | list[models.BasicDevice]:
+        return await self._call(self.api.devices, full)
+
+    async def request_many(self, calls: t.Iterable[tuple[str, dict]],
+                           return_exceptions: bool = False) -> list[t.Any]:
+        """
+        Выполнить много запросов конкурентно (не больше concurrency одновременно).
+
+        :param calls: Пары (method, data)
+        :param return_exceptions: Как в asyncio.gather(): вернуть исключения в списке результатов вместо выброса
+        :return: Результаты в том же порядке, что и calls
+        """
+        return await asyncio.gather(*(self.request(method, data) for method, data in calls),
+                                    return_exceptions=return_exceptions)
+
+    async def close(self) -> None:
+        """
+        Закрыть пул потоков и HTTP-сессию.
+        """
+        self._executor.shutdown(wait=False)
+        self.api.session.close()
+
+    async def __aenter__(self) -> 'AsyncAPI':
+        return self
+
+    async def __aexit__(self, *exc: t.Any) -> None:
+        await self.close()
@@ -0,0 +1,56 @@
+import json
+import os
+import threading
+
+
+__all__ = [
+    'TokenStore',
+]
+
+
+class TokenStore:
+    """
+    Хранилище токена авторизации ZONT на диске, чтобы при перезапуске не получать токен заново.
+    Файл создается с правами 0600 и перезаписывается атомарно. Токен привязан к логину,
+    для другого логина load() вернет None.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        :param path: Путь к файлу с токеном
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self, login: str) -> str | None:
+        """
+        :return: Сохраненный токен для логина login или None
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(data, dict) or data.get('login') != login:
+            return None
+        return data.get('token') or None
+
+    def save(self, login: str, token: str) -> None:
+        """
+        Сохранить токен для логина login.
+        """
+        tmp = f'{self.path}.tmp'
+        with self._lock:
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'login': login, 'token': token}, f)
+            os.replace(tmp, self.path)
+
+    def clear(self) -> None:
+        """
+        Удалить сохраненный токен.
+        """
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,187 @@
+import concurrent.futures
+import threading
+import time
+import typing as t
+
+if t.TYPE_CHECKING:
+    from . import API
+
+
+__all__ = [
+    'WriteBatcher',
+    'merge_fields',
+    'no_merge',
+]
+
+
+# Склейка двух запросов одного метода к одному устройству: тело объединенного запроса или None,
+# если их нельзя отправить одним вызовом
+Merge = t.Callable[[dict, dict], dict | None]
+
+
+def merge_fields(first: dict, second: dict) -> dict | None:
+    """
+    Склеить запросы, объединив поля тела (при совпадении побеждает более поздний запрос).
+    Подходит только для методов, которые записывают набор независимых полей устройства, где последняя
+    запись поля отменяет предыдущую. Если в теле есть адресующие поля (например, номер контура),
+    склейка потеряет запись - такие методы склеивать нельзя.
+    """
+    return {**first, **second}
+
+
+def no_merge(first: dict, second: dict) -> dict | None:
+    """
+    Не склеивать: каждый запрос - отдельный вызов API (по порядку). Склейка по умолчанию.
+    """
+    return None
+
+
+class _Call:
+    def __init__(self, method: str, data: dict, future: concurrent.futures.Future) -> None:
+        self.method = method
+        self.data = data
+        self.futures = [future]
+
+
+class _Batch:
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self.calls: list[_Call] = []
+
+
+class WriteBatcher:
+    """
+    Пакетная запись в ZONT API. Команды (пишущие запросы) к одному устройству, пришедшие в течение окна
+    window, копятся в пакет устройства. Соседние запросы одного метода объединяются в один вызов API,
+    только если для метода явно задана функция склейки (merge={'метод': merge_fields}), остальные
+    уходят отдельными вызовами по порядку. Устройство определяется по device_id в теле запроса.
+
+    submit() сразу возвращает Future, который получит ответ того вызова API, в который попала команда
+    (или его исключение). Сущность может сразу опубликовать ожидаемое (optimistic) состояние, а по
+    Future подтвердить его или откатить.
+
+    Вызовы к одному устройству идут строго по очереди: пока пакет выполняется, новые команды копятся
+    в следующем пакете, так что при медленном API склеивается еще больше. Разные устройства
+    обрабатываются параллельно в пуле из workers потоков.
+    """
+    def __init__(self, api: 'API', window: float = 0.2, merge: dict[str, Merge] | None = None,
+                 default_merge: Merge = no_merge, workers: int = 4,
+                 clock: t.Callable[[], float] = time.monotonic) -> None:
+        """
+        :param api: Клиент ZONT API
+        :param window: Сколько секунд после первой команды пакета ждать остальных
+        :param merge: Функции склейки по именам методов (только для методов, где поля - last-write-wins)
+        :param default_merge: Функция склейки для остальных методов. По умолчанию не склеивать
+        :param workers: Сколько пакетов (к разным устройствам) может выполняться одновременно
+        :param clock: Монотонные часы, секунды
+        """
+        self.api = api
+        self.window = window
+        self.merge = dict(merge or {})
+        self.default_merge = default_merge
+        self.clock = clock
+        self.submitted = 0
+        self.calls = 0
+        # Пакеты по устройствам: ожидающие окна и выполняемые сейчас
+        self._pending: dict[t.Any, _Batch] = {}
+        self._running: set[t.Any] = set()
+        self._cond = threading.Condition()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                               thread_name_prefix='zont-batch')
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='zont-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, method: str, data: dict) -> concurrent.futures.Future:
+        """
+        Поставить пишущий запрос в пакет устройства data['device_id'].
+
+        :return: Future с ответом API
+        """
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        key = data.get('device_id')
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('WriteBatcher is closed')
+            self.submitted += 1
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(self.clock() + self.window)
+                self._cond.notify()
+            last = batch.calls[-1] if batch.calls else None
+            merged = None
+            if last is not None and last.method == method:
+                merged = self.merge.get(method, self.default_merge)(last.data, data)
+            if merged is not None:
+                last.data = merged
+                last.futures.append(future)
+            else:
+                batch.calls.append(_Call(method, data, future))
+        return future
+
+    def flush(self) -> None:
+        """
+        Отправить все накопленные пакеты, не дожидаясь окна.
+        """
+        with self._cond:
+            for batch in self._pending.values():
+                batch.deadline = 0.0
+            self._cond.notify()
+
+    def close(self, timeout: float | None = None) -> None:
+        """
+        Отправить накопленные пакеты, дождаться их выполнения и остановить батчер.
+        """
+        with self._cond:
+            self._closed = True
+            for batch in self._pending.values():
+                batch.deadline = 0.0
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                now = self.clock()
+                ready = [key for key, batch in self._pending.items()
+                         if batch.deadline <= now and key not in self._running]
+                for key in ready:
+                    self._running.add(key)
+                    self._executor.submit(self._execute, key, self._pending.pop(key))
+                if self._closed and not self._pending and not self._running:
+                    return
+                waiting = [batch.deadline for key, batch in self._pending.items() if key not in self._running]
+                self._cond.wait(max(0.0, min(waiting) - now) if waiting else None)
+
+    def _execute(self, key: t.Any, batch: _Batch) -> None:
+        try:
+            for call in batch.calls:
+                with self._cond:
+                    self.calls += 1
+                metrics = self.api.metrics
+                if metrics is not None:
+                    metrics.inc('zont_batched_commands_total', len(call.futures), 'Commands sent through WriteBatcher')
+                    metrics.inc('zont_batch_calls_total', 1, 'ZONT API calls made by WriteBatcher')
+                try:
+                    result = self.api.request(call.method, call.data)
+                except Exception as e:
+                    for future in call.futures:
+                        future.set_exception(e)
+                else:
+                    for future in call.futures:
+                        future.set_result(result)
+        finally:
+            with self._cond:
+                self._running.discard(key)
+                self._cond.notify()
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Сколько команд принято и сколько вызовов API сделано
+        """
+        return {
+            'submitted': self.submitted,
+            'calls': self.calls,
+            'pending': sum(len(batch.calls) for batch in list(self._pending.values())),
+        }
@@ -0,0 +1,169 @@
+import collections
+import json
+import threading
+import time
+import typing as t
+
+
+__all__ = [
+    'ResponseCache',
+]
+
+
+class _Flight:
+    """
+    Запрос, который сейчас выполняется. Остальные желающие того же ждут его результата.
+    """
+    def __init__(self, generation: int, device_id: t.Any) -> None:
+        # Поколение кэша на момент старта запроса (см. ResponseCache.invalidate())
+        self.generation = generation
+        self.device_id = device_id
+        self.event = threading.Event()
+        self.result: t.Any = None
+        self.error: BaseException | None = None
+
+
+class ResponseCache:
+    """
+    Кэш ответов ZONT API с TTL по методам, LRU-вытеснением и склейкой одинаковых одновременных запросов
+    (single-flight): пока запрос выполняется, остальные потоки с тем же (method, data) ждут его результат.
+
+    Кэшируются только методы, для которых задан TTL. Все остальные методы считаются пишущими:
+    идут мимо кэша и сбрасывают связанные записи - с тем же device_id в запросе и без device_id
+    вовсе (например, список устройств). Пишущий запрос без device_id сбрасывает весь кэш.
+
+    Читающий запрос, начатый до пишущего, мог получить ответ еще до записи. Поэтому его результат
+    не сохраняется, если за время запроса что-то было сброшено, а новые запросы к нему не присоединяются.
+
+    Результаты из кэша разделяются между вызывающими, изменять их нельзя.
+    """
+    DEFAULT_TTL: dict[str, float] = {
+        'devices': 10.0,
+    }
+
+    def __init__(self, ttl: dict[str, float] | None = None, maxsize: int = 256,
+                 clock: t.Callable[[], float] = time.monotonic) -> None:
+        """
+        :param ttl: Время жизни ответа в секундах по имени метода. По умолчанию DEFAULT_TTL
+        :param maxsize: Максимальное число записей в кэше
+        :param clock: Монотонные часы, секунды
+        """
+        self.ttl = dict(self.DEFAULT_TTL if ttl is None else ttl)
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: collections.OrderedDict[tuple[str, str, str], tuple[float, t.Any, t.Any]] = \
+            collections.OrderedDict()
+        self._flights: dict[tuple[str, str, str], _Flight] = {}
+        # Растет при каждом invalidate(): запросы, начатые в прошлом поколении, не сохраняют результат
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(method: str, data: dict, variant: str = '') -> tuple[str, str, str]:
+        """
+        :return: Ключ кэша: метод, канонизированный JSON запроса и вариант разбора ответа
+        """
+        return method, json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str), variant
+
+    def cacheable(self, method: str) -> bool:
+        return method in self.ttl
+
+    def fetch(self, method: str, data: dict, load: t.Callable[[], t.Any], variant: str = '') -> t.Any:
+        """
+        Вернуть ответ из кэша или получить его через load(). Одновременные одинаковые запросы
+        склеиваются в один вызов load().
+
+        :param method: Метод ZONT API
+        :param data: Тело запроса
+        :param load: Функция, выполняющая запрос
+        :param variant: Вариант разбора ответа (например, имя модели): разные варианты кэшируются отдельно
+        """
+        if not self.cacheable(method):
+            try:
+                return load()
+            finally:
+                self.invalidate(method, data)
+
+        key = self.key(method, data, variant)
+        leader = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight(self._generation,
+                                                      data.get('device_id') if isinstance(data, dict) else None)
+                leader = True
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = load()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                if flight.error is None and flight.generation == self._generation:
+                    self._store(key, flight.result, flight.device_id)
+            flight.event.set()
+        return flight.result
+
+    def stale(self, method: str, data: dict, variant: str = '') -> t.Any:
+        """
+        Вернуть последний сохраненный ответ, даже если его TTL истек. Пригодится, чтобы отдать
+        устаревшее состояние, пока API недоступен (см. CircuitOpenError).
+
+        :return: Ответ или None, если его нет в кэше
+        """
+        with self._lock:
+            entry = self._entries.get(self.key(method, data, variant))
+        return None if entry is None else entry[1]
+
+    def _store(self, key: tuple[str, str, str], result: t.Any, device_id: t.Any) -> None:
+        self._entries[key] = (self.clock() + self.ttl[key[0]], result, device_id)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, method: str | None = None, data: dict | None = None) -> None:
+        """
+        Сбросить записи, связанные с пишущим запросом (см. описание класса). Без аргументов - сбросить все.
+        """
+        device_id = data.get('device_id') if isinstance(data, dict) else None
+        with self._lock:
+            self._generation += 1
+            if device_id is None:
+                self._entries.clear()
+                self._flights.clear()
+                return
+            for key in [k for k, v in self._entries.items() if v[2] is None or v[2] == device_id]:
+                del self._entries[key]
+            # Идущие запросы могли прочитать данные до записи: следующие желающие пойдут за свежими
+            for key in [k for k, f in self._flights.items() if f.device_id is None or f.device_id == device_id]:
+                del self._flights[key]
+
+    def stats(self) -> dict[str, int]:
+        """
+        :return: Счетчики попаданий, промахов и склеенных запросов, размер кэша
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'size': len(self._entries),
+        }
@@ -0,0 +1,28 @@
+__all__ = [
+    'ZontError',
+    'NotAuthorizedError',
+    'UnexpectedResponse',
+    'CircuitOpenError',
+]
+
+
+class ZontError(Exception):
+    def __init__(self, code: str, descr: str | list[str]) -> None:
+        self.code = code
+        self.description = descr if isinstance(descr, str) else '\n'.join(descr)
+        super().__init__(self.code, self.description)
+
+
+class NotAuthorizedError(ZontError):
+    def __init__(self):
+        super().__init__('not_authorized', 'Client has not been authorized')
+
+
+class UnexpectedResponse(ZontError):
+    def __init__(self):
+        super().__init__('invalid_response', 'Unexpected or malformed response')
+
+
+class CircuitOpenError(ZontError):
+    def __init__(self):
+        super().__init__('circuit_open', 'ZONT API is unavailable, requests are suspended')
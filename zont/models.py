@@ -1,10 +1,82 @@
+import pydantic
 from pydantic import BaseModel
 
 
-class BasicDevice(BaseModel):
+class Model(BaseModel):
+    """
+    Базовая модель ответов ZONT API. Незнакомые поля игнорируются: поддеревья, которых нет в модели,
+    не превращаются в модели (хотя json.loads() их, конечно, разбирает).
+    """
+    model_config = pydantic.ConfigDict(extra='ignore')
+
+
+class BasicDevice(Model):
     id: int
     serial: str
     name: str
 
 
+class DeviceType(Model):
+    code: str | None = None
+    name: str | None = None
+
+
+class Thermometer(Model):
+    """
+    Датчик температуры устройства
+    """
+    uuid: str
+    name: str | None = None
+    is_assigned_to_slot: bool | None = None
+    last_state: str | None = None
+    last_value: float | None = None
+    last_value_time: int | None = None
+
+
+class HeatingCircuit(Model):
+    """
+    Контур отопления
+    """
+    id: int | str
+    name: str | None = None
+    active: bool | None = None
+    status: str | None = None
+    target_temp: float | None = None
+    current_temp: float | None = None
+    mode: int | str | None = None
+
+
+class Device(BasicDevice):
+    """
+    Устройство со всеми датчиками и контурами
+    """
+    device_type: DeviceType | None = None
+    online: bool | None = None
+    is_active: bool | None = None
+    thermometers: list[Thermometer] = []
+    heating_circuits: list[HeatingCircuit] = []
+
+
+class ZontResponse(Model):
+    """
+    Конверт любого ответа ZONT API
+    """
+    ok: bool
+    error: str | None = None
+    error_ui: str | list[str] | None = None
+
+
+class DeviceListResponse(ZontResponse):
+    """
+    Ответ метода devices, только список устройств без датчиков и контуров.
+    Вложенные деревья устройств при таком разборе пропускаются.
+    """
+    devices: list[BasicDevice] = []
+
+
+class DevicesResponse(ZontResponse):
+    """
+    Ответ метода devices целиком
+    """
+    devices: list[Device] = []
 
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+import typing as t
+import requests
+from .errors import CircuitOpenError
+
+
+__all__ = [
+    'RetryPolicy',
+    'CircuitBreaker',
+]
+
+
+class RetryPolicy:
+    """
+    Повторы запроса с экспоненциальной задержкой и полным джиттером: перед попыткой n ждем
+    случайное время от 0 до min(cap, base * 2 ** n). Повторяются только временные ошибки
+    (см. transient()) и только для читающих методов.
+    """
+    def __init__(self, attempts: int = 3, base: float = 0.2, cap: float = 5.0, max_elapsed: float | None = 30.0,
+                 rng: random.Random | None = None) -> None:
+        """
+        :param attempts: Максимальное число попыток, включая первую
+        :param base: Базовая задержка, секунды
+        :param cap: Максимальная задержка между попытками, секунды
+        :param max_elapsed: Не начинать новую попытку, если с начала первой прошло больше, секунды
+        :param rng: Генератор случайных чисел для джиттера
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.max_elapsed = max_elapsed
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: Номер повтора, начиная с 0
+        :return: Задержка перед повтором, секунды
+        """
+        return self.rng.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    @staticmethod
+    def transient(e: Exception) -> bool:
+        """
+        :return: True, если ошибка временная и запрос имеет смысл повторить
+        """
+        if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(e, requests.HTTPError) and e.response is not None:
+            return e.response.status_code >= 500 or e.response.status_code == 429
+        return False
+
+
+class CircuitBreaker:
+    """
+    Предохранитель: после failure_threshold временных ошибок подряд размыкается и reset_timeout секунд
+    сразу отвечает CircuitOpenError, не трогая сеть. Потом пропускает не больше half_open_max пробных
+    запросов: успех замыкает его, ошибка снова размыкает.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max: int = 1,
+                 clock: t.Callable[[], float] = time.monotonic) -> None:
+        """
+        :param failure_threshold: Сколько ошибок подряд размыкают предохранитель
+        :param reset_timeout: Сколько секунд предохранитель разомкнут до пробного запроса
+        :param half_open_max: Сколько пробных запросов пропускать одновременно
+        :param clock: Монотонные часы, секунды
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.transitions = 0
+        # Подписчики на смену состояния: fn(old_state, new_state)
+        self.listeners: list[t.Callable[[str, str], None]] = []
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state: str) -> None:
+        old, self.state = self.state, state
+        if old != state:
+            self.transitions += 1
+            for listener in self.listeners:
+                listener(old, state)
+
+    def allow(self) -> None:
+        """
+        Разрешить запрос или выбросить CircuitOpenError.
+        """
+        with self._lock:
+            if self.state == self.OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenError()
+                self._probes = 0
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_max:
+                    raise CircuitOpenError()
+                self._probes += 1
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            if self.state == self.HALF_OPEN:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self._opened_at = self.clock()
+                self._set_state(self.OPEN)